@@ -0,0 +1,226 @@
+"""
+Benchmark suite for basis optimization, vector generation, serialization, parsing
+and CLI startup.
+
+Usage:
+    python benchmarks/run_benchmarks.py [--quick] [--filter TEXT]
+                                        [--baseline FILE] [--save-baseline]
+                                        [--no-compare] [--threshold FACTOR]
+                                        [--output FILE]
+
+Every benchmark reports the best time of several repeats. Results are compared
+against a JSON baseline (default benchmarks/baseline.json, created with
+--save-baseline on the machine in question, it is not committed). The run fails
+if a benchmark is slower than threshold times its baseline or if the baseline is
+missing, use --no-compare to only measure. Runs offline, qspace benchmarks are
+skipped if qspace is not installed.
+"""
+
+import argparse
+import importlib.util
+import json
+import platform
+import subprocess
+import sys
+import tempfile
+import time
+from functools import partial
+from pathlib import Path
+
+import numpy as np
+
+ROOT = Path(__file__).resolve().parents[1]
+sys.path.insert(0, str(ROOT))
+
+from freediffusiontoolkit import BasicSiemensTool, FreeDiffusionTool  # noqa: E402
+from freediffusiontoolkit.siemens_tools import read_vector_file  # noqa: E402
+
+N_DIMS = (3, 6, 16, 30, 64, 128, 256)
+N_B_VALUES = (1, 10, 100, 1000, 2000)
+QUICK_N_DIMS = (3, 30, 256)
+QUICK_N_B_VALUES = (1, 100)
+DEFAULT_BASELINE = Path(__file__).parent / "baseline.json"
+
+
+def measure(func, repeat: int = 5, min_time: float = 0.05) -> float:
+    """Best time per call in seconds. Fast functions are looped to reach min_time."""
+    number = 1
+    while True:
+        start = time.perf_counter()
+        for _ in range(number):
+            func()
+        elapsed = time.perf_counter() - start
+        if elapsed >= min_time or number >= 2**20:
+            break
+        number *= 2
+    timings = [elapsed / number]
+    for _ in range(repeat - 1):
+        start = time.perf_counter()
+        for _ in range(number):
+            func()
+        timings.append((time.perf_counter() - start) / number)
+    return min(timings)
+
+
+def make_tool(n_dims: int, n_b_values: int) -> BasicSiemensTool:
+    tool = BasicSiemensTool(np.linspace(0, 1000, n_b_values + 1)[1:], n_dims)
+    tool.basis_vectors = tool.get_basis_vectors()
+    return tool
+
+
+def library_basis(n_dims: int):
+    return FreeDiffusionTool([1000], n_dims, basis_cache=None).get_basis_vectors
+
+
+def qspace_basis(n_dims: int):
+    tool = FreeDiffusionTool(
+        [1000], n_dims, basis_cache=None, use_library=False, max_iter=100
+    )
+    return tool.get_basis_vectors
+
+
+def diffusion_vectors(n_dims: int, n_b_values: int):
+    return make_tool(n_dims, n_b_values).get_diffusion_vectors
+
+
+def write_file(n_dims: int, n_b_values: int, filename: Path):
+    tool = make_tool(n_dims, n_b_values)
+    header = tool.construct_header(filename)
+    vectors = tool.get_diffusion_vectors()
+    return lambda: tool.write(filename, header, vectors)
+
+
+def load_file(n_dims: int, n_b_values: int, filename: Path):
+    write_file(n_dims, n_b_values, filename)()
+    return lambda: read_vector_file(filename)
+
+
+def cli(args: list):
+    subprocess.run(
+        [
+            sys.executable,
+            "-c",
+            f"from freediffusiontoolkit.cli import run; run({args!r})",
+        ],
+        cwd=ROOT,
+        check=True,
+        stdout=subprocess.DEVNULL,
+    )
+
+
+def benchmarks(n_dims_grid: tuple, n_b_grid: tuple, workdir: Path):
+    """
+    Yield (name, setup) pairs of all benchmarks.
+
+    setup() prepares tools and files and returns the function to time, so
+    benchmarks excluded by --filter cost nothing.
+    """
+    for n_dims in n_dims_grid:
+        yield f"basis/library/{n_dims}", partial(library_basis, n_dims)
+
+    if importlib.util.find_spec("qspace") is not None:
+        for n_dims in n_dims_grid:
+            if n_dims <= 64:
+                yield f"basis/qspace/{n_dims}", partial(qspace_basis, n_dims)
+
+    for n_dims in n_dims_grid:
+        for n_b_values in n_b_grid:
+            yield f"vectors/{n_dims}x{n_b_values}", partial(
+                diffusion_vectors, n_dims, n_b_values
+            )
+
+    for n_dims in n_dims_grid:
+        for n_b_values in n_b_grid:
+            filename = workdir / f"bench_{n_dims}x{n_b_values}.dvs"
+            yield f"write/{n_dims}x{n_b_values}", partial(
+                write_file, n_dims, n_b_values, filename
+            )
+            yield f"load/{n_dims}x{n_b_values}", partial(
+                load_file, n_dims, n_b_values, filename
+            )
+
+    yield "cli/help", lambda: partial(cli, ["-h"])
+    # startup of a file creation with a hardcoded or library basis
+    for n_dims in n_dims_grid:
+        filename = workdir / f"cli_{n_dims}.dvs"
+        args = ["create_vector_file", "0,1000", str(n_dims), "Siemens", str(filename)]
+        yield f"cli/create/{n_dims}", lambda args=args: partial(
+            cli, args + ["--no-daemon"]
+        )
+
+
+def compare(results: dict, baseline: dict, threshold: float) -> list:
+    """Names and factors of all benchmarks slower than threshold times their baseline."""
+    regressions = list()
+    for name, seconds in results.items():
+        reference = baseline.get(name)
+        if reference and seconds > threshold * reference:
+            regressions.append((name, seconds / reference))
+    return regressions
+
+
+def main(argv: list | None = None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--quick", action="store_true", help="Use a reduced grid.")
+    parser.add_argument("--filter", default="", help="Only run matching benchmarks.")
+    parser.add_argument("--baseline", type=Path, default=DEFAULT_BASELINE)
+    parser.add_argument("--save-baseline", action="store_true")
+    parser.add_argument(
+        "--no-compare", action="store_true", help="Only measure, skip the baseline."
+    )
+    parser.add_argument("--threshold", type=float, default=1.5)
+    parser.add_argument("--output", type=Path, help="Write results as JSON.")
+    args = parser.parse_args(argv)
+
+    n_dims_grid = QUICK_N_DIMS if args.quick else N_DIMS
+    n_b_grid = QUICK_N_B_VALUES if args.quick else N_B_VALUES
+
+    results = dict()
+    with tempfile.TemporaryDirectory() as workdir:
+        for name, setup in benchmarks(n_dims_grid, n_b_grid, Path(workdir)):
+            if args.filter not in name:
+                continue
+            results[name] = measure(setup(), repeat=3 if args.quick else 5)
+            print(f"{name:<32} {results[name] * 1e3:12.4f} ms")
+
+    report = {
+        "meta": {
+            "python": platform.python_version(),
+            "numpy": np.__version__,
+            "machine": platform.machine(),
+            "date": time.strftime("%Y-%m-%d %H:%M:%S"),
+        },
+        "results": results,
+    }
+    if args.output:
+        args.output.write_text(json.dumps(report, indent=2))
+
+    if args.save_baseline:
+        baseline = dict()
+        if args.baseline.is_file():
+            baseline = json.loads(args.baseline.read_text())["results"]
+        report["results"] = {**baseline, **results}
+        args.baseline.write_text(json.dumps(report, indent=2))
+        print(f"Baseline saved to {args.baseline}")
+        return 0
+
+    if args.no_compare:
+        return 0
+    if not args.baseline.is_file():
+        print(
+            f"ERROR: No baseline at {args.baseline}. Run with --save-baseline first "
+            "or pass --no-compare.",
+            file=sys.stderr,
+        )
+        return 2
+
+    regressions = compare(
+        results, json.loads(args.baseline.read_text())["results"], args.threshold
+    )
+    for name, factor in regressions:
+        print(f"REGRESSION {name}: {factor:.2f}x slower than baseline")
+    return 1 if regressions else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
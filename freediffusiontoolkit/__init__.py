@@ -1,2 +1,23 @@
-from .free_diffusion_tools import FreeDiffusionTool
-from .siemens_tools import BasicSiemensTool, LegacySiemensTool
+# Submodules are imported on first attribute access to keep the CLI startup fast.
+_LAZY_ATTRIBUTES = {
+    "FreeDiffusionTool": ".free_diffusion_tools",
+    "BasicSiemensTool": ".siemens_tools",
+    "LegacySiemensTool": ".siemens_tools",
+    "Protocol": ".protocol",
+}
+
+__all__ = list(_LAZY_ATTRIBUTES)
+
+
+def __getattr__(name: str):
+    if name in _LAZY_ATTRIBUTES:
+        from importlib import import_module
+
+        value = getattr(import_module(_LAZY_ATTRIBUTES[name], __name__), name)
+        globals()[name] = value
+        return value
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
+
+def __dir__():
+    return sorted(list(globals()) + __all__)
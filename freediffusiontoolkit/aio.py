@@ -0,0 +1,141 @@
+import asyncio
+import multiprocessing
+import os
+import weakref
+from pathlib import Path
+
+import numpy as np
+
+# Upper bound of concurrent optimization processes per event loop.
+MAX_WORKERS = os.cpu_count() or 1
+
+_semaphores = weakref.WeakKeyDictionary()
+# running basis computations shared by all requests with the same key:
+# (loop, tool class, basis_key) -> [task, number of waiting requests]
+_inflight = dict()
+
+
+def _worker(sender, func, args):
+    try:
+        result = (True, func(*args))
+    except BaseException as error:
+        result = (False, error)
+    sender.send(result)
+    sender.close()
+
+
+def _close(receiver, future) -> None:
+    """Close the pipe once the waiting thread is done, also after cancellation."""
+    receiver.close()
+    if not future.cancelled():
+        # the EOFError of a terminated worker is expected
+        future.exception()
+
+
+def _semaphore() -> asyncio.Semaphore:
+    loop = asyncio.get_running_loop()
+    if loop not in _semaphores:
+        _semaphores[loop] = asyncio.Semaphore(MAX_WORKERS)
+    return _semaphores[loop]
+
+
+async def run_in_process(func, *args):
+    """
+    Run func(*args) in a separate process without blocking the event loop.
+
+    Unlike a ProcessPoolExecutor job, the computation is really stopped on
+    cancellation or timeout: the worker process is terminated. func and its
+    arguments must be picklable. At most MAX_WORKERS processes run at once.
+    """
+    loop = asyncio.get_running_loop()
+    context = multiprocessing.get_context("spawn")
+    async with _semaphore():
+        receiver, sender = context.Pipe(duplex=False)
+        process = context.Process(
+            target=_worker, args=(sender, func, args), daemon=True
+        )
+        process.start()
+        sender.close()
+        receive = loop.run_in_executor(None, receiver.recv)
+        receive.add_done_callback(lambda future: _close(receiver, future))
+        try:
+            ok, result = await asyncio.shield(receive)
+        except asyncio.CancelledError:
+            process.terminate()
+            raise
+        except EOFError:
+            raise RuntimeError(
+                f"Worker process exited with code {process.exitcode}."
+            ) from None
+        finally:
+            await loop.run_in_executor(None, process.join)
+    if not ok:
+        raise result
+    return result
+
+
+def _compute_basis(tool_class, b_values, n_dims, options) -> np.ndarray:
+    return tool_class(b_values, n_dims, **options).get_basis_vectors()
+
+
+async def abasis_vectors(tool, timeout: float | None = None) -> np.ndarray:
+    """
+    Basis vectors of a tool without blocking the event loop.
+
+    Optimizations (basis keys starting with "qspace") run in a worker process.
+    Concurrent requests for the same basis share one computation. A request that
+    times out or is cancelled only stops the computation if no other request is
+    waiting for it. The result is stored in tool.basis_vectors.
+    """
+    if tool._basis_vectors is not None:
+        return tool._basis_vectors
+    basis_key = tool.basis_key()
+    if basis_key[0] != "qspace":
+        # library and hardcoded bases are looked up immediately
+        tool.basis_vectors = tool.get_basis_vectors()
+        return tool.basis_vectors
+
+    loop = asyncio.get_running_loop()
+    key = (loop, type(tool), basis_key)
+    entry = _inflight.get(key)
+    if entry is None:
+        # the cache object itself is not sent, workers use the default cache
+        options = {
+            name: value for name, value in tool.options.items() if name != "basis_cache"
+        }
+        # points_per_shell may have been changed through the property after creation
+        options["points_per_shell"] = tool.points_per_shell
+        task = loop.create_task(
+            run_in_process(
+                _compute_basis, type(tool), tool.b_values, tool.n_dims, options
+            )
+        )
+        entry = _inflight[key] = [task, 0]
+        task.add_done_callback(lambda _: _inflight.pop(key, None))
+
+    entry[1] += 1
+    try:
+        basis = await asyncio.wait_for(asyncio.shield(entry[0]), timeout)
+    except (asyncio.CancelledError, TimeoutError):
+        if entry[1] == 1:
+            # nobody else is waiting, stop the optimization
+            entry[0].cancel()
+        raise
+    finally:
+        entry[1] -= 1
+    tool.basis_vectors = basis
+    return basis
+
+
+async def aget_diffusion_vectors(tool, timeout: float | None = None, **kwargs):
+    """Async version of get_diffusion_vectors, see abasis_vectors."""
+    await abasis_vectors(tool, timeout)
+    return tool.get_diffusion_vectors(**kwargs)
+
+
+async def asave(tool, filename, timeout: float | None = None) -> None:
+    """Async version of save. The file is formatted and written in a thread."""
+    filename = Path(filename)
+    vectors = await aget_diffusion_vectors(tool, timeout)
+    header = tool.construct_header(filename=filename)
+    await asyncio.to_thread(tool.write, filename, header, vectors)
@@ -0,0 +1,229 @@
+import csv
+import json
+import os
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import dataclass
+from pathlib import Path
+
+import numpy as np
+
+from . import profiling
+from .masks import NOISE_LABEL, SIGNAL_LABEL, load_mask
+from .trace import nifti_stem, read_bval
+
+
+@dataclass
+class FileStatistics:
+    """
+    SNR and fit statistics of one trace combined image.
+
+    log_sums and counts hold the sum of the log signal and the number of valid
+    signal voxels per b_value. They are sufficient for the pooled log-linear fit.
+    """
+
+    name: str
+    b_values: np.ndarray
+    snr_per_b: np.ndarray
+    snr_total: float
+    log_sums: np.ndarray
+    counts: np.ndarray
+    adc: float = np.nan
+    error: str | None = None
+
+
+def _masked_values(data: np.ndarray, mask: np.ndarray) -> tuple[np.ndarray, np.ndarray]:
+    """Voxels of a (x, y, z, b) array inside mask as (voxels, b) and their validity."""
+    values = np.asarray(data[mask], dtype=np.float64)
+    return values, (values > 0) & np.isfinite(values)
+
+
+def _masked_mean(values: np.ndarray, valid: np.ndarray, axis=0) -> np.ndarray:
+    with np.errstate(invalid="ignore", divide="ignore"):
+        return np.where(valid, values, 0).sum(axis) / valid.sum(axis)
+
+
+def _masked_std(values: np.ndarray, valid: np.ndarray, axis=0) -> np.ndarray:
+    """Sample standard deviation (ddof=1) of the valid entries."""
+    mean = _masked_mean(values, valid, axis)
+    squares = np.where(valid, (values - np.expand_dims(mean, axis)) ** 2, 0)
+    with np.errstate(invalid="ignore", divide="ignore"):
+        return np.sqrt(squares.sum(axis) / (valid.sum(axis) - 1))
+
+
+def snr_statistics(
+    data: np.ndarray, mask: np.ndarray, b_values: np.ndarray, name: str = ""
+) -> FileStatistics:
+    """
+    Compute SNR per b_value and in total from signal and noise labels.
+
+    data holds one volume per unique b_value (trace combined image), volume i belongs
+    to the i-th smallest b_value. Only positive, finite values are used. As in
+    processNiftiFiles.m the total SNR divides the mean signal over all b_values by the
+    noise of the last b_value.
+    """
+    b_values = np.unique(np.asarray(b_values, dtype=np.float64))
+    n_b_values = b_values.size
+    if data.ndim == 3:
+        data = data[..., np.newaxis]
+    if data.shape[:3] != mask.shape:
+        raise ValueError("The dimensions of mask and image data do not match.")
+    if data.shape[3] < n_b_values:
+        raise ValueError(
+            f"Image contains {data.shape[3]} volumes but {n_b_values} b_values."
+        )
+    data = data[..., :n_b_values]
+
+    signal, signal_valid = _masked_values(data, mask == SIGNAL_LABEL)
+    noise, noise_valid = _masked_values(data, mask == NOISE_LABEL)
+
+    snr_per_b = _masked_mean(signal, signal_valid) / _masked_std(noise, noise_valid)
+    with np.errstate(invalid="ignore", divide="ignore"):
+        snr_total = float(
+            np.where(signal_valid, signal, 0).sum()
+            / signal_valid.sum()
+            / _masked_std(noise[:, -1], noise_valid[:, -1])
+        )
+
+    counts = signal_valid.sum(axis=0)
+    log_sums = np.where(signal_valid, np.log(np.where(signal_valid, signal, 1)), 0).sum(
+        axis=0
+    )
+    return FileStatistics(name, b_values, snr_per_b, snr_total, log_sums, counts)
+
+
+def fit_adc(statistics: list[FileStatistics], fit_start_b_value: float = 0) -> None:
+    """
+    Pooled log-linear fit log(S) = log(S0) - b * ADC for all files at once.
+
+    Uses all signal voxels of b_values >= fit_start_b_value, which equals a
+    polyfit over the pooled voxel values. The normal equations of all files are
+    built from the per b_value sums and solved in one batched call. The result is
+    stored in the adc attribute, files without enough data get NaN.
+    """
+    if not statistics:
+        return
+    n_b_values = max(stat.b_values.size for stat in statistics)
+    b = np.zeros((len(statistics), n_b_values))
+    n = np.zeros_like(b)
+    y = np.zeros_like(b)
+    for idx, stat in enumerate(statistics):
+        size = stat.b_values.size
+        use = stat.b_values >= fit_start_b_value
+        b[idx, :size] = stat.b_values
+        n[idx, :size] = np.where(use, stat.counts, 0)
+        y[idx, :size] = np.where(use, stat.log_sums, 0)
+
+    normal = np.empty((len(statistics), 2, 2))
+    normal[:, 0, 0] = (n * b**2).sum(1)
+    normal[:, 0, 1] = normal[:, 1, 0] = (n * b).sum(1)
+    normal[:, 1, 1] = n.sum(1)
+    rhs = np.stack(((b * y).sum(1), y.sum(1)), axis=1)
+
+    # at least two distinct b_values are needed for a slope
+    solvable = np.abs(np.linalg.det(normal)) > 1e-12 * np.maximum(
+        normal[:, 0, 0] * normal[:, 1, 1], 1
+    )
+    coefficients = np.full((len(statistics), 2), np.nan)
+    if solvable.any():
+        coefficients[solvable] = np.linalg.solve(
+            normal[solvable], rhs[solvable, :, np.newaxis]
+        )[..., 0]
+    for stat, slope in zip(statistics, coefficients[:, 0]):
+        stat.adc = float(-slope)
+
+
+def analyze_file(nifti_file: Path, mask_file: Path | None = None) -> FileStatistics:
+    """SNR statistics of one image with its .bval and _mask.nii files next to it."""
+    from .nifti import load_data
+
+    nifti_file = Path(nifti_file)
+    name = nifti_stem(nifti_file)
+    bval_file = nifti_file.with_name(f"{name}.bval")
+    if mask_file is None:
+        mask_file = nifti_file.with_name(f"{name}_mask.nii")
+    if not bval_file.is_file():
+        raise FileNotFoundError(f"The file {bval_file} could not be found.")
+    if not Path(mask_file).is_file():
+        raise FileNotFoundError(f"The mask file {mask_file} could not be found.")
+
+    with profiling.span("analyze_file", filename=str(nifti_file)):
+        return snr_statistics(
+            load_data(nifti_file), load_mask(mask_file), read_bval(bval_file), name
+        )
+
+
+def _analyze_file_safe(nifti_file: Path) -> FileStatistics:
+    try:
+        return analyze_file(nifti_file)
+    except Exception as error:
+        empty = np.array([])
+        return FileStatistics(
+            nifti_stem(nifti_file), empty, empty, np.nan, empty, empty, error=str(error)
+        )
+
+
+def analyze_folder(
+    folder: Path,
+    fit_start_b_value: float = 0,
+    max_workers: int | None = None,
+    pattern: str = "*.nii.gz",
+) -> list[FileStatistics]:
+    """
+    SNR and ADC analysis of all images in a folder (port of processNiftiFiles.m).
+
+    Files are processed in a process pool. Files that fail are returned with the
+    error attribute set instead of stopping the analysis.
+    """
+    files = sorted(Path(folder).glob(pattern))
+    if max_workers is None:
+        max_workers = os.cpu_count() or 1
+    max_workers = max(1, min(max_workers, len(files)))
+    if max_workers > 1:
+        with ProcessPoolExecutor(max_workers=max_workers) as executor:
+            statistics = list(executor.map(_analyze_file_safe, files))
+    else:
+        statistics = [_analyze_file_safe(nifti_file) for nifti_file in files]
+    fit_adc([stat for stat in statistics if stat.error is None], fit_start_b_value)
+    return statistics
+
+
+def results_table(statistics: list[FileStatistics]) -> tuple[list, list]:
+    """Merge all files into one table with aligned SNR_b_* columns."""
+    b_values = np.unique(
+        np.concatenate([stat.b_values for stat in statistics] + [np.array([])])
+    )
+    columns = ["Filename", "Total_SNR"]
+    columns += [f"SNR_b_{b_value:g}" for b_value in b_values]
+    columns += ["ADC", "Error"]
+    rows = list()
+    for stat in statistics:
+        row = dict.fromkeys(columns, np.nan)
+        row["Filename"] = stat.name
+        row["Total_SNR"] = stat.snr_total
+        for b_value, snr in zip(stat.b_values, stat.snr_per_b):
+            row[f"SNR_b_{b_value:g}"] = float(snr)
+        row["ADC"] = stat.adc
+        row["Error"] = stat.error or ""
+        rows.append(row)
+    return columns, rows
+
+
+def write_results(statistics: list[FileStatistics], filename: Path) -> Path:
+    """Write the merged results table as .csv or .json."""
+    filename = Path(filename)
+    columns, rows = results_table(statistics)
+    if filename.suffix.lower() == ".json":
+        rows = [
+            {
+                key: (None if isinstance(value, float) and np.isnan(value) else value)
+                for key, value in row.items()
+            }
+            for row in rows
+        ]
+        filename.write_text(json.dumps(rows, indent=2))
+    else:
+        with filename.open("w", newline="") as file:
+            writer = csv.DictWriter(file, fieldnames=columns)
+            writer.writeheader()
+            writer.writerows(rows)
+    return filename
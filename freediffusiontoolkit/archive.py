@@ -0,0 +1,298 @@
+import hashlib
+import os
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import dataclass, field
+from pathlib import Path
+
+import numpy as np
+
+from .siemens_tools import read_vector_file
+
+INDEX_VERSION = 2
+DEFAULT_PATTERNS = ("*.dvs", "*.txt")
+
+
+def _sign_canonical(directions: np.ndarray, decimals: int) -> np.ndarray:
+    """
+    Round every direction and flip it so that its first non-zero component is positive.
+
+    The sign is taken after rounding: a component like 1e-12 that vanishes in the
+    rounded rows cannot make d and -d end up with different canonical signs.
+    """
+    # adding 0.0 turns -0.0 into 0.0
+    directions = np.round(directions, decimals) + 0.0
+    first = np.argmax(directions != 0, axis=1)
+    signs = np.sign(directions[np.arange(directions.shape[0]), first])
+    signs[signs == 0] = 1
+    return directions * signs[:, np.newaxis] + 0.0
+
+
+def canonical_directions(vectors: np.ndarray, decimals: int = 6) -> np.ndarray:
+    """
+    Distinct unit directions of a vector set, independent of sign, order and length.
+
+    Zero vectors are dropped, every direction is flipped to a positive first
+    component and the result is sorted lexicographically.
+    """
+    vectors = np.asarray(vectors, dtype=np.float64).reshape(-1, 3)
+    norms = np.linalg.norm(vectors, axis=1)
+    nonzero = norms > 0
+    directions = _sign_canonical(
+        vectors[nonzero] / norms[nonzero, np.newaxis], decimals
+    )
+    return np.unique(directions, axis=0)
+
+
+def fingerprint(vectors: np.ndarray, decimals: int = 4) -> str:
+    """
+    Hash of a vector set that is invariant to sign flips, row order and scaling.
+
+    The set is described by the multiset of (relative length, canonical direction)
+    rows and the number of zero vectors, rounded to decimals.
+    """
+    vectors = np.asarray(vectors, dtype=np.float64).reshape(-1, 3)
+    norms = np.linalg.norm(vectors, axis=1)
+    max_norm = norms.max(initial=0.0)
+    nonzero = norms > max_norm * 1e-9
+    rows = np.empty((int(nonzero.sum()), 4))
+    rows[:, 0] = np.round(norms[nonzero] / max_norm, decimals) if nonzero.any() else 0
+    rows[:, 1:] = _sign_canonical(
+        vectors[nonzero] / norms[nonzero, np.newaxis], decimals
+    )
+    rows, counts = np.unique(rows, axis=0, return_counts=True)
+    digest = hashlib.sha256()
+    digest.update(f"{INDEX_VERSION}:{decimals}:{int((~nonzero).sum())}:".encode())
+    digest.update(np.ascontiguousarray(rows).tobytes())
+    digest.update(counts.astype(np.int64).tobytes())
+    return digest.hexdigest()
+
+
+@dataclass
+class SchemeEntry:
+    """Indexed vector file. Files that could not be parsed keep their error."""
+
+    path: str
+    mtime_ns: int
+    size: int
+    fingerprint: str = ""
+    n_vectors: int = 0
+    directions: np.ndarray = field(default_factory=lambda: np.zeros((0, 3)))
+    error: str | None = None
+
+
+@dataclass
+class ScanReport:
+    added: list = field(default_factory=list)
+    updated: list = field(default_factory=list)
+    removed: list = field(default_factory=list)
+    unchanged: int = 0
+    failed: list = field(default_factory=list)
+
+    def summary(self) -> str:
+        return (
+            f"{len(self.added)} added, {len(self.updated)} updated, "
+            f"{len(self.removed)} removed, {self.unchanged} unchanged, "
+            f"{len(self.failed)} not readable."
+        )
+
+
+def _index_file(job: tuple) -> SchemeEntry:
+    path, mtime_ns, size = job
+    entry = SchemeEntry(path, mtime_ns, size)
+    try:
+        vectors, _ = read_vector_file(Path(path))
+    except Exception as error:
+        entry.error = str(error)
+        return entry
+    if len(vectors) == 0:
+        entry.error = "No vectors found."
+        return entry
+    entry.fingerprint = fingerprint(vectors)
+    entry.n_vectors = len(vectors)
+    entry.directions = canonical_directions(vectors)
+    return entry
+
+
+class SchemeIndex:
+    """
+    Index of the vector files of a directory tree.
+
+    scan() only parses files that are new or whose modification time or size
+    changed. Exact matches are found by fingerprint, near-duplicates with a KD-tree
+    over the canonical directions of all files.
+    """
+
+    def __init__(self, entries: dict | None = None):
+        self.entries = entries if entries is not None else dict()
+        self._tree = None
+
+    def scan(
+        self,
+        root: Path,
+        patterns: tuple = DEFAULT_PATTERNS,
+        max_workers: int | None = None,
+    ) -> ScanReport:
+        """
+        Update the index with all files matching patterns below root.
+
+        Entries of deleted files below root are removed. Changed files are parsed in
+        a process pool.
+        """
+        root = Path(root).resolve()
+        report = ScanReport()
+        found = dict()
+        for pattern in patterns:
+            for path in root.rglob(pattern):
+                if path.is_file():
+                    stat = path.stat()
+                    found[str(path)] = (stat.st_mtime_ns, stat.st_size)
+
+        jobs = list()
+        for path, (mtime_ns, size) in found.items():
+            entry = self.entries.get(path)
+            if entry is not None and (entry.mtime_ns, entry.size) == (mtime_ns, size):
+                report.unchanged += 1
+                continue
+            (report.added if entry is None else report.updated).append(path)
+            jobs.append((path, mtime_ns, size))
+        for path in list(self.entries):
+            if path not in found and Path(path).is_relative_to(root):
+                del self.entries[path]
+                report.removed.append(path)
+
+        if max_workers is None:
+            max_workers = os.cpu_count() or 1
+        max_workers = max(1, min(max_workers, len(jobs) // 64))
+        if max_workers > 1:
+            with ProcessPoolExecutor(max_workers=max_workers) as executor:
+                entries = list(executor.map(_index_file, jobs, chunksize=64))
+        else:
+            entries = [_index_file(job) for job in jobs]
+        for entry in entries:
+            self.entries[entry.path] = entry
+            if entry.error:
+                report.failed.append(entry.path)
+        if jobs or report.removed:
+            self._tree = None
+        return report
+
+    @property
+    def valid_entries(self) -> list[SchemeEntry]:
+        return [entry for entry in self.entries.values() if entry.error is None]
+
+    def find(self, vectors: np.ndarray) -> list[str]:
+        """Files containing the same scheme (up to sign, order and scaling)."""
+        key = fingerprint(vectors)
+        return sorted(
+            entry.path for entry in self.valid_entries if entry.fingerprint == key
+        )
+
+    def duplicates(self) -> dict:
+        """Groups of files with identical fingerprints."""
+        groups = dict()
+        for entry in self.valid_entries:
+            groups.setdefault(entry.fingerprint, []).append(entry.path)
+        return {key: sorted(paths) for key, paths in groups.items() if len(paths) > 1}
+
+    def _build_tree(self):
+        from scipy.spatial import cKDTree
+
+        entries = self.valid_entries
+        directions = [entry.directions for entry in entries]
+        owners = np.repeat(np.arange(len(entries)), [len(d) for d in directions])
+        points = np.concatenate(directions) if directions else np.zeros((0, 3))
+        self._tree = (cKDTree(points), owners, entries)
+
+    def near(self, vectors: np.ndarray, tolerance: float = 1.0) -> list[tuple]:
+        """
+        Files whose directions match the scheme within an angular tolerance.
+
+        Two schemes match if they have the same number of distinct directions and
+        every direction of each scheme lies within tolerance degrees of a direction
+        of the other one (antipodal directions are identical).
+
+        Returns:
+            List of (path, largest angular deviation in degrees), best match first.
+        """
+        if self._tree is None:
+            self._build_tree()
+        tree, owners, entries = self._tree
+        query = canonical_directions(vectors)
+        if query.shape[0] == 0 or tree.n == 0:
+            return []
+        radius = 2 * np.sin(np.radians(tolerance) / 2)
+
+        candidates = None
+        for sign in (1, -1):
+            hits = tree.query_ball_point(sign * query, radius)
+            matched = [set(owners[hit]) for hit in hits]
+            if candidates is None:
+                candidates = matched
+            else:
+                candidates = [a | b for a, b in zip(candidates, matched)]
+        # every query direction needs a close direction in the candidate
+        common = set.intersection(*candidates)
+
+        results = list()
+        for owner in common:
+            entry = entries[owner]
+            if entry.directions.shape[0] != query.shape[0]:
+                continue
+            cosines = np.abs(query @ entry.directions.T)
+            # symmetric (Hausdorff) deviation between the two direction sets
+            worst = min(cosines.max(axis=1).min(), cosines.max(axis=0).min())
+            angle = float(np.degrees(np.arccos(np.clip(worst, -1.0, 1.0))))
+            if angle <= tolerance:
+                results.append((entry.path, angle))
+        return sorted(results, key=lambda result: (result[1], result[0]))
+
+    def save(self, filename: Path) -> None:
+        """Store the index as .npz file."""
+        entries = list(self.entries.values())
+        counts = np.array([len(entry.directions) for entry in entries], dtype=np.int64)
+        directions = [entry.directions for entry in entries]
+        with Path(filename).open("wb") as file:
+            np.savez_compressed(
+                file,
+                version=np.array(INDEX_VERSION),
+                paths=np.array([entry.path for entry in entries], dtype=str),
+                mtime_ns=np.array(
+                    [entry.mtime_ns for entry in entries], dtype=np.int64
+                ),
+                sizes=np.array([entry.size for entry in entries], dtype=np.int64),
+                fingerprints=np.array(
+                    [entry.fingerprint for entry in entries], dtype=str
+                ),
+                n_vectors=np.array(
+                    [entry.n_vectors for entry in entries], dtype=np.int64
+                ),
+                errors=np.array([entry.error or "" for entry in entries], dtype=str),
+                counts=counts,
+                directions=(
+                    np.concatenate(directions) if directions else np.zeros((0, 3))
+                ),
+            )
+
+    @classmethod
+    def load(cls, filename: Path) -> "SchemeIndex":
+        """Load an index written by save. Outdated or missing files give an empty index."""
+        filename = Path(filename)
+        if not filename.is_file():
+            return cls()
+        with np.load(filename) as data:
+            if int(data["version"]) != INDEX_VERSION:
+                return cls()
+            offsets = np.concatenate(([0], np.cumsum(data["counts"])))
+            directions = data["directions"]
+            entries = dict()
+            for idx, path in enumerate(data["paths"]):
+                entries[str(path)] = SchemeEntry(
+                    str(path),
+                    int(data["mtime_ns"][idx]),
+                    int(data["sizes"][idx]),
+                    str(data["fingerprints"][idx]),
+                    int(data["n_vectors"][idx]),
+                    directions[offsets[idx] : offsets[idx + 1]],
+                    str(data["errors"][idx]) or None,
+                )
+        return cls(entries)
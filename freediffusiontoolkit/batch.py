@@ -0,0 +1,229 @@
+import csv
+import json
+import os
+import time
+import tomllib
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from dataclasses import dataclass, field
+from pathlib import Path
+
+import numpy as np
+
+
+@dataclass
+class BatchJob:
+    """One vector file to create. Options are passed to the vendor tool."""
+
+    b_values: list
+    n_dims: int | None
+    filename: Path
+    vendor: str = "Siemens"
+    options: dict = field(default_factory=dict)
+
+    def create_tool(self):
+        from .cli import vendor_handler
+
+        return vendor_handler(self.vendor, self.b_values, self.n_dims, **self.options)
+
+
+@dataclass
+class BatchResult:
+    filename: Path
+    ok: bool
+    seconds: float = 0.0
+    error: str | None = None
+
+
+@dataclass
+class BatchReport:
+    results: list = field(default_factory=list)
+    n_bases: int = 0
+    seconds: float = 0.0
+
+    @property
+    def failed(self) -> list:
+        return [result for result in self.results if not result.ok]
+
+    def summary(self) -> str:
+        lines = [
+            f"{len(self.results) - len(self.failed)} of {len(self.results)} vector files "
+            f"written using {self.n_bases} distinct basis sets in {self.seconds:.2f} s."
+        ]
+        for result in self.failed:
+            lines.append(f"   FAILED {result.filename}: {result.error}")
+        return "\n".join(lines)
+
+
+def _parse_list(values: str | list, dtype=float) -> list:
+    if isinstance(values, str):
+        values = values.replace(",", " ").split()
+    return [dtype(val) for val in values]
+
+
+def _parse_bool(value: str | bool) -> bool:
+    if isinstance(value, str):
+        if value.strip().lower() in ("1", "true", "yes", "on"):
+            return True
+        if value.strip().lower() in ("0", "false", "no", "off"):
+            return False
+        raise ValueError(f"{value!r} is no boolean.")
+    return bool(value)
+
+
+# typed tool options, csv cells arrive as strings. Other options such as the
+# Siemens header fields are passed unchanged.
+OPTION_TYPES = {
+    "max_iter": int,
+    "scale_by_value": float,
+    "use_library": _parse_bool,
+    "points_per_shell": lambda values: _parse_list(values, int),
+    "coupling_weights": _parse_list,
+}
+
+
+def _job_from_entry(entry: dict, root: Path) -> BatchJob:
+    entry = dict(entry)
+    try:
+        b_values = _parse_list(entry.pop("b_values"))
+        filename = Path(entry.pop("filename"))
+    except KeyError as error:
+        raise ValueError(f"Manifest entry {entry} misses the key {error}.") from None
+    vendor = entry.pop("vendor", "Siemens")
+    n_dims = entry.pop("n_dims", None)
+    # remaining keys are tool options, empty csv cells are dropped
+    options = {key: value for key, value in entry.items() if value not in ("", None)}
+    for key, convert in OPTION_TYPES.items():
+        if key in options:
+            try:
+                options[key] = convert(options[key])
+            except (TypeError, ValueError):
+                raise ValueError(
+                    f"Invalid {key} {options[key]!r} in manifest entry {entry}."
+                ) from None
+    if n_dims in ("", None):
+        # multi-shell jobs take the number of directions from points_per_shell
+        if "points_per_shell" not in options:
+            raise ValueError(f"Manifest entry {entry} misses the key 'n_dims'.")
+        n_dims = None
+    else:
+        n_dims = int(n_dims)
+    if not filename.is_absolute():
+        filename = root / filename
+    return BatchJob(b_values, n_dims, filename, vendor, options)
+
+
+def load_manifest(manifest: Path) -> list[BatchJob]:
+    """
+    Read batch jobs from a json, toml or csv manifest.
+
+    Every job needs b_values, n_dims and filename, vendor defaults to Siemens. n_dims
+    may be left out for multi-shell jobs with points_per_shell. Further keys are
+    passed as options to the vendor tool, the options in OPTION_TYPES are converted
+    to their types. Relative filenames are resolved against the directory of the
+    manifest.
+
+    json: A list of jobs or an object with a "jobs" list.
+    toml: An array of tables named jobs ([[jobs]]).
+    csv: One job per row with a header line. b_values are given as "0 500 1000".
+    """
+    manifest = Path(manifest)
+    suffix = manifest.suffix.lower()
+    if suffix == ".json":
+        with manifest.open("r") as file:
+            entries = json.load(file)
+        if isinstance(entries, dict):
+            entries = entries.get("jobs", [])
+    elif suffix == ".toml":
+        with manifest.open("rb") as file:
+            entries = tomllib.load(file).get("jobs", [])
+    elif suffix == ".csv":
+        with manifest.open("r", newline="") as file:
+            entries = list(csv.DictReader(file))
+    else:
+        raise ValueError(f"Unsupported manifest type {manifest.suffix}.")
+    return [_job_from_entry(entry, manifest.parent) for entry in entries]
+
+
+def _compute_basis(job: BatchJob) -> np.ndarray:
+    return job.create_tool().get_basis_vectors()
+
+
+def _write(job: BatchJob, tool) -> BatchResult:
+    start = time.perf_counter()
+    try:
+        job.filename.parent.mkdir(parents=True, exist_ok=True)
+        tool.save(job.filename)
+    except Exception as error:
+        return BatchResult(job.filename, False, time.perf_counter() - start, str(error))
+    return BatchResult(job.filename, True, time.perf_counter() - start)
+
+
+def run_batch(jobs: list[BatchJob], max_workers: int | None = None) -> BatchReport:
+    """
+    Create all vector files of a batch.
+
+    Jobs sharing the same basis (see FreeDiffusionTool.basis_key) are grouped so every
+    basis is optimized only once. Distinct bases are computed in a process pool, the
+    files are then written concurrently.
+
+    Parameters:
+        jobs: list[BatchJob]
+            Jobs to process, see load_manifest.
+        max_workers: int
+            Number of worker processes. Defaults to the number of CPUs.
+    """
+    start = time.perf_counter()
+    report = BatchReport()
+    tools = dict()
+    groups = dict()
+    for idx, job in enumerate(jobs):
+        try:
+            tool = job.create_tool()
+        except Exception as error:
+            report.results.append(BatchResult(job.filename, False, error=str(error)))
+            continue
+        tools[idx] = tool
+        groups.setdefault(tool.basis_key(), []).append(idx)
+    report.n_bases = len(groups)
+
+    # optimize every distinct basis once
+    keys = list(groups)
+    representatives = [jobs[groups[key][0]] for key in keys]
+    if max_workers is None:
+        max_workers = os.cpu_count() or 1
+    max_workers = max(1, min(max_workers, len(keys)))
+    bases = dict()
+    errors = dict()
+    if max_workers > 1:
+        with ProcessPoolExecutor(max_workers=max_workers) as executor:
+            futures = [executor.submit(_compute_basis, job) for job in representatives]
+            for key, future in zip(keys, futures):
+                try:
+                    bases[key] = future.result()
+                except Exception as error:
+                    errors[key] = str(error)
+    else:
+        for key in keys:
+            try:
+                bases[key] = tools[groups[key][0]].get_basis_vectors()
+            except Exception as error:
+                errors[key] = str(error)
+
+    pending = list()
+    for key, indices in groups.items():
+        for idx in indices:
+            if key in errors:
+                report.results.append(
+                    BatchResult(jobs[idx].filename, False, error=errors[key])
+                )
+            else:
+                tools[idx].basis_vectors = bases[key]
+                pending.append(idx)
+
+    with ThreadPoolExecutor(max_workers=os.cpu_count() or 1) as executor:
+        report.results.extend(
+            executor.map(lambda idx: _write(jobs[idx], tools[idx]), pending)
+        )
+
+    report.seconds = time.perf_counter() - start
+    return report
@@ -0,0 +1,192 @@
+import hashlib
+import os
+import threading
+from collections import OrderedDict
+from importlib import metadata
+from pathlib import Path
+from typing import Callable
+
+import numpy as np
+
+from . import profiling
+
+
+def default_cache_dir() -> Path:
+    """Return the cache directory, honoring FDT_CACHE_DIR and XDG_CACHE_HOME."""
+    if os.environ.get("FDT_CACHE_DIR"):
+        return Path(os.environ["FDT_CACHE_DIR"])
+    xdg_cache = os.environ.get("XDG_CACHE_HOME")
+    base = Path(xdg_cache) if xdg_cache else Path.home() / ".cache"
+    return base / "freediffusiontoolkit"
+
+
+def qspace_version() -> str:
+    """Installed qspace version without importing qspace itself."""
+    try:
+        return metadata.version("qspace")
+    except metadata.PackageNotFoundError:
+        return "unknown"
+
+
+class BasisCache:
+    """
+    Two level cache for optimized basis vectors.
+
+    Entries are content addressed by a hash over the optimization parameters. Recently
+    used entries are held in an in-process LRU, every entry is additionally stored as
+    npz file in the cache directory. The directory is kept below max_bytes by evicting
+    the least recently used files.
+
+    Parameters:
+        directory: Path
+            Location of the file backed store. Defaults to default_cache_dir().
+        max_entries: int
+            Number of entries held in memory.
+        max_bytes: int
+            Upper bound for the size of the file backed store.
+        enabled: bool
+            Disable the cache completely. Can also be set with FDT_CACHE_DISABLE=1.
+    """
+
+    def __init__(
+        self,
+        directory: Path | str | None = None,
+        max_entries: int = 128,
+        max_bytes: int = 64 * 2**20,
+        enabled: bool | None = None,
+    ):
+        self._directory = Path(directory) if directory is not None else None
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        if enabled is None:
+            enabled = os.environ.get("FDT_CACHE_DISABLE", "0").lower() in (
+                "0",
+                "",
+                "false",
+                "no",
+            )
+        self.enabled = enabled
+        self._memory = OrderedDict()
+        self._lock = threading.Lock()
+
+    @property
+    def directory(self) -> Path:
+        if self._directory is None:
+            return default_cache_dir()
+        return self._directory
+
+    @directory.setter
+    def directory(self, directory: Path | str | None):
+        self._directory = Path(directory) if directory is not None else None
+
+    @staticmethod
+    def make_key(
+        n_dims: int | list,
+        shells: int,
+        weights: np.ndarray,
+        max_iter: int,
+        version: str | None = None,
+    ) -> str:
+        """Create the content hash for one optimization request."""
+        if version is None:
+            version = qspace_version()
+        digest = hashlib.sha256()
+        digest.update(f"{list(np.atleast_1d(n_dims))}|{shells}|{max_iter}|".encode())
+        digest.update(f"{version}|".encode())
+        weights = np.ascontiguousarray(weights, dtype=np.float64)
+        digest.update(str(weights.shape).encode())
+        digest.update(weights.tobytes())
+        return digest.hexdigest()
+
+    def _path(self, key: str) -> Path:
+        return self.directory / f"{key}.npz"
+
+    def get(self, key: str) -> np.ndarray | None:
+        """Return a copy of the cached points or None if the key is unknown."""
+        if not self.enabled:
+            return None
+        with self._lock:
+            if key in self._memory:
+                self._memory.move_to_end(key)
+                profiling.count("basis_cache.memory_hits")
+                return self._memory[key].copy()
+
+        path = self._path(key)
+        try:
+            with np.load(path) as data:
+                points = data["points"]
+            # mark as recently used for eviction
+            os.utime(path)
+        except (OSError, KeyError, ValueError):
+            profiling.count("basis_cache.misses")
+            return None
+        profiling.count("basis_cache.disk_hits")
+        self._remember(key, points)
+        return points.copy()
+
+    def put(self, key: str, points: np.ndarray) -> None:
+        """Store points in memory and on disk."""
+        if not self.enabled:
+            return
+        points = np.array(points, dtype=np.float64)
+        self._remember(key, points)
+
+        path = self._path(key)
+        try:
+            path.parent.mkdir(parents=True, exist_ok=True)
+            tmp_path = path.with_suffix(f".{os.getpid()}.{threading.get_ident()}.tmp")
+            with tmp_path.open("wb") as file:
+                np.savez(file, points=points)
+            os.replace(tmp_path, path)
+        except OSError:
+            # a read only or full cache directory must never break vector creation
+            return
+        self._evict()
+
+    def get_or_compute(self, key: str, compute: Callable[[], np.ndarray]) -> np.ndarray:
+        points = self.get(key)
+        if points is None:
+            points = compute()
+            self.put(key, points)
+        return points
+
+    def _remember(self, key: str, points: np.ndarray) -> None:
+        with self._lock:
+            self._memory[key] = points
+            self._memory.move_to_end(key)
+            while len(self._memory) > self.max_entries:
+                self._memory.popitem(last=False)
+
+    def _evict(self) -> None:
+        """Remove least recently used files until the store fits into max_bytes."""
+        try:
+            entries = [
+                (entry.stat().st_mtime, entry.stat().st_size, entry)
+                for entry in self.directory.glob("*.npz")
+            ]
+        except OSError:
+            return
+        total = sum(size for _, size, _ in entries)
+        for _, size, entry in sorted(entries, key=lambda item: item[0]):
+            if total <= self.max_bytes:
+                break
+            try:
+                entry.unlink()
+            except OSError:
+                continue
+            total -= size
+
+    def clear(self, memory: bool = True, disk: bool = True) -> None:
+        """Drop cached entries from memory and/or disk."""
+        if memory:
+            with self._lock:
+                self._memory.clear()
+        if disk and self.directory.is_dir():
+            for entry in self.directory.glob("*.npz"):
+                try:
+                    entry.unlink()
+                except OSError:
+                    pass
+
+
+basis_cache = BasisCache()
@@ -1,6 +1,5 @@
 import sys
 from pathlib import Path
-from .siemens_tools import LegacySiemensTool, BasicSiemensTool
 
 
 def run(
@@ -19,6 +18,7 @@ def run(
             "FreeDiffusionToolkit for diffusion vector file creation.\n"
             "Usage:\n"
             "  create_vector_file <b_values> <n_dims> <vendor> <filename> [options]\n"
+            "  create_vector_file --batch <manifest> [--workers=N]\n"
             "\n"
             "Parameters:\n"
             "   b_values: list              Values used for scaling the directions.\n"
@@ -28,9 +28,30 @@ def run(
             "   filename: str               Output filename with ending.\n\n"
             "General Options:\n"
             "   -h, --help                  Show help.\n"
+            "   --batch                     Create all vector files listed in a json, toml or csv manifest.\n"
+            "   --export=<format>:<file>    Also write the vectors to file, may be repeated.\n"
+            "                               Formats: siemens, siemens_vb, fsl, mrtrix.\n"
+            "   --no-daemon                 Do not use a running generation daemon.\n"
+            "   --profile=<file>            Write timings and counters to file at exit, a\n"
+            "                               Chrome trace for *.trace.json. See FDT_PROFILE.\n"
+            "   --workers=N                 Number of worker processes used in batch mode.\n"
         )
         return
 
+    from . import profiling
+
+    for opt in opts:
+        if opt.startswith("--profile="):
+            profiling.enable(opt.split("=", 1)[1])
+    with profiling.span("cli.run"):
+        _run(args, opts)
+
+
+def _run(args: list, opts: list):
+    if "--batch" in opts:
+        run_batch_manifest(Path(args[-1]), opts)
+        return
+
     if len(args) < 4:
         TypeError("Not enough input arguments.")
     elif len(args) < 5:
@@ -41,19 +62,329 @@ def run(
     vendor = args[3]
     filename = Path(args[4])
 
+    exports = [opt.split("=", 1)[1] for opt in opts if opt.startswith("--export=")]
+    if "--no-daemon" not in opts and create_with_daemon(
+        b_values, n_dims, vendor, filename, exports
+    ):
+        return
+
     # free_diffusion_tool = FreeDiffusionTool(b_values, n_dims, vendor)
     free_diffusion_tool = vendor_handler(vendor, b_values, n_dims)
-    free_diffusion_tool.save(filename)
+    if exports:
+        from .writers import export
+
+        # vectors are computed once and written to all formats
+        export(free_diffusion_tool, [(vendor_format(vendor), filename)] + exports)
+    else:
+        free_diffusion_tool.save(filename)
+
+
+def create_with_daemon(
+    b_values: list, n_dims: int, vendor: str, filename: Path, exports: list
+) -> bool:
+    """
+    Let a running generation daemon create the file.
+
+    False if no daemon is reachable or the request failed there, the caller then
+    creates the file itself.
+    """
+    from .daemon import DaemonClient, DaemonError, default_socket_path
+
+    socket_path = default_socket_path()
+    if not socket_path.exists():
+        return False
+    try:
+        DaemonClient(socket_path).create(b_values, n_dims, vendor, filename, exports)
+    except (OSError, DaemonError):
+        # stale socket, daemon gone or failing, create the file in this process
+        return False
+    return True
+
 
+def run_batch_manifest(manifest: Path, opts: list):
+    """Create all vector files of a manifest. See batch.load_manifest."""
+    from .batch import load_manifest, run_batch
 
-def vendor_handler(vendor: str, b_values: list, n_dims: int):
-    if "Siemens" or "siemens" in vendor:
+    max_workers = None
+    for opt in opts:
+        if opt.startswith("--workers="):
+            max_workers = int(opt.split("=", 1)[1])
+
+    report = run_batch(load_manifest(manifest), max_workers=max_workers)
+    print(report.summary())
+    if report.failed:
+        sys.exit(1)
+
+
+def vendor_handler(vendor: str, b_values: list, n_dims: int, **kwargs):
+    # vendor backends (and numpy) are imported on demand to keep "-h" fast
+    from .siemens_tools import LegacySiemensTool, BasicSiemensTool
+
+    if "siemens" in vendor.lower():
         if "VB11" in vendor:
-            free_diffusion_tool = LegacySiemensTool(b_values, n_dims)
+            free_diffusion_tool = LegacySiemensTool(b_values, n_dims, **kwargs)
         else:
-            free_diffusion_tool = BasicSiemensTool(b_values, n_dims)
+            free_diffusion_tool = BasicSiemensTool(b_values, n_dims, **kwargs)
     else:
         raise ValueError(
             "The selected vendor is not supported. Check documentation for supported ones."
         )
     return free_diffusion_tool
+
+
+def vendor_format(vendor: str) -> str:
+    """Writer format of the file created for vendor, see writers.available_writers."""
+    return "siemens_vb" if "VB11" in vendor else "siemens"
+
+
+def main(args: list = None):
+    """Entry point of the freediffusiontoolkit command providing the analysis tools."""
+    import argparse
+
+    if args is None:
+        args = sys.argv
+
+    parser = argparse.ArgumentParser(
+        prog="freediffusiontoolkit",
+        description="FreeDiffusionToolkit evaluation of diffusion weighted images.",
+    )
+    parser.add_argument(
+        "--profile",
+        type=Path,
+        default=None,
+        help="Write timings and counters to this file at exit (Chrome trace for "
+        "*.trace.json). Can also be set with FDT_PROFILE.",
+    )
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    snr = subparsers.add_parser(
+        "snr", help="SNR and ADC analysis of all trace combined images of a folder."
+    )
+    snr.add_argument("folder", type=Path, help="Folder with images, .bval and masks.")
+    snr.add_argument(
+        "--fit-start-b-value",
+        type=float,
+        default=0,
+        help="Smallest b_value used for the ADC fit.",
+    )
+    snr.add_argument("--workers", type=int, default=None, help="Worker processes.")
+    snr.add_argument(
+        "--output",
+        type=Path,
+        default=None,
+        help="Result table (.csv or .json). Defaults to <folder>/snr_results.csv.",
+    )
+    snr.add_argument(
+        "--pattern", default="*.nii.gz", help="Glob pattern of the input images."
+    )
+    snr.add_argument(
+        "--boxplots",
+        type=Path,
+        default=None,
+        help="Also write quartiles and whiskers of the log signal to this .csv file.",
+    )
+    snr.add_argument(
+        "--accuracy",
+        type=float,
+        default=0.01,
+        help="Relative accuracy of the boxplot quantiles, 0 for exact (more memory).",
+    )
+    snr.set_defaults(func=_run_snr)
+
+    fit = subparsers.add_parser(
+        "fit", help="Voxel-wise ADC and diffusion tensor fit of a 4D image."
+    )
+    fit.add_argument("image", type=Path, help="4D diffusion weighted image.")
+    fit.add_argument(
+        "--vectors", type=Path, default=None, help="Siemens diffusion vector file."
+    )
+    fit.add_argument(
+        "--bval", type=Path, default=None, help="Defaults to <image>.bval."
+    )
+    fit.add_argument(
+        "--bvec", type=Path, default=None, help="Defaults to <image>.bvec if present."
+    )
+    fit.add_argument(
+        "--b-max",
+        type=float,
+        default=None,
+        help="b_value of unit length vectors in the vector file.",
+    )
+    fit.add_argument("--mask", type=Path, default=None, help="Only fit these voxels.")
+    fit.add_argument("--output", type=Path, default=None, help="Output prefix.")
+    fit.add_argument("--wls", action="store_true", help="Use weighted least squares.")
+    fit.add_argument("--workers", type=int, default=None, help="Worker threads.")
+    fit.set_defaults(func=_run_fit)
+
+    daemon = subparsers.add_parser(
+        "daemon", help="Resident vector file generation service on a Unix socket."
+    )
+    daemon.add_argument("action", choices=("start", "stop", "status"))
+    daemon.add_argument(
+        "--socket", type=Path, default=None, help="Defaults to $FDT_DAEMON_SOCKET."
+    )
+    daemon.set_defaults(func=_run_daemon)
+
+    index = subparsers.add_parser(
+        "index", help="Index vector files of a folder and search for schemes."
+    )
+    index.add_argument("folder", type=Path, help="Folder scanned recursively.")
+    index.add_argument(
+        "--index",
+        type=Path,
+        default=None,
+        help="Index file. Defaults to <folder>/.fdt_index.npz.",
+    )
+    index.add_argument(
+        "--find", type=Path, default=None, help="Vector file to search for."
+    )
+    index.add_argument(
+        "--tolerance",
+        type=float,
+        default=1.0,
+        help="Angular tolerance in degrees for near-duplicates.",
+    )
+    index.add_argument("--workers", type=int, default=None, help="Worker processes.")
+    index.set_defaults(func=_run_index)
+
+    pipeline = subparsers.add_parser(
+        "pipeline",
+        help="Masks, geometric mean and SNR of a folder, only recomputing changes.",
+    )
+    pipeline.add_argument("folder", type=Path, help="Folder with *.nii.gz and .bval.")
+    pipeline.add_argument(
+        "--results", type=Path, default=None, help="Result folder, defaults to folder."
+    )
+    pipeline.add_argument("--radius", type=float, default=20)
+    pipeline.add_argument("--inner-radius", type=float, default=50)
+    pipeline.add_argument("--outer-radius", type=float, default=55)
+    pipeline.add_argument(
+        "--fit-start-b-value",
+        type=float,
+        default=0,
+        help="Smallest b_value used for the ADC fit.",
+    )
+    pipeline.add_argument("--workers", type=int, default=None, help="Worker processes.")
+    pipeline.add_argument("--force", action="store_true", help="Recompute all stages.")
+    pipeline.add_argument(
+        "--output", type=Path, default=None, help="Result table (.csv or .json)."
+    )
+    pipeline.set_defaults(func=_run_pipeline)
+
+    parsed = parser.parse_args(args[1:])
+    from . import profiling
+
+    if parsed.profile is not None:
+        profiling.enable(parsed.profile)
+    with profiling.span(f"cli.{parsed.command}"):
+        parsed.func(parsed)
+
+
+def _run_snr(parsed):
+    from .analysis import analyze_folder, write_results
+
+    statistics = analyze_folder(
+        parsed.folder,
+        fit_start_b_value=parsed.fit_start_b_value,
+        max_workers=parsed.workers,
+        pattern=parsed.pattern,
+    )
+    output = parsed.output or parsed.folder / "snr_results.csv"
+    write_results(statistics, output)
+    if parsed.boxplots is not None:
+        _write_boxplots(parsed, [stat.name for stat in statistics if not stat.error])
+    for stat in statistics:
+        if stat.error:
+            print(f"{stat.name}: {stat.error}")
+        else:
+            print(f"{stat.name}: SNR {stat.snr_total:.2f}, ADC {stat.adc:.3e}")
+    print(f"Results saved to {output}")
+
+
+def _write_boxplots(parsed, names: list):
+    from .roi_statistics import roi_statistics_file, write_boxplot_statistics
+    from .trace import nifti_stem
+
+    files = {nifti_stem(path): path for path in parsed.folder.glob(parsed.pattern)}
+    statistics = {
+        name: roi_statistics_file(
+            files[name],
+            relative_accuracy=parsed.accuracy,
+            max_workers=parsed.workers,
+        )
+        for name in names
+    }
+    write_boxplot_statistics(statistics, parsed.boxplots)
+    print(f"Boxplot statistics saved to {parsed.boxplots}")
+
+
+def _run_fit(parsed):
+    from .fitting import fit_image
+
+    files = fit_image(
+        parsed.image,
+        vector_file=parsed.vectors,
+        bval_file=parsed.bval,
+        bvec_file=parsed.bvec,
+        b_max=parsed.b_max,
+        mask_file=parsed.mask,
+        output_prefix=parsed.output,
+        weighted=parsed.wls,
+        max_workers=parsed.workers,
+    )
+    for name, filename in files.items():
+        print(f"{name} saved to {filename}")
+
+
+def _run_daemon(parsed):
+    from .daemon import DaemonClient, default_socket_path, is_running, serve
+
+    socket_path = parsed.socket or default_socket_path()
+    if parsed.action == "start":
+        print(f"Listening on {socket_path}")
+        serve(socket_path)
+    elif parsed.action == "stop":
+        if is_running(socket_path):
+            DaemonClient(socket_path).shutdown()
+    else:
+        state = "running" if is_running(socket_path) else "not running"
+        print(f"Daemon on {socket_path} is {state}.")
+
+
+def _run_index(parsed):
+    from .archive import SchemeIndex
+    from .siemens_tools import read_vector_file
+
+    index_file = parsed.index or parsed.folder / ".fdt_index.npz"
+    index = SchemeIndex.load(index_file)
+    report = index.scan(parsed.folder, max_workers=parsed.workers)
+    index.save(index_file)
+    print(report.summary())
+    if parsed.find is not None:
+        vectors, _ = read_vector_file(parsed.find)
+        exact = set(index.find(vectors))
+        for path, angle in index.near(vectors, parsed.tolerance):
+            label = "identical" if path in exact else f"max. deviation {angle:.3f} deg"
+            print(f"{path}: {label}")
+
+
+def _run_pipeline(parsed):
+    from .pipeline import PipelineParameters, run_pipeline
+
+    report = run_pipeline(
+        parsed.folder,
+        parsed.results,
+        PipelineParameters(
+            parsed.radius,
+            parsed.inner_radius,
+            parsed.outer_radius,
+            parsed.fit_start_b_value,
+        ),
+        max_workers=parsed.workers,
+        force=parsed.force,
+        results_file=parsed.output,
+    )
+    for name, stages in report.executed.items():
+        print(f"{name}: {', '.join(stages) if stages else 'up to date'}")
+    print(report.summary())
+    print(f"Results saved to {report.results_file}")
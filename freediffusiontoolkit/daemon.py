@@ -0,0 +1,254 @@
+import json
+import os
+import socket
+import socketserver
+import tempfile
+import threading
+import time
+from collections import OrderedDict
+from pathlib import Path
+
+# Requests and responses are single JSON objects per line. A connection can send
+# several requests one after another.
+ENCODING = "utf-8"
+
+
+class DaemonError(RuntimeError):
+    """Request that reached the daemon but failed there."""
+
+
+def default_socket_path() -> Path:
+    """
+    Socket of the generation daemon.
+
+    FDT_DAEMON_SOCKET if set, otherwise freediffusiontoolkit-<user>.sock in
+    XDG_RUNTIME_DIR or the temporary directory.
+    """
+    if os.environ.get("FDT_DAEMON_SOCKET"):
+        return Path(os.environ["FDT_DAEMON_SOCKET"])
+    directory = os.environ.get("XDG_RUNTIME_DIR") or tempfile.gettempdir()
+    user = os.getuid() if hasattr(os, "getuid") else os.getlogin()
+    return Path(directory) / f"freediffusiontoolkit-{user}.sock"
+
+
+class _RequestHandler(socketserver.StreamRequestHandler):
+    def handle(self):
+        for line in self.rfile:
+            if not line.strip():
+                continue
+            try:
+                request = json.loads(line)
+                response = {"ok": True, **self.server.dispatch(request)}
+            except Exception as error:
+                response = {"ok": False, "error": f"{type(error).__name__}: {error}"}
+            self.wfile.write((json.dumps(response) + "\n").encode(ENCODING))
+            self.wfile.flush()
+            if response.get("shutdown"):
+                # shutdown waits for the serve_forever loop, not this handler
+                threading.Thread(target=self.server.shutdown).start()
+                return
+
+
+class GenerationServer(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    """
+    Long running vector file generation service on a Unix socket.
+
+    The toolkit modules stay imported and the max_bases most recently used bases are
+    kept in memory, keyed by FreeDiffusionTool.basis_key. Every connection is
+    handled in its own thread. Concurrent requests for the same basis wait for the
+    first one instead of optimizing it again.
+
+    Commands:
+        ping: check that the daemon is running.
+        create: b_values, n_dims, vendor, filename, options, exports; writes the
+            vector file (and exports) and returns the written files.
+        validate: filename; parses a Siemens vector file and returns its header.
+        stats: number of handled requests and cached bases.
+        shutdown: stop the server.
+    """
+
+    daemon_threads = True
+    request_queue_size = 128
+
+    def __init__(self, path: Path | None = None, max_bases: int = 128):
+        path = Path(path) if path is not None else default_socket_path()
+        if path.exists():
+            if is_running(path):
+                raise RuntimeError(f"A daemon is already listening on {path}.")
+            # left over from a daemon that was killed
+            path.unlink()
+        self.path = path
+        self.bases = OrderedDict()
+        self.max_bases = max_bases
+        self.n_requests = 0
+        self._lock = threading.Lock()
+        self._basis_locks = dict()
+        super().__init__(str(path), _RequestHandler)
+
+    def server_bind(self):
+        # bind creates the socket file with the umask permissions, only the owner
+        # may connect from the start
+        umask = os.umask(0o177)
+        try:
+            super().server_bind()
+        finally:
+            os.umask(umask)
+
+    def server_close(self):
+        super().server_close()
+        self.path.unlink(missing_ok=True)
+
+    def dispatch(self, request: dict) -> dict:
+        with self._lock:
+            self.n_requests += 1
+        command = request.get("command")
+        if command == "ping":
+            return {"pid": os.getpid()}
+        if command == "create":
+            return self.create(request)
+        if command == "validate":
+            return self.validate(request)
+        if command == "stats":
+            return {"requests": self.n_requests, "bases": len(self.bases)}
+        if command == "shutdown":
+            return {"shutdown": True}
+        raise ValueError(f"Unknown command {command}.")
+
+    def basis_vectors(self, tool):
+        key = (type(tool).__name__, tool.basis_key())
+        with self._lock:
+            basis_lock = self._basis_locks.setdefault(key, threading.Lock())
+        with basis_lock:
+            with self._lock:
+                basis = self.bases.get(key)
+                if basis is not None:
+                    self.bases.move_to_end(key)
+            if basis is None:
+                try:
+                    basis = tool.get_basis_vectors()
+                except BaseException:
+                    # failed bases are not stored, neither is their lock
+                    with self._lock:
+                        self._basis_locks.pop(key, None)
+                    raise
+                self._remember(key, basis)
+        return basis
+
+    def _remember(self, key: tuple, basis) -> None:
+        with self._lock:
+            self.bases[key] = basis
+            self.bases.move_to_end(key)
+            while len(self.bases) > self.max_bases:
+                evicted, _ = self.bases.popitem(last=False)
+                self._basis_locks.pop(evicted, None)
+
+    def create(self, request: dict) -> dict:
+        from .batch import BatchJob
+        from .cli import vendor_format
+        from .writers import export
+
+        start = time.perf_counter()
+        job = BatchJob(
+            request["b_values"],
+            int(request["n_dims"]),
+            Path(request["filename"]),
+            request.get("vendor", "Siemens"),
+            request.get("options", {}),
+        )
+        tool = job.create_tool()
+        tool.basis_vectors = self.basis_vectors(tool)
+        files = export(
+            tool,
+            [(vendor_format(job.vendor), job.filename)] + request.get("exports", []),
+        )
+        return {
+            "files": [str(file) for file in files],
+            "seconds": time.perf_counter() - start,
+        }
+
+    def validate(self, request: dict) -> dict:
+        from .siemens_tools import read_vector_file
+
+        vectors, header = read_vector_file(Path(request["filename"]))
+        return {"header": header, "n_vectors": len(vectors)}
+
+
+def serve(path: Path | None = None) -> None:
+    """Run the generation daemon until it receives a shutdown request."""
+    with GenerationServer(path) as server:
+        try:
+            server.serve_forever()
+        finally:
+            server.server_close()
+
+
+class DaemonClient:
+    """Thin client of the generation daemon. See GenerationServer for the commands."""
+
+    def __init__(self, path: Path | None = None, timeout: float | None = 600):
+        self.path = Path(path) if path is not None else default_socket_path()
+        self.timeout = timeout
+
+    def request(self, command: str, **kwargs) -> dict:
+        """
+        Send one request and wait for the response.
+
+        Raises OSError if the daemon is not reachable and DaemonError if the request
+        failed inside the daemon.
+        """
+        with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as connection:
+            connection.settimeout(self.timeout)
+            connection.connect(str(self.path))
+            message = json.dumps({"command": command, **kwargs}) + "\n"
+            connection.sendall(message.encode(ENCODING))
+            with connection.makefile("rb") as stream:
+                line = stream.readline()
+        if not line:
+            raise ConnectionError("The daemon closed the connection.")
+        response = json.loads(line)
+        if not response.pop("ok"):
+            raise DaemonError(response["error"])
+        return response
+
+    def create(
+        self,
+        b_values: list,
+        n_dims: int,
+        vendor: str,
+        filename: Path,
+        exports: list | None = None,
+        **options,
+    ) -> list[Path]:
+        """Let the daemon create a vector file. Relative paths refer to this process."""
+        response = self.request(
+            "create",
+            b_values=list(b_values),
+            n_dims=n_dims,
+            vendor=vendor,
+            filename=str(Path(filename).resolve()),
+            exports=[_absolute_export(export) for export in exports or []],
+            options=options,
+        )
+        return [Path(file) for file in response["files"]]
+
+    def validate(self, filename: Path) -> dict:
+        return self.request("validate", filename=str(Path(filename).resolve()))
+
+    def shutdown(self) -> None:
+        self.request("shutdown")
+
+
+def _absolute_export(export: str) -> str:
+    name, separator, filename = export.partition(":")
+    if separator and len(name) > 1:
+        return f"{name}:{Path(filename).resolve()}"
+    return str(Path(export).resolve())
+
+
+def is_running(path: Path | None = None) -> bool:
+    """Check whether a daemon answers on the socket."""
+    try:
+        DaemonClient(path, timeout=1).request("ping")
+        return True
+    except (OSError, ValueError, DaemonError):
+        return False
@@ -0,0 +1,225 @@
+from dataclasses import dataclass
+from pathlib import Path
+
+import numpy as np
+
+# Increase whenever the stored direction sets change.
+LIBRARY_VERSION = 2
+MAX_LIBRARY_DIRECTIONS = 256
+LIBRARY_FILE = Path(__file__).parent / "data" / f"directions_v{LIBRARY_VERSION}.npy"
+
+_library = None
+
+
+def _offset(n_dims: int) -> int:
+    """Row of the first vector of the n_dims set. Sets are stored consecutively from 1."""
+    return n_dims * (n_dims - 1) // 2
+
+
+def load_library() -> np.ndarray | None:
+    """Memory map the packaged direction library on first use."""
+    global _library
+    if _library is None and LIBRARY_FILE.is_file():
+        _library = np.load(LIBRARY_FILE, mmap_mode="r")
+    return _library
+
+
+def in_library(n_dims: int) -> bool:
+    """Check whether a pre-optimized set with n_dims directions is packaged."""
+    if not isinstance(n_dims, (int, np.integer)):
+        return False
+    if not 1 <= n_dims <= MAX_LIBRARY_DIRECTIONS:
+        return False
+    library = load_library()
+    return library is not None and library.shape[0] >= _offset(n_dims + 1)
+
+
+def library_directions(n_dims: int) -> np.ndarray | None:
+    """
+    Look up the pre-optimized direction set with n_dims directions.
+
+    Returns None if n_dims is not part of the packaged library.
+    """
+    if not in_library(n_dims):
+        return None
+    # stored as float32, normalized again in float64 precision
+    points = np.array(
+        load_library()[_offset(n_dims) : _offset(n_dims + 1)], dtype=np.float64
+    )
+    return points / np.linalg.norm(points, axis=1, keepdims=True)
+
+
+def electrostatic_energy(points: np.ndarray, antipodal: bool = True) -> float:
+    """
+    Electrostatic energy of unit vectors as used by qspace.
+
+    Sum of 1 / |u - v|^2 (and 1 / |u + v|^2 if antipodal) over all pairs.
+    """
+    return _energy_and_gradient(np.asarray(points, dtype=np.float64), antipodal)[0]
+
+
+def _energy_and_gradient(
+    points: np.ndarray, antipodal: bool = True, fixed: np.ndarray | None = None
+) -> tuple[float, np.ndarray]:
+    """Energy of the points and its gradient with regard to the points."""
+    n_points = points.shape[0]
+    others = points if fixed is None else np.concatenate((points, fixed))
+    energy = 0.0
+    gradient = np.zeros_like(points)
+    for sign in (1, -1) if antipodal else (1,):
+        diff = points[:, np.newaxis, :] - sign * others[np.newaxis, :, :]
+        dist2 = np.einsum("ijk,ijk->ij", diff, diff)
+        # exclude self interaction
+        dist2[np.arange(n_points), np.arange(n_points)] = np.inf
+        inv = 1.0 / dist2
+        # pairs between optimized points appear twice in the full matrix
+        weights = np.ones(others.shape[0])
+        weights[:n_points] = 0.5
+        energy += float((inv * weights).sum())
+        gradient -= 2 * np.einsum("ij,ijk->ik", inv**2, diff)
+    return energy, gradient
+
+
+@dataclass
+class OptimizationResult:
+    """Outcome of minimize_energy. points holds the fixed points followed by the new ones."""
+
+    points: np.ndarray
+    n_fixed: int
+    iterations: int
+    evaluations: int
+    energy: float
+    initial_energy: float
+
+    @property
+    def new_points(self) -> np.ndarray:
+        return self.points[self.n_fixed :]
+
+
+def minimize_energy(
+    n_points: int,
+    fixed: np.ndarray | None = None,
+    init_points: np.ndarray | None = None,
+    max_iter: int = 1000,
+    antipodal: bool = True,
+    seed: int | None = None,
+) -> OptimizationResult:
+    """
+    Minimize the electrostatic energy of n_points new directions on the unit sphere.
+
+    Uses the same energy as qspace for a single shell. Points are optimized
+    unconstrained and projected onto the sphere inside the objective.
+
+    Parameters:
+        n_points: int
+            Number of directions to optimize.
+        fixed: np.ndarray
+            Unit directions that repel the new ones but are not moved.
+        init_points: np.ndarray
+            Start values for the new directions, random if not given.
+        max_iter: int
+            Maximum number of optimizer iterations.
+        antipodal: bool
+            Treat u and -u as the same direction.
+        seed: int
+            Seed for the random start values.
+    """
+    from scipy.optimize import minimize
+
+    if init_points is None:
+        init_points = np.random.default_rng(seed).standard_normal((n_points, 3))
+    if fixed is not None:
+        fixed = np.asarray(fixed, dtype=np.float64).reshape(-1, 3)
+        if fixed.shape[0] == 0:
+            fixed = None
+
+    def objective(x: np.ndarray) -> tuple[float, np.ndarray]:
+        x = x.reshape(-1, 3)
+        norms = np.linalg.norm(x, axis=1, keepdims=True)
+        points = x / norms
+        energy, gradient = _energy_and_gradient(points, antipodal, fixed)
+        # project gradient onto the tangent plane and account for normalization
+        gradient = (
+            gradient - (gradient * points).sum(1, keepdims=True) * points
+        ) / norms
+        return energy, gradient.ravel()
+
+    x0 = np.asarray(init_points, dtype=np.float64).ravel()
+    initial_energy = objective(x0)[0]
+    result = minimize(
+        objective,
+        x0,
+        jac=True,
+        method="L-BFGS-B",
+        options={"maxiter": max_iter, "gtol": 1e-10, "ftol": 1e-15},
+    )
+    points = result.x.reshape(-1, 3)
+    points = points / np.linalg.norm(points, axis=1, keepdims=True)
+
+    # the interaction between fixed points is constant but part of the total energy
+    fixed_energy = 0.0
+    if fixed is not None:
+        fixed_energy = electrostatic_energy(fixed, antipodal)
+        points = np.concatenate((fixed, points))
+    return OptimizationResult(
+        points=points,
+        n_fixed=0 if fixed is None else fixed.shape[0],
+        iterations=int(result.nit),
+        evaluations=int(result.nfev),
+        energy=float(result.fun) + fixed_energy,
+        initial_energy=initial_energy + fixed_energy,
+    )
+
+
+def optimize_directions(
+    n_dims: int,
+    init_points: np.ndarray | None = None,
+    max_iter: int = 1000,
+    antipodal: bool = True,
+    seed: int | None = None,
+) -> np.ndarray:
+    """Optimized set of n_dims directions. See minimize_energy."""
+    return minimize_energy(
+        n_dims,
+        init_points=init_points,
+        max_iter=max_iter,
+        antipodal=antipodal,
+        seed=seed,
+    ).points
+
+
+def unique_directions(vectors: np.ndarray, decimals: int = 6) -> np.ndarray:
+    """
+    Extract the distinct unit directions of a (scaled) vector set.
+
+    Zero vectors are dropped and directions repeated for several b_values are
+    returned once, keeping the order of their first appearance.
+    """
+    vectors = np.asarray(vectors, dtype=np.float64).reshape(-1, 3)
+    norms = np.linalg.norm(vectors, axis=1)
+    directions = vectors[norms > 0] / norms[norms > 0, np.newaxis]
+    _, first = np.unique(np.round(directions, decimals), axis=0, return_index=True)
+    return directions[np.sort(first)]
+
+
+def build_library(
+    max_directions: int = MAX_LIBRARY_DIRECTIONS,
+    filename: Path = LIBRARY_FILE,
+    n_starts: int = 4,
+) -> None:
+    """
+    Create the packaged direction library.
+
+    Every set is optimized from several random starts and the lowest energy solution
+    is stored. Increase LIBRARY_VERSION when regenerating the file with new content.
+    """
+    sets = list()
+    for n_dims in range(1, max_directions + 1):
+        candidates = [
+            optimize_directions(n_dims, max_iter=5000, seed=n_dims * n_starts + start)
+            for start in range(n_starts)
+        ]
+        sets.append(min(candidates, key=electrostatic_energy))
+    filename.parent.mkdir(parents=True, exist_ok=True)
+    # float32 is far more precise than the 6 decimals of the vector files
+    np.save(filename, np.concatenate(sets).astype(np.float32))
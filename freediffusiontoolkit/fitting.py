@@ -0,0 +1,317 @@
+import os
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+import numpy as np
+
+from . import profiling
+from .trace import nifti_stem, read_bval
+
+MIN_SIGNAL = 1e-6
+
+
+def gradient_table_from_vectors(
+    vectors: np.ndarray, b_max: float, length_scaling: str = "linear"
+) -> tuple[np.ndarray, np.ndarray]:
+    """
+    Convert a toolkit vector set into b_values and unit directions.
+
+    FreeDiffusionTool scales the vectors linearly with b_value / b_max, so by default
+    b = b_max * |v|. Use length_scaling="quadratic" for files where b = b_max * |v|^2.
+    Zero vectors get b = 0 and a zero direction.
+    """
+    vectors = np.asarray(vectors, dtype=np.float64).reshape(-1, 3)
+    norms = np.linalg.norm(vectors, axis=1)
+    if length_scaling == "linear":
+        b_values = b_max * norms
+    elif length_scaling == "quadratic":
+        b_values = b_max * norms**2
+    else:
+        raise ValueError(f"Unknown length_scaling {length_scaling}.")
+    directions = np.zeros_like(vectors)
+    nonzero = norms > 0
+    directions[nonzero] = vectors[nonzero] / norms[nonzero, np.newaxis]
+    return b_values, directions
+
+
+def vector_file_b_values(header: dict, n_vectors: int) -> np.ndarray:
+    """
+    b_value of every vector of a file written by FreeDiffusionTool.
+
+    The b_values and n_dims or points_per_shell of the header are expanded like
+    FreeDiffusionTool.vector_b_values, so vectors shortened with scale_by_value still
+    get their nominal b_values.
+    """
+    from .siemens_tools import BasicSiemensTool
+
+    if "b_values" not in header or not (
+        "n_dims" in header or "points_per_shell" in header
+    ):
+        raise ValueError("b_max is needed for vector files without b_values.")
+    tool = BasicSiemensTool(
+        header["b_values"],
+        header.get("n_dims"),
+        points_per_shell=header.get("points_per_shell"),
+    )
+    b_values = tool.vector_b_values()
+    if b_values.size != n_vectors:
+        raise ValueError(
+            f"The header describes {b_values.size} vectors but the file has "
+            f"{n_vectors}, pass b_max."
+        )
+    return b_values
+
+
+def read_bvec(bvec_file: Path) -> np.ndarray:
+    """Read an FSL .bvec file (3 rows) as array of shape (n, 3)."""
+    bvecs = np.loadtxt(bvec_file, ndmin=2)
+    return bvecs.T if bvecs.shape[0] == 3 else bvecs
+
+
+def design_matrix(
+    b_values: np.ndarray, directions: np.ndarray | None = None, model: str = "tensor"
+) -> np.ndarray:
+    """
+    Design matrix of the log-linear signal model.
+
+    adc: log(S) = log(S0) - b * ADC, coefficients (log(S0), ADC).
+    tensor: log(S) = log(S0) - b g^T D g, coefficients
+        (log(S0), Dxx, Dyy, Dzz, Dxy, Dxz, Dyz).
+    """
+    b_values = np.asarray(b_values, dtype=np.float64).reshape(-1)
+    if model == "adc":
+        return np.stack((np.ones_like(b_values), -b_values), axis=1)
+    if model != "tensor":
+        raise ValueError(f"Unknown model {model}.")
+    if directions is None:
+        raise ValueError("The tensor model needs gradient directions.")
+    g = np.asarray(directions, dtype=np.float64).reshape(-1, 3)
+    return np.stack(
+        (
+            np.ones_like(b_values),
+            -b_values * g[:, 0] ** 2,
+            -b_values * g[:, 1] ** 2,
+            -b_values * g[:, 2] ** 2,
+            -2 * b_values * g[:, 0] * g[:, 1],
+            -2 * b_values * g[:, 0] * g[:, 2],
+            -2 * b_values * g[:, 1] * g[:, 2],
+        ),
+        axis=1,
+    )
+
+
+def fit_voxels(
+    signals: np.ndarray,
+    design: np.ndarray,
+    pseudo_inverse: np.ndarray | None = None,
+    weighted: bool = False,
+) -> np.ndarray:
+    """
+    Fit the log-linear model to a chunk of voxels.
+
+    Ordinary least squares is one matrix product with the precomputed pseudo-inverse.
+    The weighted fit uses the OLS prediction as weights (S^2) and solves the weighted
+    normal equations of all voxels in one batched call.
+
+    Parameters:
+        signals: np.ndarray
+            Array of shape (voxels, measurements).
+        design: np.ndarray
+            Design matrix of shape (measurements, coefficients).
+        pseudo_inverse: np.ndarray
+            np.linalg.pinv(design), computed if not given.
+        weighted: bool
+            Use weighted least squares.
+
+    Returns:
+        Coefficients of shape (voxels, coefficients).
+    """
+    if pseudo_inverse is None:
+        pseudo_inverse = np.linalg.pinv(design)
+    log_signals = np.log(np.maximum(np.asarray(signals, dtype=np.float64), MIN_SIGNAL))
+    coefficients = log_signals @ pseudo_inverse.T
+    if not weighted:
+        return coefficients
+
+    if np.linalg.matrix_rank(design) < design.shape[1]:
+        raise ValueError("The weighted fit needs a design matrix of full rank.")
+    # weights S^2 of the OLS prediction, scaled per voxel to avoid overflow
+    log_weights = 2 * (coefficients @ design.T)
+    weights = np.exp(log_weights - log_weights.max(axis=1, keepdims=True))
+    normal = np.einsum("mi,vm,mj->vij", design, weights, design)
+    rhs = np.einsum("mi,vm->vi", design, weights * log_signals)
+    return np.linalg.solve(normal, rhs[..., np.newaxis])[..., 0]
+
+
+def tensor_metrics(coefficients: np.ndarray) -> tuple[np.ndarray, np.ndarray]:
+    """Mean diffusivity and fractional anisotropy of tensor coefficients."""
+    tensors = np.empty(coefficients.shape[:-1] + (3, 3))
+    dxx, dyy, dzz, dxy, dxz, dyz = np.moveaxis(coefficients[..., 1:7], -1, 0)
+    tensors[..., 0, 0], tensors[..., 1, 1], tensors[..., 2, 2] = dxx, dyy, dzz
+    tensors[..., 0, 1] = tensors[..., 1, 0] = dxy
+    tensors[..., 0, 2] = tensors[..., 2, 0] = dxz
+    tensors[..., 1, 2] = tensors[..., 2, 1] = dyz
+    eigenvalues = np.linalg.eigvalsh(tensors)
+    md = eigenvalues.mean(-1)
+    with np.errstate(invalid="ignore", divide="ignore"):
+        fa = np.sqrt(1.5 * ((eigenvalues - md[..., np.newaxis]) ** 2).sum(-1)) / (
+            np.sqrt((eigenvalues**2).sum(-1))
+        )
+    return md, np.nan_to_num(fa)
+
+
+def fit_array(
+    data: np.ndarray,
+    b_values: np.ndarray,
+    directions: np.ndarray | None = None,
+    mask: np.ndarray | None = None,
+    weighted: bool = False,
+    chunk_size: int = 2**14,
+    max_workers: int | None = None,
+) -> dict:
+    """
+    Voxel-wise ADC and (if directions are given) tensor fit of a 4D array.
+
+    Voxels are processed in chunks spread over a thread pool, numpy releases the
+    GIL for the matrix products. Voxels outside mask are 0.
+
+    Returns:
+        dict with the maps "S0" and "ADC", plus "MD" and "FA" for the tensor fit.
+    """
+    spatial_shape = data.shape[:-1]
+    n_measurements = data.shape[-1]
+    if n_measurements != np.size(b_values):
+        raise ValueError(
+            f"Data contains {n_measurements} volumes but {np.size(b_values)} b_values."
+        )
+    # Fortran ordered (e.g. NIfTI) data is reshaped without a copy
+    order = "F" if data.flags.f_contiguous and not data.flags.c_contiguous else "C"
+    signals = data.reshape(-1, n_measurements, order=order)
+    if mask is None:
+        voxels = np.arange(signals.shape[0])
+    else:
+        voxels = np.flatnonzero(np.asarray(mask).reshape(-1, order=order))
+
+    designs = {"adc": design_matrix(b_values, model="adc")}
+    if directions is not None:
+        designs["tensor"] = design_matrix(b_values, directions, model="tensor")
+    inverses = {model: np.linalg.pinv(design) for model, design in designs.items()}
+
+    maps = {
+        name: np.zeros(signals.shape[0], dtype=np.float32) for name in ("S0", "ADC")
+    }
+    if directions is not None:
+        maps.update(
+            {
+                name: np.zeros(signals.shape[0], dtype=np.float32)
+                for name in ("MD", "FA")
+            }
+        )
+
+    def fit_chunk(chunk: np.ndarray) -> None:
+        chunk_signals = signals[chunk]
+        coefficients = fit_voxels(
+            chunk_signals, designs["adc"], inverses["adc"], weighted
+        )
+        maps["S0"][chunk] = np.exp(coefficients[:, 0])
+        maps["ADC"][chunk] = coefficients[:, 1]
+        if directions is not None:
+            coefficients = fit_voxels(
+                chunk_signals, designs["tensor"], inverses["tensor"], weighted
+            )
+            maps["MD"][chunk], maps["FA"][chunk] = tensor_metrics(coefficients)
+
+    chunks = [
+        voxels[start : start + chunk_size]
+        for start in range(0, voxels.size, chunk_size)
+    ]
+    if max_workers is None:
+        max_workers = os.cpu_count() or 1
+    with (
+        profiling.span("fit_array", voxels=int(voxels.size)),
+        ThreadPoolExecutor(max_workers=max(1, max_workers)) as executor,
+    ):
+        list(executor.map(fit_chunk, chunks))
+    profiling.count("voxels_fitted", int(voxels.size))
+
+    return {
+        name: values.reshape(spatial_shape, order=order)
+        for name, values in maps.items()
+    }
+
+
+def fit_image(
+    nifti_file: Path,
+    vector_file: Path | None = None,
+    bval_file: Path | None = None,
+    bvec_file: Path | None = None,
+    b_max: float | None = None,
+    mask_file: Path | None = None,
+    output_prefix: Path | None = None,
+    weighted: bool = False,
+    length_scaling: str = "linear",
+    **kwargs,
+) -> dict:
+    """
+    Fit ADC, MD and FA maps of a 4D NIfTI and write them as NIfTI files.
+
+    The gradient table is taken from a Siemens vector file (read with
+    BasicSiemensTool.load) or from FSL .bval/.bvec files. Without directions only the
+    ADC is fitted. Without b_max the b_values of a vector file are taken from its
+    header, see vector_file_b_values. With b_max they follow from the vector lengths,
+    see gradient_table_from_vectors.
+
+    Returns:
+        dict mapping the map names to the written files <output_prefix>_<name>.nii.gz.
+    """
+    import nibabel as nib
+
+    from .nifti import open_nifti
+
+    nifti_file = Path(nifti_file)
+    stem = nifti_stem(nifti_file)
+    directions = None
+    if vector_file is not None:
+        from .siemens_tools import BasicSiemensTool
+
+        tool = BasicSiemensTool()
+        header = tool.load(Path(vector_file))
+        if b_max is None:
+            # the vector lengths depend on scale_by_value, which is not stored
+            b_values = vector_file_b_values(header, len(tool.vectors))
+            directions = gradient_table_from_vectors(tool.vectors, 1.0)[1]
+        else:
+            b_values, directions = gradient_table_from_vectors(
+                tool.vectors, b_max, length_scaling
+            )
+    else:
+        if bval_file is None:
+            bval_file = nifti_file.with_name(f"{stem}.bval")
+        b_values = read_bval(bval_file)
+        if bvec_file is None and nifti_file.with_name(f"{stem}.bvec").is_file():
+            bvec_file = nifti_file.with_name(f"{stem}.bvec")
+        if bvec_file is not None:
+            directions = read_bvec(bvec_file)
+
+    image = open_nifti(nifti_file)
+    mask = None
+    if mask_file is not None:
+        from .masks import load_mask
+
+        mask = load_mask(mask_file) > 0
+    maps = fit_array(
+        np.asanyarray(image.dataobj),
+        b_values,
+        directions,
+        mask=mask,
+        weighted=weighted,
+        **kwargs,
+    )
+
+    if output_prefix is None:
+        output_prefix = nifti_file.with_name(stem)
+    files = dict()
+    for name, values in maps.items():
+        files[name] = Path(f"{output_prefix}_{name}.nii.gz")
+        nib.save(nib.Nifti1Image(values, image.affine), files[name])
+    return files
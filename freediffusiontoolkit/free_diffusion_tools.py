@@ -1,11 +1,37 @@
+import hashlib
 from abc import abstractmethod
 from pathlib import Path
 
 import numpy as np
-from qspace.sampling import multishell as ms
+
+from . import profiling
+from .cache import BasisCache, basis_cache
+from .directions import (
+    LIBRARY_VERSION,
+    OptimizationResult,
+    in_library,
+    library_directions,
+    minimize_energy,
+    unique_directions,
+)
+from .protocol import Protocol
+
+
+def _fit_init_points(init_points: np.ndarray, n_points: int) -> np.ndarray:
+    """Truncate or pad a previous solution with random unit vectors to n_points rows."""
+    init_points = np.asarray(init_points, dtype=np.float64).reshape(-1, 3)[:n_points]
+    if init_points.shape[0] < n_points:
+        extra = np.random.standard_normal((n_points - init_points.shape[0], 3))
+        extra /= np.linalg.norm(extra, axis=1, keepdims=True)
+        init_points = np.concatenate((init_points, extra))
+    return init_points
 
 
 class FreeDiffusionTool:
+    # printf style template of one vector line taking the row index and the x, y
+    # and z component, used by vectors_to_string. Must match vector_to_string.
+    vector_format: str | None = None
+
     def __init__(
         self,
         b_values: list | np.ndarray = np.array([0, 1000]),
@@ -13,11 +39,34 @@ class FreeDiffusionTool:
         **kwargs,
     ):
         self.options = kwargs
+        self.vectors = None
+        self._points_per_shell = None
         self.b_values = b_values
         self.n_dims = n_dims
-        self.vectors = None
+        self.points_per_shell = kwargs.get("points_per_shell", None)
         self._scale_by_value = kwargs.get("scale_by_value", None)
 
+    @classmethod
+    def from_protocol(cls, protocol: Protocol, **kwargs) -> "FreeDiffusionTool":
+        """
+        Tool holding the vectors of a protocol, e.g. to save them in its format.
+
+        Protocols with equally sized, distinct shells become single-shell tools,
+        all others multi-shell tools with points_per_shell.
+        """
+        b_values = [
+            int(b_value) if b_value.is_integer() else b_value
+            for b_value in protocol.shell_b_values
+        ]
+        sizes = protocol.points_per_shell
+        if len(set(sizes)) == 1 and len(set(b_values)) == len(b_values):
+            tool = cls(b_values, sizes[0], **kwargs)
+        else:
+            tool = cls(b_values, None, **{**kwargs, "points_per_shell": sizes})
+        tool.vectors = protocol.vectors
+        tool._protocol = protocol
+        return tool
+
     @property
     def vectors(self):
         if self._vectors is None:
@@ -27,6 +76,86 @@ class FreeDiffusionTool:
     @vectors.setter
     def vectors(self, vectors: np.ndarray):
         self._vectors = vectors
+        self._protocol = None
+
+    def protocol(self) -> Protocol:
+        """
+        The vectors of the tool as immutable, hashable Protocol.
+
+        The protocol is created once and reused until b_values, n_dims,
+        points_per_shell, scale_by_value, the basis or the vectors change.
+        """
+        if self._protocol is None:
+            self._protocol = Protocol.from_tool(self)
+        return self._protocol
+
+    @property
+    def b_values(self):
+        return self._b_values
+
+    @b_values.setter
+    def b_values(self, b_values: list | np.ndarray):
+        self._b_values = b_values
+        if self.multi_shell:
+            # the multi-shell basis has zero rows for the b_value 0 shells
+            self.basis_vectors = None
+        self.vectors = None
+
+    @property
+    def n_dims(self):
+        return self._n_dims
+
+    @n_dims.setter
+    def n_dims(self, n_dims: int | None):
+        self._n_dims = n_dims
+        # basis depends on the number of dimensions
+        self.basis_vectors = None
+
+    @property
+    def points_per_shell(self) -> list | None:
+        """
+        Number of directions for every b_value in multi-shell mode.
+
+        If set, all shells with a b_value > 0 are optimized jointly instead of scaling
+        one set of n_dims directions. Shells with b_value 0 get zero vectors.
+        """
+        return self._points_per_shell
+
+    @points_per_shell.setter
+    def points_per_shell(self, points_per_shell: list | None):
+        if points_per_shell is not None:
+            points_per_shell = [int(points) for points in points_per_shell]
+        self._points_per_shell = points_per_shell
+        self.basis_vectors = None
+
+    @property
+    def multi_shell(self) -> bool:
+        return self._points_per_shell is not None
+
+    @property
+    def n_directions(self) -> int:
+        """Total number of vectors written to the file."""
+        if self.multi_shell:
+            return sum(self.points_per_shell)
+        return len(self.b_values) * self.n_dims
+
+    @property
+    def basis_vectors(self) -> np.ndarray:
+        """Basis vectors of the tool, calculated once and reused afterwards."""
+        if self._basis_vectors is None:
+            with profiling.span("get_basis_vectors", tool=type(self).__name__):
+                self._basis_vectors = self.get_basis_vectors()
+        return self._basis_vectors
+
+    @basis_vectors.setter
+    def basis_vectors(self, vectors: np.ndarray | None):
+        self._basis_vectors = vectors
+        # a basis set from outside is no longer described by the options
+        self._explicit_basis = None
+        if vectors is not None:
+            data = np.ascontiguousarray(vectors, dtype=np.float64)
+            self._explicit_basis = hashlib.sha256(data.tobytes()).hexdigest()
+        self.vectors = None
 
     @property
     def scale_by_value(self):
@@ -35,82 +164,353 @@ class FreeDiffusionTool:
     @scale_by_value.setter
     def scale_by_value(self, value):
         self._scale_by_value = value
+        self.vectors = None
+
+    @property
+    def basis_cache(self) -> BasisCache | None:
+        """Cache used for optimized basis vectors. Pass basis_cache=None to disable."""
+        return self.options.get("basis_cache", basis_cache)
+
+    @property
+    def use_library(self) -> bool:
+        """Look up pre-optimized directions first. Pass use_library=False to disable."""
+        return (
+            self.options.get("use_library", True)
+            and not self.multi_shell
+            and in_library(self.n_dims)
+        )
+
+    def basis_key(self) -> tuple:
+        """
+        Hashable description of the basis. Tools with equal keys share basis vectors.
+
+        A basis assigned to basis_vectors or created by extend_basis is identified by
+        the hash of its vectors.
+        """
+        if self._explicit_basis is not None:
+            return "explicit", self._explicit_basis
+        if self.multi_shell:
+            return (
+                "qspace",
+                tuple(self.points_per_shell),
+                tuple(np.asarray(self.b_values).reshape(-1) > 0),
+                tuple(np.ravel(self.options.get("coupling_weights", ()))),
+                self.options.get("max_iter", 1000),
+            )
+        if self.use_library:
+            return "library", LIBRARY_VERSION, self.n_dims
+        return "qspace", self.n_dims, self.options.get("max_iter", 1000)
 
     def get_basis_vectors(self) -> np.ndarray:
-        """Calculate Basis vectors according to qspace from E. Caruyer"""
-        nb_shells = 1
-        points_per_shell = [self.n_dims]
+        """
+        Calculate Basis vectors according to qspace from E. Caruyer
+
+        Packaged pre-optimized direction sets are used if available. Otherwise optimized
+        points are looked up in the basis cache first and only computed on a miss.
+        """
+        if self.multi_shell:
+            return self.get_multi_shell_basis_vectors()
+        if self.use_library:
+            return library_directions(self.n_dims)
+
+        return self.optimize_basis(
+            [self.n_dims], init_points=self.options.get("init_points", None)
+        )
+
+    def extend_basis(
+        self,
+        n_new: int,
+        fixed: np.ndarray | None = None,
+        keep_fixed: bool = True,
+        max_iter: int = 1000,
+        seed: int | None = None,
+    ) -> OptimizationResult:
+        """
+        Add directions to an existing basis without starting from scratch.
+
+        With keep_fixed the existing directions stay untouched and only the new ones
+        are optimized. Otherwise all directions are optimized, seeded with the existing
+        solution. The tool's basis and n_dims are updated with the result.
+
+        Parameters:
+            n_new: int
+                Number of directions to add.
+            fixed: np.ndarray
+                Existing directions, e.g. the vectors of a loaded file. Defaults to
+                the current basis vectors. Zero rows and repeated directions of
+                several b_values are removed.
+            keep_fixed: bool
+                Keep existing directions fixed or only use them as warm start.
+            max_iter: int
+                Maximum number of optimizer iterations.
+            seed: int
+                Seed for the random start values of the new directions.
+
+        Returns:
+            OptimizationResult with iterations and energy of the optimization.
+        """
+        if self.multi_shell:
+            raise ValueError("Extending a basis is only supported for a single shell.")
+        if fixed is None:
+            fixed = self.basis_vectors
+        fixed = unique_directions(fixed)
+
+        with profiling.span("extend_basis", n_new=n_new, keep_fixed=keep_fixed):
+            if keep_fixed:
+                result = minimize_energy(
+                    n_new, fixed=fixed, max_iter=max_iter, seed=seed
+                )
+            else:
+                new_points = np.random.default_rng(seed).standard_normal((n_new, 3))
+                result = minimize_energy(
+                    fixed.shape[0] + n_new,
+                    init_points=np.concatenate((fixed, new_points)),
+                    max_iter=max_iter,
+                )
+        profiling.count("optimizer_iterations", result.iterations)
+
+        self.n_dims = result.points.shape[0]
+        self.basis_vectors = result.points
+        self.vectors = None
+        return result
+
+    def get_multi_shell_basis_vectors(self) -> np.ndarray:
+        """
+        Jointly optimize the directions of all shells with a b_value > 0.
+
+        Returns one row per output vector, rows of b_value 0 shells are zero.
+        """
+        points_per_shell = np.asarray(self.points_per_shell)
+        b_values = np.asarray(self.b_values, dtype=np.float64).reshape(-1)
+        if points_per_shell.size != b_values.size:
+            raise ValueError(
+                f"points_per_shell needs one entry per b_value ({b_values.size}), "
+                f"got {points_per_shell.size}."
+            )
+        rows = np.repeat(b_values > 0, points_per_shell)
+
+        init_points = self.options.get("init_points", None)
+        if init_points is not None:
+            init_points = np.asarray(init_points, dtype=np.float64).reshape(-1, 3)
+            if len(init_points) == rows.size:
+                # previous basis including the rows of b_value 0 shells
+                init_points = init_points[rows]
+            else:
+                # zero rows of b_value 0 shells are no valid directions
+                init_points = init_points[np.linalg.norm(init_points, axis=1) > 0]
+
+        basis = np.zeros((rows.size, 3))
+        basis[rows] = self.optimize_basis(
+            points_per_shell[b_values > 0].tolist(),
+            alphas=self.options.get("coupling_weights", None),
+            init_points=init_points,
+        )
+        return basis
+
+    def optimize_basis(
+        self,
+        points_per_shell: list,
+        alphas: list | np.ndarray | None = None,
+        init_points: np.ndarray | None = None,
+    ) -> np.ndarray:
+        """
+        Optimize one or more jointly coupled shells with qspace.
+
+        Parameters:
+            points_per_shell: list
+                Number of directions of every shell.
+            alphas: list
+                Coupling weights, one per shell followed by one for all shells combined.
+                Defaults to ones.
+            init_points: np.ndarray
+                Previous solution used as warm start. Rows are truncated or padded with
+                random directions to match the number of points. Warm starts do not
+                change the cache key.
+        """
+        # qspace (and scipy) are only imported if an optimization is needed
+        from qspace.sampling import multishell as ms
+
+        max_iter = self.options.get("max_iter", 1000)
+        nb_shells = len(points_per_shell)
         # Groups of shells and coupling weights
         shell_groups = [[i] for i in range(nb_shells)]
         shell_groups.append(list(range(nb_shells)))  # range(nb_shells)
-        alphas = np.ones(len(shell_groups))
+        if alphas is None:
+            alphas = np.ones(len(shell_groups))
         weights = ms.compute_weights(nb_shells, points_per_shell, shell_groups, alphas)
 
         # Where the optimized sampling scheme is computed
-        points = ms.optimize(nb_shells, points_per_shell, weights, max_iter=1000)
+        def optimize() -> np.ndarray:
+            # qspace does not report its iterations, max_iter is an upper bound
+            profiling.count("qspace_optimizations")
+            with profiling.span(
+                "qspace.optimize",
+                points_per_shell=list(points_per_shell),
+                max_iter=max_iter,
+            ):
+                if init_points is None:
+                    return ms.optimize(
+                        nb_shells, points_per_shell, weights, max_iter=max_iter
+                    )
+                return ms.optimize(
+                    nb_shells,
+                    points_per_shell,
+                    weights,
+                    max_iter=max_iter,
+                    init_points=_fit_init_points(init_points, sum(points_per_shell)),
+                )
 
-        return points
+        cache = self.basis_cache
+        if cache is None:
+            return optimize()
+        key = cache.make_key(points_per_shell, nb_shells, weights, max_iter)
+        return cache.get_or_compute(key, optimize)
 
-    def get_diffusion_vectors(self, scale_by_value: int | None = None) -> np.ndarray:
+    def get_diffusion_vectors(
+        self,
+        scale_by_value: int | None = None,
+        out: np.ndarray | None = None,
+        dtype: type | np.dtype = np.float64,
+    ) -> np.ndarray:
         """
         Calculate the diffusion vectors for the given number of dimensions and b_values.
 
+        The (reused) basis vectors are scaled for all b_values in one broadcasted
+        multiplication writing into a single output array.
+
         Parameters:
             scale_by_value: int
                 Select b_value for scaling the vector file if you don't want to use the highest.
+            out: np.ndarray
+                Optional C-contiguous buffer of shape (n_directions, 3) to write to.
+            dtype: np.dtype
+                Data type of the returned array (float32 or float64). Ignored if out is given.
         """
         if scale_by_value is None:
             scale_by_value = self._scale_by_value
 
-        diffusion_vectors = np.array([])
+        with profiling.span("get_diffusion_vectors"):
+            return self._diffusion_vectors(scale_by_value, out, dtype)
 
-        vectors = self.get_basis_vectors()
+    def _diffusion_vectors(
+        self, scale_by_value: int | None, out: np.ndarray | None, dtype: type | np.dtype
+    ) -> np.ndarray:
+        b_values = np.asarray(self.b_values, dtype=np.float64).reshape(-1)
+        vectors = self.basis_vectors
 
-        for b_value in self.b_values:
+        # Apply b_values to vector file as relative length
+        if not scale_by_value:
+            scaling = b_values / b_values[-1]
+        else:
+            scaling = b_values / scale_by_value
 
-            # Apply b_values to vector file as relative length
-            if not scale_by_value:
-                scaling = b_value / self.b_values[-1]
-            else:
-                scaling = b_value / scale_by_value
+        if self.multi_shell:
+            shape = vectors.shape
+        else:
+            shape = (b_values.size * vectors.shape[0], 3)
+        if out is None:
+            out = np.empty(shape, dtype=dtype)
+        elif out.shape != shape or not out.flags.c_contiguous:
+            raise ValueError(
+                f"Output buffer must be C-contiguous with shape {shape}, got {out.shape}."
+            )
 
-            if diffusion_vectors.size:
-                diffusion_vectors = np.concatenate(
-                    (diffusion_vectors, vectors * scaling)
-                )
-            else:
-                diffusion_vectors = vectors * scaling
+        if self.multi_shell:
+            # every shell has its own rows in the basis
+            np.multiply(
+                np.repeat(scaling, self.points_per_shell)[:, np.newaxis],
+                vectors,
+                out=out,
+            )
+        else:
+            np.multiply(
+                scaling[:, np.newaxis, np.newaxis],
+                vectors[np.newaxis, :, :],
+                out=out.reshape(b_values.size, vectors.shape[0], 3),
+            )
+        return out
 
-        return diffusion_vectors
+    async def aget_diffusion_vectors(
+        self, timeout: float | None = None, **kwargs
+    ) -> np.ndarray:
+        """
+        get_diffusion_vectors for asyncio code.
+
+        Basis optimizations run in a worker process that is stopped on timeout or
+        cancellation. Concurrent calls for the same basis share one computation.
+        See aio.abasis_vectors.
+        """
+        from .aio import aget_diffusion_vectors
+
+        return await aget_diffusion_vectors(self, timeout, **kwargs)
+
+    async def asave(self, filename: Path, timeout: float | None = None) -> None:
+        """save for asyncio code, the file is written without blocking the loop."""
+        from .aio import asave
+
+        await asave(self, filename, timeout)
+
+    def vector_b_values(self) -> np.ndarray:
+        """b_value of every row of get_diffusion_vectors."""
+        b_values = np.asarray(self.b_values, dtype=np.float64).reshape(-1)
+        if self.multi_shell:
+            return np.repeat(b_values, self.points_per_shell)
+        return np.repeat(b_values, self.n_dims)
 
     @abstractmethod
     def construct_header(self, filename: Path):
         pass
 
+    def vectors_to_string(
+        self, diffusion_vectors: list | np.ndarray, newline: str = "\n"
+    ) -> str:
+        """
+        Format all vectors, each line terminated by newline.
+
+        Tools with a vector_format template format the whole array with a single
+        printf style operation, others call vector_to_string row by row.
+        """
+        with profiling.span("vectors_to_string"):
+            if self.vector_format is None:
+                return "".join(
+                    self.vector_to_string(row_idx, row) + newline
+                    for row_idx, row in enumerate(diffusion_vectors)
+                )
+            vectors = np.asarray(diffusion_vectors, dtype=np.float64)
+            vectors = vectors.reshape(len(vectors), -1)
+            n_vectors = vectors.shape[0]
+            values = np.empty((n_vectors, 4), dtype=np.float64)
+            values[:, 0] = np.arange(n_vectors)
+            values[:, 1:] = vectors[:, :3]
+            line = self.vector_format + newline
+            return (line * n_vectors) % tuple(values.ravel().tolist())
+
     def write(
-        self, filename: Path, header: list, diffusion_vectors: list | np.ndarray
+        self,
+        filename: Path,
+        header: list,
+        diffusion_vectors: list | np.ndarray | Protocol,
     ) -> None:
-        with filename.open("w") as file:
-            # write header to file
-            for line in header:
-                file.write(line + self.options.get("newline", "\n"))
-
-            # write values to file
-            for row_idx, row in enumerate(diffusion_vectors):
-                file.write(
-                    self.vector_to_string(row_idx, row)
-                    + self.options.get("newline", "\n")
-                )
+        if isinstance(diffusion_vectors, Protocol):
+            diffusion_vectors = diffusion_vectors.vectors
+        newline = self.options.get("newline", "\n")
+        # serialize header and values into one buffer and write it at once. The
+        # formatting is timed by the vectors_to_string span, the I/O by write.
+        with profiling.span("serialize"):
+            text = "".join(line + newline for line in header)
+            text += self.vectors_to_string(diffusion_vectors, newline=newline)
+            # encoded explicitly, newline is written as given on every platform
+            data = text.encode("utf-8")
+        with profiling.span("write", filename=str(filename)):
+            with filename.open("wb") as file:
+                file.write(data)
+        profiling.count("bytes_written", len(data))
 
     def save(self, filename: Path) -> None:
         # get Header
         header = self.construct_header(filename=filename)
-        # get diffusion values
-        diffusion_vectors = self.get_diffusion_vectors(
-            scale_by_value=self.scale_by_value
-        )
         # save to file
-        self.write(filename, header, diffusion_vectors)
+        self.write(filename, header, self.vectors)
 
     @abstractmethod
     def load(self, diffusion_vector_file: Path) -> None:
@@ -0,0 +1,122 @@
+from pathlib import Path
+
+import numpy as np
+
+from .trace import nifti_stem
+
+SIGNAL_LABEL = 1
+NOISE_LABEL = 2
+
+
+def _matlab_center(size: int) -> int:
+    """0-based index of Matlab's round(size / 2) (1-based, rounding half up)."""
+    return int(np.floor(size / 2 + 0.5)) - 1
+
+
+def roi_label_map(
+    shape: tuple,
+    radius: float,
+    inner_radius: float,
+    outer_radius: float,
+    slice_index: int = 1,
+) -> np.ndarray:
+    """
+    Signal circle and noise ring label map as in createMasks.m.
+
+    The circle (label 1) and ring (label 2) lie in the x-z plane around the image
+    center and are placed in a single slice along y. Labels add up where both
+    overlap, like in the Matlab version.
+
+    Parameters:
+        shape: tuple
+            Spatial shape (nx, ny, nz). Further dimensions are ignored.
+        radius: float
+            Radius of the signal circle in voxels.
+        inner_radius: float
+            Inner radius of the noise ring in voxels.
+        outer_radius: float
+            Outer radius of the noise ring in voxels.
+        slice_index: int
+            0-based y slice containing the ROIs (the second slice by default).
+
+    Returns:
+        uint8 array of shape (nx, ny, nz).
+    """
+    nx, ny, nz = shape[:3]
+    x = np.arange(nx)[:, np.newaxis] - _matlab_center(nx)
+    z = np.arange(nz)[np.newaxis, :] - _matlab_center(nz)
+    distance = x**2 + z**2
+
+    circle = distance <= radius**2
+    ring = (distance <= outer_radius**2) & (distance >= inner_radius**2)
+
+    labels = np.zeros((nx, ny, nz), dtype=np.uint8)
+    labels[:, slice_index, :] = circle * np.uint8(SIGNAL_LABEL) + ring * np.uint8(
+        NOISE_LABEL
+    )
+    return labels
+
+
+def broadcast_mask(mask: np.ndarray, n_volumes: int) -> np.ndarray:
+    """Read only 4D view repeating a 3D mask for every volume without copying."""
+    return np.broadcast_to(mask[..., np.newaxis], mask.shape + (n_volumes,))
+
+
+def load_mask(mask_file: Path) -> np.ndarray:
+    """Load a label mask. Legacy 4D masks are reduced to their first volume."""
+    import nibabel as nib
+
+    proxy = nib.load(mask_file).dataobj
+    if len(proxy.shape) == 4:
+        # only the first volume is read from legacy masks
+        return np.asanyarray(proxy[..., 0])
+    return np.asanyarray(proxy)
+
+
+def create_mask(
+    nifti_file: Path,
+    output_file: Path | None = None,
+    radius: float = 20,
+    inner_radius: float = 50,
+    outer_radius: float = 55,
+) -> Path:
+    """
+    Write the ROI label map of an image as compact 3D uint8 NIfTI.
+
+    Only the image header is read. Defaults match the parameters of main.m.
+    The mask is stored as <name>_mask.nii next to the image if no output_file is given.
+    """
+    import nibabel as nib
+
+    nifti_file = Path(nifti_file)
+    if output_file is None:
+        output_file = nifti_file.with_name(f"{nifti_stem(nifti_file)}_mask.nii")
+    image = nib.load(nifti_file)
+    labels = roi_label_map(image.shape, radius, inner_radius, outer_radius)
+    mask = nib.Nifti1Image(labels, image.affine)
+    mask.header.set_xyzt_units(*image.header.get_xyzt_units())
+    nib.save(mask, output_file)
+    return Path(output_file)
+
+
+def create_masks(
+    nifti_dir: Path,
+    result_dir: Path | None = None,
+    radius: float = 20,
+    inner_radius: float = 50,
+    outer_radius: float = 55,
+) -> list[Path]:
+    """Create masks for all *.nii.gz images of a folder (port of createMasks.m)."""
+    nifti_dir = Path(nifti_dir)
+    result_dir = Path(result_dir) if result_dir is not None else nifti_dir
+    result_dir.mkdir(parents=True, exist_ok=True)
+    return [
+        create_mask(
+            nifti_file,
+            result_dir / f"{nifti_stem(nifti_file)}_mask.nii",
+            radius,
+            inner_radius,
+            outer_radius,
+        )
+        for nifti_file in sorted(nifti_dir.glob("*.nii.gz"))
+    ]
@@ -0,0 +1,217 @@
+from dataclasses import dataclass
+
+import numpy as np
+
+from .directions import unique_directions
+from .fitting import (
+    design_matrix,
+    fit_voxels,
+    gradient_table_from_vectors,
+    tensor_metrics,
+)
+
+DEFAULT_EIGENVALUES = (1.7e-3, 0.3e-3, 0.3e-3)
+
+
+def _pair_chunks(n_points: int, chunk_size: int):
+    """Row ranges of the upper triangle of the pair matrix, chunk_size rows at once."""
+    for start in range(0, n_points, chunk_size):
+        yield start, min(n_points, start + chunk_size)
+
+
+def energy(
+    directions: np.ndarray, antipodal: bool = True, chunk_size: int = 512
+) -> float:
+    """
+    Electrostatic energy of unit directions, computed in row chunks.
+
+    Same value as directions.electrostatic_energy, but the pair matrix is never held
+    completely in memory: |u - v|^2 = 2 - 2 u.v is evaluated for chunk_size rows at
+    a time.
+    """
+    directions = np.asarray(directions, dtype=np.float64)
+    total = 0.0
+    for start, stop in _pair_chunks(directions.shape[0], chunk_size):
+        dots = directions[start:stop] @ directions[start:].T
+        # only pairs i < j
+        upper = np.triu(np.ones(dots.shape, dtype=bool), k=1)
+        for sign in (1, -1) if antipodal else (1,):
+            with np.errstate(divide="ignore"):
+                total += (1.0 / (2.0 - 2.0 * sign * dots[upper])).sum()
+    return float(total)
+
+
+def minimum_angle(
+    directions: np.ndarray, antipodal: bool = True, chunk_size: int = 512
+) -> float:
+    """
+    Smallest angle in degrees between two directions, computed in row chunks.
+
+    If antipodal, u and -u are the same direction, so angles are at most 90 degrees.
+    """
+    directions = np.asarray(directions, dtype=np.float64)
+    largest = -1.0
+    for start, stop in _pair_chunks(directions.shape[0], chunk_size):
+        dots = directions[start:stop] @ directions[start:].T
+        if antipodal:
+            dots = np.abs(dots)
+        upper = np.triu(np.ones(dots.shape, dtype=bool), k=1)
+        if upper.any():
+            largest = max(largest, float(dots[upper].max()))
+    if largest == -1.0:
+        return np.nan
+    return float(np.degrees(np.arccos(np.clip(largest, -1.0, 1.0))))
+
+
+def condition_number(b_values: np.ndarray, directions: np.ndarray) -> float:
+    """
+    Condition number of the tensor design matrix. Lower is more robust to noise.
+
+    Schemes that cannot determine all tensor coefficients give inf.
+    """
+    design = design_matrix(b_values, directions)
+    singular_values = np.linalg.svd(design, compute_uv=False)
+    if design.shape[0] < design.shape[1] or singular_values[-1] == 0:
+        return np.inf
+    return float(singular_values[0] / singular_values[-1])
+
+
+@dataclass
+class SchemeMetrics:
+    """Quality metrics of a diffusion vector set."""
+
+    n_directions: int
+    energy: float
+    minimum_angle: float
+    condition_number: float
+
+
+def scheme_metrics(
+    vectors: np.ndarray,
+    b_max: float,
+    antipodal: bool = True,
+    chunk_size: int = 512,
+    b0_volumes: int = 1,
+) -> SchemeMetrics:
+    """
+    Quality metrics of a vector set as returned by get_diffusion_vectors.
+
+    Energy and minimum angle use the distinct directions of all shells. The condition
+    number is computed for the full gradient table with b0_volumes additional b=0
+    volumes, which are usually acquired before the vector set.
+
+    Parameters:
+        vectors: np.ndarray
+            Vector set of shape (n, 3), scaled with b_value / b_max.
+        b_max: float
+            b_value of unit length vectors.
+    """
+    directions = unique_directions(vectors)
+    b_values, gradients = _with_b0(vectors, b_max, b0_volumes)
+    return SchemeMetrics(
+        directions.shape[0],
+        energy(directions, antipodal, chunk_size),
+        minimum_angle(directions, antipodal, chunk_size),
+        condition_number(b_values, gradients),
+    )
+
+
+def _with_b0(vectors: np.ndarray, b_max: float, b0_volumes: int):
+    b_values, directions = gradient_table_from_vectors(vectors, b_max)
+    return (
+        np.concatenate((np.zeros(b0_volumes), b_values)),
+        np.concatenate((np.zeros((b0_volumes, 3)), directions)),
+    )
+
+
+@dataclass
+class NoiseSimulation:
+    """FA and MD bias and spread of tensor fits of noisy synthetic signals."""
+
+    snr: float
+    fa: float
+    md: float
+    fa_bias: float
+    fa_std: float
+    md_bias: float
+    md_std: float
+
+
+def random_rotations(n_samples: int, rng: np.random.Generator) -> np.ndarray:
+    """Uniformly distributed rotation matrices of shape (n_samples, 3, 3)."""
+    q, r = np.linalg.qr(rng.normal(size=(n_samples, 3, 3)))
+    # fix the signs to get the Haar distribution
+    q *= np.sign(np.diagonal(r, axis1=1, axis2=2))[:, np.newaxis, :]
+    return q
+
+
+def simulate_noise(
+    b_values: np.ndarray,
+    directions: np.ndarray,
+    snr: float = 20,
+    n_samples: int = 10000,
+    eigenvalues: tuple = DEFAULT_EIGENVALUES,
+    weighted: bool = False,
+    seed: int | None = None,
+) -> NoiseSimulation:
+    """
+    Monte-Carlo noise propagation of a gradient table into FA and MD.
+
+    n_samples tensors with the given eigenvalues and random orientations are
+    simulated with Rician noise of standard deviation S0 / snr. All samples are
+    fitted in one batched call.
+
+    Parameters:
+        b_values: np.ndarray
+            b_value of every measurement, should contain b=0 volumes.
+        directions: np.ndarray
+            Unit gradient direction of every measurement.
+        snr: float
+            Signal to noise ratio of the b=0 signal.
+        n_samples: int
+            Number of simulated voxels.
+        eigenvalues: tuple
+            Eigenvalues of the true tensor.
+        weighted: bool
+            Use weighted least squares for the fit.
+        seed: int
+            Seed of the random generator.
+    """
+    rng = np.random.default_rng(seed)
+    b_values = np.asarray(b_values, dtype=np.float64).reshape(-1)
+    directions = np.asarray(directions, dtype=np.float64).reshape(-1, 3)
+    eigenvalues = np.asarray(eigenvalues, dtype=np.float64)
+
+    # g^T R diag(eigenvalues) R^T g for all samples and measurements
+    projections = np.einsum("mj,sjk->smk", directions, random_rotations(n_samples, rng))
+    signals = np.exp(-b_values * (projections**2 @ eigenvalues))
+    sigma = 1.0 / snr
+    signals = np.hypot(
+        signals + rng.normal(0, sigma, signals.shape),
+        rng.normal(0, sigma, signals.shape),
+    )
+
+    md, fa = tensor_metrics(
+        fit_voxels(signals, design_matrix(b_values, directions), weighted=weighted)
+    )
+    true_md, true_fa = tensor_metrics(
+        np.concatenate(([0], eigenvalues, [0, 0, 0]))[np.newaxis]
+    )
+    true_md, true_fa = float(true_md[0]), float(true_fa[0])
+    return NoiseSimulation(
+        snr,
+        true_fa,
+        true_md,
+        float(fa.mean() - true_fa),
+        float(fa.std()),
+        float(md.mean() - true_md),
+        float(md.std()),
+    )
+
+
+def simulate_scheme(
+    vectors: np.ndarray, b_max: float, b0_volumes: int = 1, **kwargs
+) -> NoiseSimulation:
+    """simulate_noise for a vector set as returned by get_diffusion_vectors."""
+    b_values, directions = _with_b0(vectors, b_max, b0_volumes)
+    return simulate_noise(b_values, directions, **kwargs)
@@ -0,0 +1,193 @@
+import gzip
+import hashlib
+import os
+import shutil
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+import numpy as np
+
+from . import profiling
+from .cache import default_cache_dir
+
+COPY_BUFFER = 16 * 2**20
+
+
+class NiftiCache:
+    """
+    Decompressed copies of .nii.gz files for memory mapped access.
+
+    A compressed image is decompressed once into the cache directory and afterwards
+    opened as read-only memory map, so repeated stages and parallel workers share
+    the page cache instead of each decompressing their own copy. Entries are keyed by
+    path, modification time and size of the source, changed sources get a new entry.
+    The directory is kept below max_bytes by evicting the least recently used files.
+
+    Parameters:
+        directory: Path
+            Defaults to default_cache_dir() / "nifti".
+        max_bytes: int
+            Upper bound for the size of all decompressed files.
+        enabled: bool
+            Disable the cache, compressed files are then read directly. Can also be
+            set with FDT_CACHE_DISABLE=1.
+    """
+
+    def __init__(
+        self,
+        directory: Path | str | None = None,
+        max_bytes: int = 8 * 2**30,
+        enabled: bool | None = None,
+    ):
+        self._directory = Path(directory) if directory is not None else None
+        self.max_bytes = max_bytes
+        if enabled is None:
+            enabled = os.environ.get("FDT_CACHE_DISABLE", "0").lower() in (
+                "0",
+                "",
+                "false",
+                "no",
+            )
+        self.enabled = enabled
+        self._lock = threading.Lock()
+
+    @property
+    def directory(self) -> Path:
+        if self._directory is None:
+            return default_cache_dir() / "nifti"
+        return self._directory
+
+    @staticmethod
+    def make_key(filename: Path) -> str:
+        """Key of the current version of a file, changes with mtime and size."""
+        filename = Path(filename).resolve()
+        stat = filename.stat()
+        digest = hashlib.sha256(
+            f"{filename}|{stat.st_mtime_ns}|{stat.st_size}".encode()
+        )
+        return digest.hexdigest()
+
+    def uncompressed(self, filename: Path) -> Path:
+        """
+        Path of an uncompressed version of filename.
+
+        Uncompressed files are returned as they are. Compressed files are decompressed
+        into the cache on first use.
+        """
+        filename = Path(filename)
+        if not self.enabled or not filename.name.endswith(".gz"):
+            return filename
+        path = self.directory / f"{self.make_key(filename)}.nii"
+        if path.is_file():
+            # mark as recently used for eviction
+            os.utime(path)
+            profiling.count("nifti_cache.hits")
+            return path
+        profiling.count("nifti_cache.misses")
+        try:
+            path.parent.mkdir(parents=True, exist_ok=True)
+            tmp_path = path.with_suffix(f".{os.getpid()}.{threading.get_ident()}.tmp")
+            with (
+                profiling.span("decompress", filename=str(filename)),
+                gzip.open(filename, "rb") as source,
+                tmp_path.open("wb") as target,
+            ):
+                shutil.copyfileobj(source, target, COPY_BUFFER)
+            # concurrent workers may race here, both copies are identical
+            os.replace(tmp_path, path)
+        except OSError:
+            # a read only or full cache directory must never break the evaluation
+            return filename
+        self._evict(keep=path)
+        return path
+
+    def prefetch(self, filenames: list, max_workers: int | None = None) -> list[Path]:
+        """
+        Decompress several files concurrently.
+
+        A single gzip stream can only be decompressed sequentially, but zlib
+        releases the GIL, so distinct files are decompressed in parallel threads.
+        """
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            return list(executor.map(self.uncompressed, filenames))
+
+    def _evict(self, keep: Path | None = None) -> None:
+        """Remove least recently used files until the cache fits into max_bytes."""
+        with self._lock:
+            try:
+                entries = [
+                    (entry.stat().st_mtime, entry.stat().st_size, entry)
+                    for entry in self.directory.glob("*.nii")
+                ]
+            except OSError:
+                return
+            total = sum(size for _, size, _ in entries)
+            for _, size, entry in sorted(entries, key=lambda item: item[0]):
+                if total <= self.max_bytes:
+                    break
+                if entry == keep:
+                    continue
+                try:
+                    entry.unlink()
+                except OSError:
+                    continue
+                total -= size
+
+    def clear(self) -> None:
+        """Remove all decompressed files."""
+        if self.directory.is_dir():
+            for entry in self.directory.glob("*.nii"):
+                try:
+                    entry.unlink()
+                except OSError:
+                    pass
+
+
+nifti_cache = NiftiCache()
+
+
+def open_nifti(filename: Path, cache: NiftiCache | None = None):
+    """
+    Load a NIfTI image with read-only memory mapped data.
+
+    .nii.gz files are served from the decompressed cache (see NiftiCache). Images
+    with scaling factors are scaled by nibabel and therefore not memory mapped.
+    """
+    import nibabel as nib
+
+    if cache is None:
+        cache = nifti_cache
+    return nib.load(cache.uncompressed(filename), mmap="r")
+
+
+def load_data(filename: Path, cache: NiftiCache | None = None) -> np.ndarray:
+    """Image data of a NIfTI file, a read-only memory map where possible."""
+    return np.asanyarray(open_nifti(filename, cache).dataobj)
+
+
+def volume_views(data: np.ndarray, b_values: np.ndarray) -> dict:
+    """
+    Volumes of a 4D array grouped by b_value, without copying.
+
+    Returns:
+        dict mapping every distinct b_value to a tuple of 3D views.
+    """
+    b_values = np.asarray(b_values).reshape(-1)
+    if data.shape[-1] != b_values.size:
+        raise ValueError(
+            f"Data contains {data.shape[-1]} volumes but {b_values.size} b_values."
+        )
+    return {
+        float(b_value): tuple(
+            data[..., idx] for idx in np.flatnonzero(b_values == b_value)
+        )
+        for b_value in np.unique(b_values)
+    }
+
+
+def slab_views(data: np.ndarray, slab: int):
+    """Yield (start, stop, view) of consecutive slabs along the third axis."""
+    for start in range(0, data.shape[2], slab):
+        stop = min(data.shape[2], start + slab)
+        yield start, stop, data[:, :, start:stop]
@@ -0,0 +1,295 @@
+import hashlib
+import json
+import os
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import asdict, dataclass, field
+from pathlib import Path
+
+import numpy as np
+
+from . import profiling
+from .analysis import FileStatistics, fit_adc, snr_statistics, write_results
+from .masks import create_mask, load_mask
+from .trace import compute_geometric_mean, nifti_stem, read_bval
+
+MANIFEST_NAME = ".fdt_pipeline.json"
+MANIFEST_VERSION = 1
+
+
+@dataclass
+class PipelineParameters:
+    """Parameters of main.m. Stages rerun when their parameters change."""
+
+    radius: float = 20
+    inner_radius: float = 50
+    outer_radius: float = 55
+    fit_start_b_value: float = 0
+
+
+@dataclass
+class PipelineReport:
+    statistics: list = field(default_factory=list)
+    executed: dict = field(default_factory=dict)
+    errors: dict = field(default_factory=dict)
+    results_file: Path | None = None
+
+    def summary(self) -> str:
+        n_stages = sum(len(stages) for stages in self.executed.values())
+        lines = [
+            f"{len(self.statistics)} files evaluated, {n_stages} stages executed "
+            f"in {len([s for s in self.executed.values() if s])} files."
+        ]
+        for name, error in self.errors.items():
+            lines.append(f"   FAILED {name}: {error}")
+        return "\n".join(lines)
+
+
+class FileHashes:
+    """
+    Content hashes of files, reused while modification time and size are unchanged.
+
+    The entries are stored in the pipeline manifest, so unchanged inputs are not
+    read again on the next run.
+    """
+
+    def __init__(self, entries: dict | None = None):
+        self.entries = entries if entries is not None else dict()
+
+    def __call__(self, path: Path) -> str | None:
+        path = Path(path)
+        if not path.is_file():
+            return None
+        stat = path.stat()
+        entry = self.entries.get(str(path))
+        if entry and (entry["mtime_ns"], entry["size"]) == (
+            stat.st_mtime_ns,
+            stat.st_size,
+        ):
+            return entry["sha256"]
+        with path.open("rb") as file:
+            sha256 = hashlib.file_digest(file, "sha256").hexdigest()
+        self.entries[str(path)] = {
+            "mtime_ns": stat.st_mtime_ns,
+            "size": stat.st_size,
+            "sha256": sha256,
+        }
+        return sha256
+
+
+def _run_stage(
+    records: dict,
+    stage: str,
+    inputs: list,
+    params: dict,
+    outputs: list,
+    build,
+    hashes: FileHashes,
+    force: bool,
+) -> bool:
+    """
+    Run build() unless the recorded inputs, parameters and outputs are unchanged.
+
+    Returns True if the stage was executed.
+    """
+    input_hashes = {str(path): hashes(path) for path in inputs}
+    record = records.get(stage)
+    if (
+        not force
+        and record is not None
+        and record["inputs"] == input_hashes
+        and record["params"] == params
+        and all(hashes(path) == digest for path, digest in record["outputs"].items())
+    ):
+        return False
+    with profiling.span(f"pipeline.{stage}"):
+        build()
+    records[stage] = {
+        "inputs": input_hashes,
+        "params": params,
+        "outputs": {str(path): hashes(path) for path in outputs},
+    }
+    return True
+
+
+def _statistics_to_dict(stat: FileStatistics) -> dict:
+    return {
+        key: value.tolist() if isinstance(value, np.ndarray) else value
+        for key, value in asdict(stat).items()
+    }
+
+
+def _statistics_from_dict(values: dict) -> FileStatistics:
+    arrays = ("b_values", "snr_per_b", "log_sums", "counts")
+    return FileStatistics(
+        **{
+            key: np.asarray(value, dtype=np.float64) if key in arrays else value
+            for key, value in values.items()
+        }
+    )
+
+
+def _snr_stage(
+    name: str, trace_file: Path, mask_file: Path, bval_file: Path, output: Path
+):
+    from .nifti import load_data
+
+    data = load_data(trace_file)
+    stat = snr_statistics(data, load_mask(mask_file), read_bval(bval_file), name)
+    # the ADC is fitted over all files in the final step
+    output.write_text(json.dumps(_statistics_to_dict(stat)))
+
+
+def _process_file(job: tuple) -> tuple:
+    """Mask, geometric mean and SNR stages of one image. Runs in a worker process."""
+    nifti_file, result_dir, params, records, hash_entries, force = job
+    name = nifti_stem(nifti_file)
+    bval_file = nifti_file.with_name(f"{name}.bval")
+    mask_file = result_dir / f"{name}_mask.nii"
+    trace_file = result_dir / f"{name}_geometric_mean_combined.nii"
+    snr_file = result_dir / f"{name}_snr.json"
+    hashes = FileHashes(hash_entries)
+    executed = list()
+    try:
+        if not bval_file.is_file():
+            raise FileNotFoundError(f"The .bval file {bval_file} does not exist.")
+        radii = {
+            "radius": params.radius,
+            "inner_radius": params.inner_radius,
+            "outer_radius": params.outer_radius,
+        }
+        if _run_stage(
+            records,
+            "mask",
+            [nifti_file],
+            radii,
+            [mask_file],
+            lambda: create_mask(nifti_file, mask_file, **radii),
+            hashes,
+            force,
+        ):
+            executed.append("mask")
+        if _run_stage(
+            records,
+            "geometric_mean",
+            [nifti_file, bval_file],
+            {},
+            [trace_file],
+            lambda: compute_geometric_mean(nifti_file, bval_file, trace_file),
+            hashes,
+            force,
+        ):
+            executed.append("geometric_mean")
+        if _run_stage(
+            records,
+            "snr",
+            [trace_file, mask_file, bval_file],
+            {},
+            [snr_file],
+            lambda: _snr_stage(name, trace_file, mask_file, bval_file, snr_file),
+            hashes,
+            force,
+        ):
+            executed.append("snr")
+        stat = _statistics_from_dict(json.loads(snr_file.read_text()))
+    except Exception as error:
+        empty = np.array([])
+        stat = FileStatistics(
+            name, empty, empty, np.nan, empty, empty, error=str(error)
+        )
+    return name, records, hashes.entries, executed, stat
+
+
+def run_pipeline(
+    nifti_dir: Path,
+    result_dir: Path | None = None,
+    params: PipelineParameters | None = None,
+    max_workers: int | None = None,
+    force: bool = False,
+    results_file: Path | None = None,
+) -> PipelineReport:
+    """
+    Incremental version of main.m: masks, geometric mean and SNR for all images.
+
+    Every *.nii.gz image of nifti_dir (with .bval next to it) passes the stages
+    mask -> geometric mean -> SNR. The content hashes of the inputs and outputs and
+    the parameters of every stage are stored in result_dir/.fdt_pipeline.json, up to
+    date stages are skipped. Files are processed in parallel worker processes. The
+    pooled ADC fit and the results table are always recomputed from the per file
+    statistics, which is cheap.
+
+    Parameters:
+        nifti_dir: Path
+            Folder with the *.nii.gz images and .bval files.
+        result_dir: Path
+            Folder for masks, trace images and results. Defaults to nifti_dir.
+        params: PipelineParameters
+            ROI radii and the first b_value of the ADC fit.
+        max_workers: int
+            Number of worker processes, defaults to the number of CPUs.
+        force: bool
+            Execute all stages even if they are up to date.
+        results_file: Path
+            Results table (.csv or .json), defaults to result_dir/snr_results.csv.
+    """
+    nifti_dir = Path(nifti_dir).resolve()
+    result_dir = Path(result_dir).resolve() if result_dir is not None else nifti_dir
+    result_dir.mkdir(parents=True, exist_ok=True)
+    params = params or PipelineParameters()
+    manifest_file = result_dir / MANIFEST_NAME
+    manifest = {"version": MANIFEST_VERSION, "files": {}, "hashes": {}}
+    if manifest_file.is_file():
+        stored = json.loads(manifest_file.read_text())
+        if stored.get("version") == MANIFEST_VERSION:
+            manifest = stored
+
+    images = sorted(nifti_dir.glob("*.nii.gz"))
+    jobs = [
+        (
+            image,
+            result_dir,
+            params,
+            manifest["files"].get(nifti_stem(image), {}),
+            manifest["hashes"],
+            force,
+        )
+        for image in images
+    ]
+    if max_workers is None:
+        max_workers = os.cpu_count() or 1
+    max_workers = max(1, min(max_workers, len(jobs)))
+    if max_workers > 1:
+        with ProcessPoolExecutor(max_workers=max_workers) as executor:
+            results = list(executor.map(_process_file, jobs))
+    else:
+        results = [_process_file(job) for job in jobs]
+
+    report = PipelineReport()
+    files = dict()
+    for name, records, hash_entries, executed, stat in results:
+        files[name] = records
+        manifest["hashes"].update(hash_entries)
+        report.executed[name] = executed
+        report.statistics.append(stat)
+        if stat.error:
+            report.errors[name] = stat.error
+    manifest["files"] = files
+    # forget hashes of files that are no longer part of any stage
+    used = {
+        path
+        for records in files.values()
+        for record in records.values()
+        for path in (*record["inputs"], *record["outputs"])
+    }
+    manifest["hashes"] = {
+        path: entry for path, entry in manifest["hashes"].items() if path in used
+    }
+    manifest_file.write_text(json.dumps(manifest, indent=1))
+
+    fit_adc(
+        [stat for stat in report.statistics if stat.error is None],
+        params.fit_start_b_value,
+    )
+    report.results_file = write_results(
+        report.statistics, results_file or result_dir / "snr_results.csv"
+    )
+    return report
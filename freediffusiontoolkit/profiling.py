@@ -0,0 +1,211 @@
+import atexit
+import json
+import os
+import sys
+import threading
+import time
+from contextlib import nullcontext
+from pathlib import Path
+
+# Output file of the profile, enables profiling when set. "{pid}" is replaced by the
+# process id, e.g. FDT_PROFILE=/tmp/fdt_{pid}.json
+PROFILE_ENV = "FDT_PROFILE"
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+_NULL_SPAN = nullcontext()
+_profiler = None
+
+
+def max_rss() -> int | None:
+    """Peak resident set size of the process in bytes, None if unavailable."""
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # kilobytes on Linux, bytes on macOS
+    return peak if sys.platform == "darwin" else peak * 1024
+
+
+class _Span:
+    __slots__ = ("profiler", "name", "args", "start")
+
+    def __init__(self, profiler, name: str, args: dict):
+        self.profiler = profiler
+        self.name = name
+        self.args = args
+
+    def __enter__(self):
+        self.start = time.perf_counter_ns()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.profiler.record(self.name, self.start, time.perf_counter_ns(), self.args)
+        return False
+
+
+class Profiler:
+    """
+    Collects timing spans, counters and peak memory of one process.
+
+    Spans are recorded with their thread, nested spans show up as call stacks in
+    Chrome tracing (chrome://tracing or https://ui.perfetto.dev). The peak resident
+    memory is sampled at the end of every span.
+    """
+
+    def __init__(self):
+        self.pid = os.getpid()
+        self.origin = time.perf_counter_ns()
+        self.events = list()
+        self.counters = dict()
+        self._lock = threading.Lock()
+
+    def span(self, name: str, **args) -> _Span:
+        return _Span(self, name, args)
+
+    def record(self, name: str, start: int, stop: int, args: dict | None = None):
+        event = {
+            "name": name,
+            "start": start - self.origin,
+            "duration": stop - start,
+            "thread": threading.get_ident(),
+            "max_rss": max_rss(),
+        }
+        if args:
+            event["args"] = args
+        with self._lock:
+            self.events.append(event)
+
+    def count(self, name: str, value: int | float = 1) -> None:
+        with self._lock:
+            self.counters[name] = self.counters.get(name, 0) + value
+
+    def summary(self) -> dict:
+        """Number of calls, total and maximum seconds per span name, and counters."""
+        spans = dict()
+        for event in self.events:
+            entry = spans.setdefault(
+                event["name"], {"calls": 0, "total_s": 0.0, "max_s": 0.0}
+            )
+            seconds = event["duration"] / 1e9
+            entry["calls"] += 1
+            entry["total_s"] += seconds
+            entry["max_s"] = max(entry["max_s"], seconds)
+        return {
+            "pid": self.pid,
+            "spans": spans,
+            "counters": dict(self.counters),
+            "max_rss_bytes": max_rss(),
+        }
+
+    def chrome_trace(self) -> dict:
+        """Events in the Chrome trace event format, times in microseconds."""
+        trace = list()
+        for event in self.events:
+            trace.append(
+                {
+                    "name": event["name"],
+                    "ph": "X",
+                    "ts": event["start"] / 1e3,
+                    "dur": event["duration"] / 1e3,
+                    "pid": self.pid,
+                    "tid": event["thread"],
+                    "args": event.get("args", {}),
+                }
+            )
+            if event["max_rss"] is not None:
+                trace.append(
+                    {
+                        "name": "max_rss",
+                        "ph": "C",
+                        "ts": (event["start"] + event["duration"]) / 1e3,
+                        "pid": self.pid,
+                        "args": {"bytes": event["max_rss"]},
+                    }
+                )
+        return {"traceEvents": trace, "otherData": self.summary()}
+
+    def write(self, filename: Path, trace_format: str | None = None) -> Path:
+        """
+        Write the profile as Chrome trace ("chrome") or summary ("json").
+
+        By default files ending with .trace or .trace.json get the Chrome trace
+        format, all others the summary.
+        """
+        filename = Path(filename)
+        if trace_format is None:
+            trace_format = "chrome" if ".trace" in filename.suffixes else "json"
+        if trace_format == "chrome":
+            content = self.chrome_trace()
+        elif trace_format == "json":
+            content = self.summary()
+        else:
+            raise ValueError(f"Unknown profile format {trace_format!r}.")
+        filename.write_text(json.dumps(content, indent=1))
+        return filename
+
+
+def span(name: str, **args):
+    """
+    Context manager timing a block, does nothing unless profiling is enabled.
+
+    with span("write", filename=str(filename)):
+        ...
+    """
+    if _profiler is None:
+        return _NULL_SPAN
+    return _Span(_profiler, name, args)
+
+
+def count(name: str, value: int | float = 1) -> None:
+    """Increase a counter, does nothing unless profiling is enabled."""
+    if _profiler is not None:
+        _profiler.count(name, value)
+
+
+def profiler() -> Profiler | None:
+    """The active profiler or None."""
+    return _profiler
+
+
+def enable(filename: Path | str | None = None) -> Profiler:
+    """
+    Start profiling this process.
+
+    If filename is given, the profile is written there at interpreter exit.
+    Profiling an already profiled process keeps the running profiler.
+    """
+    global _profiler
+    if _profiler is None:
+        _profiler = Profiler()
+    if filename is not None:
+        filename = Path(str(filename).replace("{pid}", str(os.getpid())))
+        atexit.register(_write_at_exit, _profiler, filename)
+    return _profiler
+
+
+def disable() -> Profiler | None:
+    """Stop profiling and return the collected profile."""
+    global _profiler
+    active, _profiler = _profiler, None
+    return active
+
+
+def enable_from_environment() -> Profiler | None:
+    """Enable profiling if FDT_PROFILE names an output file."""
+    filename = os.environ.get(PROFILE_ENV)
+    if not filename:
+        return None
+    return enable(filename)
+
+
+def _write_at_exit(active: Profiler, filename: Path) -> None:
+    try:
+        active.write(filename)
+    except OSError as error:
+        print(f"Could not write profile {filename}: {error}", file=sys.stderr)
+
+
+enable_from_environment()
@@ -0,0 +1,154 @@
+import hashlib
+
+import numpy as np
+
+
+def _restore(data: np.ndarray, digest: bytes) -> "Protocol":
+    protocol = object.__new__(Protocol)
+    data.flags.writeable = False
+    object.__setattr__(protocol, "_data", data)
+    object.__setattr__(protocol, "_digest", digest)
+    object.__setattr__(protocol, "_runs", Protocol._find_runs(data[:, 3]))
+    return protocol
+
+
+class Protocol:
+    """
+    Immutable set of diffusion vectors with the b_value of every vector.
+
+    All values live in one read-only, C-contiguous (n_vectors, 4) float64 array with
+    the columns x, y, z and b_value. The SHA-256 digest of the array is computed
+    once, so protocols can be hashed, compared and used as dictionary keys in O(1).
+    vectors, b_values and the shells are views of the array.
+
+    Parameters:
+        vectors: np.ndarray
+            (n_vectors, 3) diffusion vectors as written to the vector file.
+        b_values: np.ndarray
+            b_value of every vector (not the b_values of the tool).
+    """
+
+    __slots__ = ("_data", "_digest", "_runs")
+
+    def __init__(self, vectors: np.ndarray, b_values: np.ndarray):
+        vectors = np.asarray(vectors, dtype=np.float64).reshape(-1, 3)
+        b_values = np.asarray(b_values, dtype=np.float64).reshape(-1)
+        if b_values.size != vectors.shape[0]:
+            raise ValueError(
+                f"Got {vectors.shape[0]} vectors but {b_values.size} b_values."
+            )
+        data = np.empty((vectors.shape[0], 4), dtype=np.float64)
+        data[:, :3] = vectors
+        data[:, 3] = b_values
+        # -0.0 and 0.0 must give the same digest
+        data += 0.0
+        data.flags.writeable = False
+        digest = hashlib.sha256(data.tobytes()).digest()
+        object.__setattr__(self, "_data", data)
+        object.__setattr__(self, "_digest", digest)
+        object.__setattr__(self, "_runs", self._find_runs(b_values))
+
+    @staticmethod
+    def _find_runs(b_values: np.ndarray) -> tuple:
+        """(b_value, start, stop) of every run of equal consecutive b_values."""
+        starts = np.concatenate(([0], np.flatnonzero(np.diff(b_values)) + 1))
+        stops = np.append(starts[1:], b_values.size)
+        return tuple(
+            (float(b_values[start]), int(start), int(stop))
+            for start, stop in zip(starts, stops)
+            if stop > start
+        )
+
+    @classmethod
+    def from_tool(cls, tool) -> "Protocol":
+        """Protocol of the vectors of a FreeDiffusionTool, see FreeDiffusionTool.protocol."""
+        return cls(tool.vectors, tool.vector_b_values())
+
+    def __setattr__(self, name, value):
+        raise AttributeError(f"{type(self).__name__} is immutable.")
+
+    def __delattr__(self, name):
+        raise AttributeError(f"{type(self).__name__} is immutable.")
+
+    def __reduce__(self):
+        # the digest is sent along, unpickling does not hash again
+        return _restore, (self._data, self._digest)
+
+    def __len__(self) -> int:
+        return self._data.shape[0]
+
+    def __hash__(self) -> int:
+        return int.from_bytes(self._digest[:8], "little")
+
+    def __eq__(self, other) -> bool:
+        if not isinstance(other, Protocol):
+            return NotImplemented
+        return self._digest == other._digest
+
+    def __repr__(self) -> str:
+        return (
+            f"{type(self).__name__}({len(self)} vectors, "
+            f"shells={[b_value for b_value, _, _ in self._runs]}, key={self.key[:12]})"
+        )
+
+    def __array__(self, dtype=None, copy=None):
+        """np.asarray(protocol) gives the read-only vectors."""
+        if copy:
+            return np.array(self.vectors, dtype=dtype)
+        return np.asarray(self.vectors, dtype=dtype)
+
+    @property
+    def key(self) -> str:
+        """Hex digest of the content, stable across processes and versions."""
+        return self._digest.hex()
+
+    @property
+    def data(self) -> np.ndarray:
+        """The read-only (n_vectors, 4) array with x, y, z and b_value columns."""
+        return self._data
+
+    @property
+    def vectors(self) -> np.ndarray:
+        return self._data[:, :3]
+
+    @property
+    def b_values(self) -> np.ndarray:
+        """b_value of every vector."""
+        return self._data[:, 3]
+
+    @property
+    def shell_b_values(self) -> list[float]:
+        """b_value of every shell in file order."""
+        return [b_value for b_value, _, _ in self._runs]
+
+    @property
+    def points_per_shell(self) -> list[int]:
+        return [stop - start for _, start, stop in self._runs]
+
+    @property
+    def shells(self) -> tuple:
+        """
+        (b_value, vectors) of every shell in file order, without copying.
+
+        A shell is a run of consecutive vectors with the same b_value. Protocols
+        that return to a b_value later (e.g. interleaved b=0 volumes) have several
+        shells with the same b_value.
+        """
+        return tuple(
+            (b_value, self._data[start:stop, :3]) for b_value, start, stop in self._runs
+        )
+
+    def shell(self, b_value: float) -> np.ndarray:
+        """
+        Vectors with the given b_value.
+
+        A view if they form one shell, otherwise the shells are concatenated.
+        """
+        parts = [
+            self._data[start:stop, :3]
+            for value, start, stop in self._runs
+            if value == b_value
+        ]
+        if not parts:
+            raise KeyError(f"No vectors with b_value {b_value}.")
+        return parts[0] if len(parts) == 1 else np.concatenate(parts)
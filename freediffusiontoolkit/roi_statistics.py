@@ -0,0 +1,424 @@
+import csv
+import math
+import os
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import asdict, dataclass
+from functools import reduce
+from pathlib import Path
+
+import numpy as np
+
+from . import profiling
+from .masks import NOISE_LABEL, SIGNAL_LABEL
+from .trace import nifti_stem, read_bval
+
+
+class Moments:
+    """
+    Streaming count, mean, variance, minimum and maximum of several columns.
+
+    Batches are combined with the parallel form of Welford's algorithm (Chan et al.),
+    which is numerically stable and lets partial results of workers be merged.
+    """
+
+    def __init__(self, n_columns: int):
+        self.count = np.zeros(n_columns, dtype=np.int64)
+        self.mean = np.zeros(n_columns)
+        self.m2 = np.zeros(n_columns)
+        self.min = np.full(n_columns, np.inf)
+        self.max = np.full(n_columns, -np.inf)
+
+    def update(self, values: np.ndarray, valid: np.ndarray) -> None:
+        """Add the valid entries of a (n_samples, n_columns) batch."""
+        count = valid.sum(axis=0)
+        with np.errstate(invalid="ignore", divide="ignore"):
+            mean = np.where(valid, values, 0).sum(axis=0) / count
+            m2 = np.where(valid, (values - mean) ** 2, 0).sum(axis=0)
+        self._combine(count, np.nan_to_num(mean), m2)
+        self.min = np.minimum(self.min, np.where(valid, values, np.inf).min(axis=0))
+        self.max = np.maximum(self.max, np.where(valid, values, -np.inf).max(axis=0))
+
+    def _combine(self, count: np.ndarray, mean: np.ndarray, m2: np.ndarray) -> None:
+        total = self.count + count
+        delta = mean - self.mean
+        with np.errstate(invalid="ignore", divide="ignore"):
+            weight = np.where(total > 0, count / total, 0)
+        self.mean = self.mean + delta * weight
+        self.m2 = self.m2 + m2 + delta**2 * self.count * weight
+        self.count = total
+
+    def merge(self, other: "Moments") -> "Moments":
+        self._combine(other.count, other.mean, other.m2)
+        self.min = np.minimum(self.min, other.min)
+        self.max = np.maximum(self.max, other.max)
+        return self
+
+    @property
+    def std(self) -> np.ndarray:
+        """Sample standard deviation (ddof=1), NaN for less than two values."""
+        with np.errstate(invalid="ignore", divide="ignore"):
+            return np.where(self.count > 1, np.sqrt(self.m2 / (self.count - 1)), np.nan)
+
+
+class QuantileSketch:
+    """
+    Mergeable quantile sketch of positive values with relative accuracy.
+
+    Values are counted in logarithmic buckets (DDSketch), every quantile is returned
+    within relative_accuracy of the exact value, so memory grows with the logarithm
+    of the value range instead of the number of values. relative_accuracy=0 keeps all
+    values and gives exact results. Quantiles are interpolated between order
+    statistics like MATLAB's quantile (numpy method "hazen").
+
+    Parameters:
+        relative_accuracy: float
+            Maximum relative error of quantiles, 0 for exact mode.
+    """
+
+    def __init__(self, relative_accuracy: float = 0.01):
+        if not 0 <= relative_accuracy < 1:
+            raise ValueError("relative_accuracy must be in [0, 1).")
+        self.relative_accuracy = relative_accuracy
+        self.count = 0
+        self.min = np.inf
+        self.max = -np.inf
+        self._values = list()
+        self._sorted = None
+        if relative_accuracy > 0:
+            self._log_gamma = math.log1p(
+                2 * relative_accuracy / (1 - relative_accuracy)
+            )
+        self._offset = 0
+        self._counts = np.zeros(0, dtype=np.int64)
+
+    @property
+    def exact(self) -> bool:
+        return self.relative_accuracy == 0
+
+    def update(self, values: np.ndarray) -> None:
+        """Add values, entries that are not positive and finite are ignored."""
+        values = np.asarray(values, dtype=np.float64).reshape(-1)
+        values = values[(values > 0) & np.isfinite(values)]
+        if values.size == 0:
+            return
+        self.count += values.size
+        self.min = min(self.min, float(values.min()))
+        self.max = max(self.max, float(values.max()))
+        if self.exact:
+            self._values.append(values)
+            self._sorted = None
+            return
+        indices = np.ceil(np.log(values) / self._log_gamma).astype(np.int64)
+        self._grow(int(indices.min()), int(indices.max()))
+        self._counts += np.bincount(indices - self._offset, minlength=self._counts.size)
+
+    def _grow(self, low: int, high: int) -> None:
+        if self._counts.size == 0:
+            self._offset = low
+            self._counts = np.zeros(high - low + 1, dtype=np.int64)
+            return
+        before = max(0, self._offset - low)
+        after = max(0, high - (self._offset + self._counts.size - 1))
+        if before or after:
+            self._counts = np.pad(self._counts, (before, after))
+            self._offset -= before
+
+    def merge(self, other: "QuantileSketch") -> "QuantileSketch":
+        if other.relative_accuracy != self.relative_accuracy:
+            raise ValueError("Only sketches with the same accuracy can be merged.")
+        if other.count == 0:
+            return self
+        self.count += other.count
+        self.min = min(self.min, other.min)
+        self.max = max(self.max, other.max)
+        if self.exact:
+            self._values += other._values
+            self._sorted = None
+            return self
+        self._grow(other._offset, other._offset + other._counts.size - 1)
+        start = other._offset - self._offset
+        self._counts[start : start + other._counts.size] += other._counts
+        return self
+
+    def _sorted_values(self) -> np.ndarray:
+        if self._sorted is None:
+            self._sorted = np.sort(np.concatenate(self._values))
+            self._values = [self._sorted]
+        return self._sorted
+
+    def _bucket_value(self, bucket: int) -> float:
+        """Value with the same relative distance to both edges of a bucket."""
+        index = bucket + self._offset
+        value = 2 * math.exp(index * self._log_gamma) / (1 + math.exp(self._log_gamma))
+        return min(max(value, self.min), self.max)
+
+    def _order_statistic(self, rank: int) -> float:
+        if self.exact:
+            return float(self._sorted_values()[rank])
+        if rank == 0:
+            return self.min
+        if rank == self.count - 1:
+            return self.max
+        cumulative = np.cumsum(self._counts)
+        return self._bucket_value(int(np.searchsorted(cumulative, rank, side="right")))
+
+    def quantile(self, q: float, log: bool = False) -> float:
+        """
+        Quantile q in [0, 1], NaN if the sketch is empty.
+
+        With log the quantile of the logarithm of the values is returned, the order
+        statistics are interpolated on the logarithmic scale.
+        """
+        if self.count == 0:
+            return np.nan
+        position = min(max(q * self.count - 0.5, 0), self.count - 1)
+        rank = int(position)
+        fraction = position - rank
+        transform = math.log if log else float
+        value = transform(self._order_statistic(rank))
+        if fraction > 0:
+            upper = transform(self._order_statistic(min(rank + 1, self.count - 1)))
+            value += fraction * (upper - value)
+        return value
+
+    def lowest_at_least(self, limit: float) -> float:
+        """Smallest value >= limit (lower whisker), NaN if there is none."""
+        if self.count == 0 or limit > self.max:
+            return np.nan
+        if limit <= self.min:
+            return self.min
+        if self.exact:
+            values = self._sorted_values()
+            return float(values[np.searchsorted(values, limit, side="left")])
+        # first non-empty bucket whose upper edge reaches the limit
+        first = max(0, math.ceil(math.log(limit) / self._log_gamma) - self._offset)
+        filled = np.flatnonzero(self._counts[first:])
+        if filled.size == 0:
+            return self.max
+        return self._bucket_value(first + int(filled[0]))
+
+    def highest_at_most(self, limit: float) -> float:
+        """Largest value <= limit (upper whisker), NaN if there is none."""
+        if self.count == 0 or limit < self.min:
+            return np.nan
+        if limit >= self.max:
+            return self.max
+        if self.exact:
+            values = self._sorted_values()
+            return float(values[np.searchsorted(values, limit, side="right") - 1])
+        last = math.ceil(math.log(limit) / self._log_gamma) - self._offset
+        filled = np.flatnonzero(self._counts[: last + 1])
+        if filled.size == 0:
+            return self.min
+        return self._bucket_value(int(filled[-1]))
+
+
+@dataclass
+class BoxStatistics:
+    """
+    Statistics of the signal ROI for one b_value, as in the boxplots of
+    processNiftiFiles.m.
+
+    signal_mean and signal_std describe the signal, quartiles and whiskers its
+    logarithm. error_bound is the largest absolute error of the logarithmic values
+    (0 in exact mode), whiskers are exact up to values within error_bound of the
+    1.5 IQR fences.
+    """
+
+    b_value: float
+    count: int
+    signal_mean: float
+    signal_std: float
+    snr: float
+    q1: float
+    median: float
+    q3: float
+    whisker_low: float
+    whisker_high: float
+    error_bound: float
+
+
+class RoiStatistics:
+    """
+    Streaming SNR and boxplot statistics of the signal and noise ROI of one image.
+
+    Slabs of the trace combined image are added with update(), partial results of
+    several workers are combined with merge(). Memory does not depend on the
+    number of voxels unless relative_accuracy is 0 (exact mode).
+
+    Parameters:
+        b_values: np.ndarray
+            b_values of the image, volume i belongs to the i-th smallest one.
+        relative_accuracy: float
+            Relative accuracy of the quantiles of the signal, see QuantileSketch.
+    """
+
+    def __init__(self, b_values: np.ndarray, relative_accuracy: float = 0.01):
+        self.b_values = np.unique(np.asarray(b_values, dtype=np.float64))
+        self.relative_accuracy = relative_accuracy
+        self.signal = Moments(self.b_values.size)
+        self.noise = Moments(self.b_values.size)
+        self.sketches = [
+            QuantileSketch(relative_accuracy) for _ in range(self.b_values.size)
+        ]
+
+    def update(self, data: np.ndarray, mask: np.ndarray) -> None:
+        """Add a slab (x, y, z, b) of the image with the matching slab of the mask."""
+        if data.ndim == 3:
+            data = data[..., np.newaxis]
+        if data.shape[:3] != mask.shape:
+            raise ValueError("The dimensions of mask and image data do not match.")
+        if data.shape[3] < self.b_values.size:
+            raise ValueError(
+                f"Image contains {data.shape[3]} volumes but "
+                f"{self.b_values.size} b_values."
+            )
+        data = data[..., : self.b_values.size]
+        for moments, label in ((self.signal, SIGNAL_LABEL), (self.noise, NOISE_LABEL)):
+            values = np.asarray(data[mask == label], dtype=np.float64)
+            valid = (values > 0) & np.isfinite(values)
+            moments.update(values, valid)
+            if label == SIGNAL_LABEL:
+                for column, sketch in enumerate(self.sketches):
+                    sketch.update(values[:, column])
+
+    def merge(self, other: "RoiStatistics") -> "RoiStatistics":
+        if not np.array_equal(self.b_values, other.b_values):
+            raise ValueError("Statistics of different b_values cannot be merged.")
+        self.signal.merge(other.signal)
+        self.noise.merge(other.noise)
+        for sketch, other_sketch in zip(self.sketches, other.sketches):
+            sketch.merge(other_sketch)
+        return self
+
+    @property
+    def snr_per_b(self) -> np.ndarray:
+        with np.errstate(invalid="ignore", divide="ignore"):
+            return np.where(self.signal.count > 0, self.signal.mean, np.nan) / (
+                self.noise.std
+            )
+
+    @property
+    def snr_total(self) -> float:
+        """Mean signal of all b_values divided by the noise of the last b_value."""
+        with np.errstate(invalid="ignore", divide="ignore"):
+            mean = (
+                self.signal.mean * self.signal.count
+            ).sum() / self.signal.count.sum()
+            return float(mean / self.noise.std[-1])
+
+    @property
+    def error_bound(self) -> float:
+        """Largest absolute error of the logarithmic quantiles."""
+        return -math.log1p(-self.relative_accuracy)
+
+    def boxplots(self) -> list[BoxStatistics]:
+        """Quartiles, median and 1.5 IQR whiskers of the log signal per b_value."""
+        boxes = list()
+        snr = self.snr_per_b
+        for idx, sketch in enumerate(self.sketches):
+            with np.errstate(divide="ignore", invalid="ignore"):
+                q1, median, q3 = (
+                    sketch.quantile(q, log=True) for q in (0.25, 0.5, 0.75)
+                )
+                iqr = q3 - q1
+                whiskers = np.log(
+                    [
+                        sketch.lowest_at_least(np.exp(q1 - 1.5 * iqr)),
+                        sketch.highest_at_most(np.exp(q3 + 1.5 * iqr)),
+                    ]
+                )
+            boxes.append(
+                BoxStatistics(
+                    float(self.b_values[idx]),
+                    int(self.signal.count[idx]),
+                    float(self.signal.mean[idx]) if sketch.count else np.nan,
+                    float(self.signal.std[idx]),
+                    float(snr[idx]),
+                    float(q1),
+                    float(median),
+                    float(q3),
+                    float(whiskers[0]),
+                    float(whiskers[1]),
+                    self.error_bound,
+                )
+            )
+        return boxes
+
+
+def roi_statistics(
+    data: np.ndarray,
+    mask: np.ndarray,
+    b_values: np.ndarray,
+    relative_accuracy: float = 0.01,
+    max_slab_bytes: int = 64 * 2**20,
+    max_workers: int | None = None,
+) -> RoiStatistics:
+    """
+    RoiStatistics of a (memory mapped) image in one pass over slabs.
+
+    Slabs along the third axis are processed by a thread pool, each slab gives a
+    partial result and all partial results are merged.
+    """
+    if data.ndim == 3:
+        data = data[..., np.newaxis]
+    nx, ny, nz, nt = data.shape
+    if mask.shape != (nx, ny, nz):
+        raise ValueError("The dimensions of mask and image data do not match.")
+    slab = max(1, max_slab_bytes // max(1, nx * ny * nt * 8))
+
+    def process(start: int) -> RoiStatistics:
+        partial = RoiStatistics(b_values, relative_accuracy)
+        stop = min(nz, start + slab)
+        partial.update(data[:, :, start:stop], np.asarray(mask[:, :, start:stop]))
+        return partial
+
+    if max_workers is None:
+        max_workers = os.cpu_count() or 1
+    with (
+        profiling.span("roi_statistics", relative_accuracy=relative_accuracy),
+        ThreadPoolExecutor(max_workers=max(1, max_workers)) as executor,
+    ):
+        partials = list(executor.map(process, range(0, nz, slab)))
+    if not partials:
+        return RoiStatistics(b_values, relative_accuracy)
+    return reduce(RoiStatistics.merge, partials)
+
+
+def roi_statistics_file(
+    nifti_file: Path,
+    mask_file: Path | None = None,
+    bval_file: Path | None = None,
+    **kwargs,
+) -> RoiStatistics:
+    """
+    RoiStatistics of a trace combined image with its .bval and _mask.nii next to it.
+
+    The image is memory mapped, see nifti.open_nifti. kwargs are passed to
+    roi_statistics.
+    """
+    from .masks import load_mask
+    from .nifti import load_data
+
+    nifti_file = Path(nifti_file)
+    name = nifti_stem(nifti_file)
+    if bval_file is None:
+        bval_file = nifti_file.with_name(f"{name}.bval")
+    if mask_file is None:
+        mask_file = nifti_file.with_name(f"{name}_mask.nii")
+    return roi_statistics(
+        load_data(nifti_file), load_mask(mask_file), read_bval(bval_file), **kwargs
+    )
+
+
+def write_boxplot_statistics(statistics: dict, filename: Path) -> Path:
+    """Write {name: RoiStatistics} as csv table with one row per file and b_value."""
+    filename = Path(filename)
+    columns = ["Filename"] + list(BoxStatistics.__dataclass_fields__)
+    with filename.open("w", newline="") as file:
+        writer = csv.DictWriter(file, fieldnames=columns)
+        writer.writeheader()
+        for name, stat in statistics.items():
+            for box in stat.boxplots():
+                writer.writerow({"Filename": name, **asdict(box)})
+    return filename
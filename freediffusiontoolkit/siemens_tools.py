@@ -1,12 +1,141 @@
+import re
 from datetime import datetime
 from pathlib import Path
 
 import numpy as np
 
+from . import profiling
 from .free_diffusion_tools import FreeDiffusionTool
 
+_FLOAT = r"[-+]?(?:\d+\.?\d*|\.\d+)(?:[eE][-+]?\d+)?"
+_VECTOR_LINE = re.compile(
+    r"^[ \t]*Vector[ \t]*\[[ \t]*(\d+)[ \t]*\][ \t]*=[ \t]*\("
+    rf"[ \t]*({_FLOAT})[ \t]*,[ \t]*({_FLOAT})[ \t]*,[ \t]*({_FLOAT})[ \t]*\)[ \t\r]*$",
+    re.MULTILINE,
+)
+_ANY_VECTOR_LINE = re.compile(r"^[ \t]*Vector.*$", re.MULTILINE)
+_DIRECTIONS_LINE = re.compile(r"^[ \t]*\[directions=(\d+)\][ \t\r]*$", re.MULTILINE)
+# legacy files only contain the number of directions after the comment block
+_LEGACY_DIRECTIONS_LINE = re.compile(r"^[ \t]*(\d+)\]?[ \t\r]*$", re.MULTILINE)
+_COMMENT_LINE = re.compile(r"^#.*$", re.MULTILINE)
+_OPTION_LINE = re.compile(
+    r"^[ \t]*(CoordinateSystem|Normalisation|Comment)[ \t]*[=:][ \t]*(.*?)[ \t\r]*$",
+    re.MULTILINE | re.IGNORECASE,
+)
+_B_VALUES_LINE = re.compile(r"^#[ \t]*b-values:[ \t]*(\[[^\]]*\]|.*$)", re.MULTILINE)
+_N_DIMS_LINE = re.compile(r"^#[ \t]*number dimensions:[ \t]*(\d+)", re.MULTILINE)
+_POINTS_PER_SHELL_LINE = re.compile(
+    r"^#[ \t]*points per shell:[ \t]*\[([^\]]*)\]", re.MULTILINE
+)
+
+
+def _line_number(text: str, position: int) -> int:
+    return text.count("\n", 0, position) + 1
+
+
+def parse_vector_file(text: str, source: str = "<string>") -> tuple[np.ndarray, dict]:
+    """
+    Parse the content of a Siemens diffusion vector file.
+
+    All vectors are extracted with one regular expression pass and converted in a
+    single array operation.
+
+    Parameters:
+        text: str
+            Content of a .dvs or DiffusionVectors.txt file.
+        source: str
+            Name used in error messages.
+
+    Returns:
+        vectors: np.ndarray
+            Array of shape (directions, 3).
+        header: dict
+            Parsed header fields "directions", "CoordinateSystem", "Normalisation",
+            "Comment", "b_values" and "n_dims" or "points_per_shell" if present in
+            the file.
+
+    Raises:
+        ValueError: For malformed vector lines, non consecutive indices or a
+            directions count not matching the number of vectors. The message
+            contains the line number.
+    """
+    header = dict()
+
+    # header fields
+    directions = _DIRECTIONS_LINE.search(text)
+    if not directions:
+        comments = list(_COMMENT_LINE.finditer(text))
+        directions = _LEGACY_DIRECTIONS_LINE.search(
+            text, comments[-1].end() if comments else 0
+        )
+    if directions:
+        header["directions"] = int(directions.group(1))
+    for match in _OPTION_LINE.finditer(text):
+        key = {
+            "coordinatesystem": "CoordinateSystem",
+            "normalisation": "Normalisation",
+            "comment": "Comment",
+        }[match.group(1).lower()]
+        header.setdefault(key, match.group(2))
+    b_values = _B_VALUES_LINE.search(text)
+    if b_values:
+        header["b_values"] = [
+            float(val) for val in re.findall(_FLOAT, b_values.group(1))
+        ]
+    n_dims = _N_DIMS_LINE.search(text)
+    if n_dims:
+        header["n_dims"] = int(n_dims.group(1))
+    points_per_shell = _POINTS_PER_SHELL_LINE.search(text)
+    if points_per_shell:
+        header["points_per_shell"] = [
+            int(val) for val in re.findall(r"\d+", points_per_shell.group(1))
+        ]
+
+    # vectors
+    matches = _VECTOR_LINE.findall(text)
+    if not matches:
+        values = np.empty((0, 4))
+    else:
+        values = np.array(matches, dtype=np.float64)
+
+    candidates = _ANY_VECTOR_LINE.findall(text)
+    if len(candidates) != len(matches):
+        for candidate in _ANY_VECTOR_LINE.finditer(text):
+            if not _VECTOR_LINE.fullmatch(candidate.group(0)):
+                raise ValueError(
+                    f"{source}:{_line_number(text, candidate.start())}: "
+                    f"malformed vector line {candidate.group(0).strip()!r}"
+                )
+
+    indices = values[:, 0]
+    wrong = np.flatnonzero(indices != np.arange(len(indices)))
+    if wrong.size:
+        position = list(_VECTOR_LINE.finditer(text))[wrong[0]].start()
+        raise ValueError(
+            f"{source}:{_line_number(text, position)}: expected Vector[{wrong[0]}], "
+            f"got Vector[{int(indices[wrong[0]])}]"
+        )
+
+    if "directions" in header and header["directions"] != len(indices):
+        raise ValueError(
+            f"{source}:{_line_number(text, directions.start())}: header announces "
+            f"{header['directions']} directions but {len(indices)} vectors were found"
+        )
+
+    return values[:, 1:], header
+
+
+def read_vector_file(filename: Path) -> tuple[np.ndarray, dict]:
+    """Read a Siemens diffusion vector file in one go. See parse_vector_file."""
+    filename = Path(filename)
+    with filename.open("r") as file:
+        text = file.read()
+    return parse_vector_file(text, source=str(filename))
+
 
 class BasicSiemensTool(FreeDiffusionTool):
+    vector_format = "Vector[%d] = (% .6f,% .6f,% .6f)"
+
     def __init__(
         self,
         b_values: list | np.ndarray = np.array([0, 1000]),
@@ -15,8 +144,19 @@ class BasicSiemensTool(FreeDiffusionTool):
     ):
         super().__init__(b_values, n_dims, **kwargs)
 
+    def basis_key(self) -> tuple:
+        if (
+            self.n_dims in (3, 4, 6)
+            and not self.multi_shell
+            and self._explicit_basis is None
+        ):
+            return "siemens", self.n_dims
+        return super().basis_key()
+
     def get_basis_vectors(self) -> np.ndarray:
-        if self.n_dims == 3:
+        if self.multi_shell:
+            points = super().get_basis_vectors()
+        elif self.n_dims == 3:
             points = np.eye(3)
         elif self.n_dims == 4:
             points = np.array(
@@ -60,7 +200,7 @@ class BasicSiemensTool(FreeDiffusionTool):
             Options are explained in parent method documentation.
         """
         # This is the total number of applied dimensions
-        n_directions = len(self.b_values) * self.n_dims
+        n_directions = self.n_directions
 
         head = list()
         head.append(
@@ -87,7 +227,10 @@ class BasicSiemensTool(FreeDiffusionTool):
         )
         head.append(f"# Description: {description}")
         head.append(f"# b-values: {self.b_values}")
-        head.append(f"# number dimensions: {self.n_dims}")
+        if self.multi_shell:
+            head.append(f"# points per shell: {self.points_per_shell}")
+        else:
+            head.append(f"# number dimensions: {self.n_dims}")
         comment = self.options.get("Comment", None)
         if comment:
             head.append(f"Comment: {comment}")
@@ -133,10 +276,7 @@ class BasicSiemensTool(FreeDiffusionTool):
         """
         header = self.construct_header(filename=filename)
 
-        # get diffusion values
-        diffusion_vectors = self.get_diffusion_vectors()
-
-        self.write(filename, header, diffusion_vectors)
+        self.write(filename, header, self.vectors)
 
     @staticmethod
     def vector_to_string(
@@ -150,32 +290,18 @@ class BasicSiemensTool(FreeDiffusionTool):
             f"{vector[2]: .{decimals}f})"
         )
 
-    def load(self, filename: Path) -> None:
-        vector_list = list()
-
-        def process_vector_line(text: str) -> tuple:
-            text = text.strip()
-            components = text.split(" = ")
-            position = components[0].replace("Vector[", "").replace("]", "")
-            vector = (
-                components[1]
-                .replace("(", "")
-                .replace(")", "")
-                .replace(" ", "")
-                .split(",")
-            )
-            vector = [np.float64(i) for i in vector]
-            return position, vector
-
-        with filename.open("r") as file:
-            for line in file:
-
-                # Read data
-                if not line.startswith("#"):
-                    if line.startswith("Vector"):
-                        vector_list.append(process_vector_line(line)[1])
+    def load(self, filename: Path) -> dict:
+        """
+        Load vectors from a Siemens diffusion vector file.
 
-        self.vectors = np.array(vector_list)
+        The vectors are stored in the vectors property, the parsed header fields are
+        returned. See parse_vector_file for details.
+        """
+        with profiling.span("load", filename=str(filename)):
+            vectors, header = read_vector_file(filename)
+        profiling.count("vectors_parsed", len(vectors))
+        self.vectors = vectors
+        return header
 
 
 class LegacySiemensTool(BasicSiemensTool):
@@ -208,9 +334,12 @@ class LegacySiemensTool(BasicSiemensTool):
                 Newline: str = "\r\n" for legacy
 
         """
-        header = self.construct_header(filename=filename)
+        self.write(filename, self.construct_header(filename=filename), self.vectors)
+
+    def construct_header(self, filename: Path = None) -> list:
+        """Siemens header without the [directions=...] tag, see BasicSiemensTool."""
+        header = super().construct_header(filename)
         for idx, head in enumerate(header):
             if head.startswith("[directions="):
                 header[idx] = head.replace("[directions=", "")
-
-        self.write(filename, header, self.vectors)
+        return header
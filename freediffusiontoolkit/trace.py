@@ -0,0 +1,182 @@
+import warnings
+from pathlib import Path
+
+import numpy as np
+
+from . import profiling
+
+NIFTI_OFFSET = 352
+
+
+def read_bval(bval_file: Path) -> np.ndarray:
+    """Read the b_values of an FSL style .bval file."""
+    return np.loadtxt(bval_file, ndmin=1).reshape(-1)
+
+
+def nifti_stem(filename: Path) -> str:
+    """Filename without .nii or .nii.gz ending."""
+    name = Path(filename).name
+    for suffix in (".nii.gz", ".nii"):
+        if name.endswith(suffix):
+            return name[: -len(suffix)]
+    return Path(name).stem
+
+
+def geometric_mean_trace(
+    data: np.ndarray, b_values: np.ndarray | list
+) -> tuple[np.ndarray, np.ndarray]:
+    """
+    Geometric mean over all volumes with the same b_value.
+
+    Computed as exp(mean(log(values))) over the positive values of every voxel, which
+    avoids the over- and underflow of the root of a product. Voxels without positive
+    values are NaN.
+
+    Parameters:
+        data: np.ndarray
+            Array of shape (..., len(b_values)).
+        b_values: list | np.ndarray
+            b_value of every volume.
+
+    Returns:
+        trace: np.ndarray
+            Float32 array of shape (..., len(unique_b_values)).
+        unique_b_values: np.ndarray
+            Sorted distinct b_values, matching the last axis of trace.
+    """
+    b_values = np.asarray(b_values, dtype=np.float64).reshape(-1)
+    if data.shape[-1] != b_values.size:
+        raise ValueError(
+            f"Data contains {data.shape[-1]} volumes but {b_values.size} b_values."
+        )
+    unique_b_values, groups = np.unique(b_values, return_inverse=True)
+
+    data = np.asarray(data, dtype=np.float64)
+    positive = data > 0
+    logs = np.log(np.where(positive, data, 1.0))
+
+    trace = np.empty(data.shape[:-1] + (unique_b_values.size,), dtype=np.float32)
+    for group in range(unique_b_values.size):
+        volumes = groups == group
+        count = positive[..., volumes].sum(axis=-1)
+        total = logs[..., volumes].sum(axis=-1)
+        with np.errstate(invalid="ignore", divide="ignore"):
+            trace[..., group] = np.where(count > 0, np.exp(total / count), np.nan)
+    return trace, unique_b_values
+
+
+def _create_nifti(filename: Path, header, shape: tuple) -> np.memmap:
+    """Write a NIfTI header and return a writable memory map of the float32 data."""
+    import nibabel as nib
+
+    header = nib.Nifti1Header.from_header(header)
+    header.set_data_shape(shape)
+    header.set_data_dtype(np.float32)
+    header.set_slope_inter(1.0, 0.0)
+    header.set_data_offset(NIFTI_OFFSET)
+    n_bytes = int(np.prod(shape)) * 4
+    with Path(filename).open("wb") as file:
+        header.write_to(file)
+        # empty extension block
+        file.write(b"\x00" * (NIFTI_OFFSET - file.tell()))
+        file.truncate(NIFTI_OFFSET + n_bytes)
+    return np.memmap(
+        filename,
+        dtype=header.get_data_dtype(),
+        mode="r+",
+        offset=NIFTI_OFFSET,
+        shape=shape,
+        order="F",
+    )
+
+
+def compute_geometric_mean(
+    nifti_file: Path,
+    bval_file: Path | None = None,
+    output_file: Path | None = None,
+    max_slab_bytes: int = 64 * 2**20,
+) -> Path:
+    """
+    Combine all directions of a 4D NIfTI into one geometric mean volume per b_value.
+
+    Python version of computeGeometricMean.m. The input is processed in slabs along
+    the third axis so that peak memory is bounded by max_slab_bytes. Compressed input
+    is read from the decompressed cache (see nifti.NiftiCache). The result is written
+    slab by slab into a memory mapped, uncompressed NIfTI file.
+
+    Parameters:
+        nifti_file: Path
+            4D diffusion image (.nii or .nii.gz).
+        bval_file: Path
+            Matching .bval file. Defaults to the NIfTI name with .bval ending.
+        output_file: Path
+            Defaults to <name>_geometric_mean_combined.nii next to the input.
+        max_slab_bytes: int
+            Upper bound for the float64 working copy of one slab.
+
+    Returns:
+        Path of the written file.
+    """
+    from .nifti import open_nifti
+
+    nifti_file = Path(nifti_file)
+    stem = nifti_stem(nifti_file)
+    if bval_file is None:
+        bval_file = nifti_file.with_name(stem + ".bval")
+    if output_file is None:
+        output_file = nifti_file.with_name(stem + "_geometric_mean_combined.nii")
+    b_values = read_bval(bval_file)
+
+    image = open_nifti(nifti_file)
+    if len(image.shape) != 4:
+        raise ValueError(f"{nifti_file} is not a 4D image.")
+    nx, ny, nz, nt = image.shape
+    if nt != b_values.size:
+        raise ValueError(
+            f"{nifti_file} contains {nt} volumes but {bval_file} {b_values.size} b_values."
+        )
+    unique_b_values = np.unique(b_values)
+
+    output = _create_nifti(
+        output_file, image.header, (nx, ny, nz, unique_b_values.size)
+    )
+    slab = max(1, max_slab_bytes // max(1, nx * ny * nt * 8))
+    with profiling.span("geometric_mean", filename=str(nifti_file)):
+        for start in range(0, nz, slab):
+            stop = min(nz, start + slab)
+            trace, _ = geometric_mean_trace(
+                np.asanyarray(image.dataobj[:, :, start:stop, :]), b_values
+            )
+            output[:, :, start:stop, :] = trace
+        output.flush()
+    del output
+    return Path(output_file)
+
+
+def compute_geometric_mean_folder(
+    nifti_dir: Path, result_dir: Path | None = None, **kwargs
+) -> list[Path]:
+    """
+    Run compute_geometric_mean for all *.nii.gz files of a folder.
+
+    Files without matching .bval file are skipped with a warning.
+    """
+    nifti_dir = Path(nifti_dir)
+    result_dir = Path(result_dir) if result_dir is not None else nifti_dir
+    result_dir.mkdir(parents=True, exist_ok=True)
+    results = list()
+    for nifti_file in sorted(nifti_dir.glob("*.nii.gz")):
+        stem = nifti_stem(nifti_file)
+        bval_file = nifti_dir / f"{stem}.bval"
+        if not bval_file.is_file():
+            warnings.warn(f"The .bval file {bval_file} does not exist. Skipping.")
+            continue
+        results.append(
+            compute_geometric_mean(
+                nifti_file,
+                bval_file,
+                result_dir / f"{stem}_geometric_mean_combined.nii",
+                **kwargs,
+            )
+        )
+    return results
@@ -1,8 +1,49 @@
-import matplotlib.pyplot as plt
+import os
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+
 import numpy as np
 
+# Schemes with more vectors are drawn as points only unless arrows are requested.
+MAX_AUTO_ARROWS = 256
+
+
+def _draw_vectors(ax, vectors: np.ndarray, show_inverted: bool, arrows: bool | None):
+    """Draw all vectors as one point collection and optionally one line collection."""
+    from matplotlib.colors import to_rgba_array
+    from mpl_toolkits.mplot3d.art3d import Line3DCollection
+
+    vectors = np.asarray(vectors, dtype=np.float64).reshape(-1, 3)
+    n_vectors = vectors.shape[0]
+    colors = np.repeat(to_rgba_array(["C0", "C1"]), n_vectors, axis=0)
+    if show_inverted:
+        vectors = np.concatenate((vectors, -vectors))
+    else:
+        colors = colors[:n_vectors]
+    if arrows is None:
+        arrows = n_vectors <= MAX_AUTO_ARROWS
+
+    if arrows:
+        segments = np.zeros((vectors.shape[0], 2, 3))
+        segments[:, 1] = vectors
+        ax.add_collection3d(Line3DCollection(segments, colors=colors, linewidths=1))
+    ax.scatter(
+        vectors[:, 0],
+        vectors[:, 1],
+        vectors[:, 2],
+        c=colors,
+        s=4 if vectors.shape[0] > MAX_AUTO_ARROWS else 12,
+        depthshade=False,
+    )
+
+    ax.set_xlim([-1, 1])
+    ax.set_ylim([-1, 1])
+    ax.set_zlim([-1, 1])
+
 
 def plot_vectors(vectors: np.array, show_inverted: bool = False):
+    import matplotlib.pyplot as plt
+
     fig = plt.figure()
     ax = fig.add_subplot(111, projection="3d")
 
@@ -24,3 +65,106 @@ def plot_vectors(vectors: np.array, show_inverted: bool = False):
     ax.set_ylim([-1, 1])
     ax.set_zlim([-1, 1])
     plt.show()
+
+
+def render_vectors(
+    vectors: np.ndarray,
+    filename: Path,
+    show_inverted: bool = False,
+    arrows: bool | None = None,
+    title: str | None = None,
+    dpi: int = 100,
+    size: tuple = (6, 6),
+) -> Path:
+    """
+    Render a vector set to an image file without a display.
+
+    The figure is drawn on the Agg canvas without pyplot, so no GUI backend or global
+    figure state is involved. The format follows the file ending (.png, .svg, .pdf).
+
+    Parameters:
+        vectors: np.ndarray
+            Vectors of shape (n, 3).
+        filename: Path
+            Output image.
+        show_inverted: bool
+            Also draw the inverted vectors.
+        arrows: bool
+            Draw lines from the origin. By default only for up to MAX_AUTO_ARROWS vectors,
+            larger sets are drawn as points on the sphere.
+        title: str
+            Optional figure title.
+    """
+    from matplotlib.backends.backend_agg import FigureCanvasAgg
+    from matplotlib.figure import Figure
+    from mpl_toolkits.mplot3d import Axes3D  # noqa: F401, registers the projection
+
+    fig = Figure(figsize=size)
+    FigureCanvasAgg(fig)
+    ax = fig.add_subplot(111, projection="3d")
+    _draw_vectors(ax, vectors, show_inverted, arrows)
+    if title:
+        ax.set_title(title)
+    fig.savefig(filename, dpi=dpi)
+    return Path(filename)
+
+
+def split_shells(vectors: np.ndarray, decimals: int = 6) -> dict:
+    """Group the vectors of a multi b_value set by their length, zero vectors dropped."""
+    vectors = np.asarray(vectors).reshape(-1, 3)
+    norms = np.round(np.linalg.norm(vectors, axis=1), decimals)
+    return {
+        float(norm): vectors[norms == norm] for norm in np.unique(norms) if norm > 0
+    }
+
+
+def _render_job(job: tuple) -> Path:
+    vectors, filename, kwargs = job
+    return render_vectors(vectors, filename, **kwargs)
+
+
+def render_batch(
+    schemes: dict,
+    output_dir: Path,
+    file_format: str = "png",
+    by_shell: bool = False,
+    max_workers: int | None = None,
+    **kwargs,
+) -> list[Path]:
+    """
+    Render many vector sets in parallel worker processes.
+
+    Parameters:
+        schemes: dict
+            Maps a name to its vectors. The image is written to <output_dir>/<name>.png.
+        by_shell: bool
+            Render every shell (vector length) of a scheme separately as
+            <name>_shell_<length>.png.
+        max_workers: int
+            Number of processes, defaults to the number of CPUs.
+        kwargs:
+            Passed to render_vectors.
+
+    Returns:
+        List of the written files.
+    """
+    output_dir = Path(output_dir)
+    output_dir.mkdir(parents=True, exist_ok=True)
+    jobs = list()
+    for name, vectors in schemes.items():
+        if by_shell:
+            for norm, shell in split_shells(vectors).items():
+                filename = output_dir / f"{name}_shell_{norm:g}.{file_format}"
+                title = kwargs.get("title") or f"{name} |v| = {norm:g}"
+                jobs.append((shell, filename, {**kwargs, "title": title}))
+        else:
+            filename = output_dir / f"{name}.{file_format}"
+            jobs.append((np.asarray(vectors), filename, kwargs))
+
+    if max_workers is None:
+        max_workers = os.cpu_count() or 1
+    max_workers = max(1, min(max_workers, len(jobs)))
+    if max_workers == 1:
+        return [_render_job(job) for job in jobs]
+    with ProcessPoolExecutor(max_workers=max_workers) as executor:
+        return list(executor.map(_render_job, jobs))
@@ -0,0 +1,196 @@
+from importlib import import_module, metadata
+from pathlib import Path
+
+import numpy as np
+
+from .protocol import Protocol
+
+# A writer is a function writer(tool, vectors, filename) -> list[Path] storing an
+# already computed vector set in one format, tool and vectors may be a Protocol.
+# Built-in writers are registered as "module:function" strings and imported on
+# first use, other packages can add writers with an entry point in this group.
+ENTRY_POINT_GROUP = "freediffusiontoolkit.writers"
+
+_writers = {
+    "siemens": "freediffusiontoolkit.writers:write_siemens",
+    "siemens_vb": "freediffusiontoolkit.writers:write_siemens_legacy",
+    "fsl": "freediffusiontoolkit.writers:write_fsl",
+    "mrtrix": "freediffusiontoolkit.writers:write_mrtrix",
+}
+_entry_points_loaded = False
+
+# file endings that identify a format if none is given explicitly
+SUFFIX_FORMATS = {
+    ".dvs": "siemens",
+    ".txt": "siemens_vb",
+    ".bval": "fsl",
+    ".bvec": "fsl",
+    ".b": "mrtrix",
+}
+
+
+def register_writer(name: str, writer) -> None:
+    """Register a writer function or its "module:function" import path under name."""
+    _writers[name.lower()] = writer
+
+
+def _load_entry_points() -> None:
+    global _entry_points_loaded
+    if _entry_points_loaded:
+        return
+    _entry_points_loaded = True
+    for entry_point in metadata.entry_points(group=ENTRY_POINT_GROUP):
+        _writers.setdefault(entry_point.name.lower(), entry_point)
+
+
+def available_writers() -> list[str]:
+    """Names of all registered and installed writers."""
+    _load_entry_points()
+    return sorted(_writers)
+
+
+def get_writer(name: str):
+    """Import and return the writer registered under name."""
+    name = name.lower()
+    if name not in _writers:
+        _load_entry_points()
+    if name not in _writers:
+        raise ValueError(
+            f"Unknown vector file format {name}. Available: {', '.join(available_writers())}."
+        )
+    writer = _writers[name]
+    if isinstance(writer, metadata.EntryPoint):
+        writer = writer.load()
+    elif isinstance(writer, str):
+        module, function = writer.split(":")
+        writer = getattr(import_module(module), function)
+    _writers[name] = writer
+    return writer
+
+
+def format_for(filename: Path) -> str:
+    """Format name belonging to the ending of filename."""
+    suffix = Path(filename).suffix.lower()
+    if suffix not in SUFFIX_FORMATS:
+        raise ValueError(f"Cannot guess the vector file format of {filename}.")
+    return SUFFIX_FORMATS[suffix]
+
+
+def parse_output(output: str) -> tuple[str, Path]:
+    """Split a "format:filename" option. Without format it is taken from the ending."""
+    name, separator, filename = output.partition(":")
+    # keep Windows drive letters like C:\ as part of the filename
+    if separator and name.lower() in available_writers():
+        return name.lower(), Path(filename)
+    return format_for(output), Path(output)
+
+
+def export(
+    tool, outputs: list, vectors: np.ndarray | Protocol | None = None
+) -> list[Path]:
+    """
+    Compute the vectors of a tool once and write them to several formats.
+
+    Parameters:
+        tool: FreeDiffusionTool | Protocol
+            Tool providing b_values, options and the vector set, or a protocol.
+        outputs: list
+            (format, filename) pairs, "format:filename" strings or filenames whose
+            ending identifies the format.
+        vectors: np.ndarray | Protocol
+            Already computed vectors, defaults to tool.get_diffusion_vectors().
+
+    Returns:
+        List of all written files.
+    """
+    parsed = list()
+    for output in outputs:
+        if isinstance(output, str):
+            output = parse_output(output)
+        elif isinstance(output, Path):
+            output = (format_for(output), output)
+        parsed.append(output)
+    if vectors is None:
+        if isinstance(tool, Protocol):
+            vectors = tool
+        else:
+            vectors = tool.get_diffusion_vectors()
+    written = list()
+    for name, filename in parsed:
+        written += get_writer(name)(tool, vectors, Path(filename))
+    return written
+
+
+def _siemens_tool(tool, tool_class):
+    if isinstance(tool, Protocol):
+        return tool_class.from_protocol(tool)
+    if type(tool) is tool_class:
+        return tool
+    # newline and path are format specific options of the source tool
+    options = {
+        key: value
+        for key, value in tool.options.items()
+        if key not in ("newline", "default_path")
+    }
+    return tool_class(tool.b_values, tool.n_dims, **options)
+
+
+def write_siemens(tool, vectors: np.ndarray, filename: Path) -> list[Path]:
+    """Siemens VE .dvs file."""
+    from .siemens_tools import BasicSiemensTool
+
+    target = _siemens_tool(tool, BasicSiemensTool)
+    target.write(filename, target.construct_header(filename), vectors)
+    return [filename]
+
+
+def write_siemens_legacy(tool, vectors: np.ndarray, filename: Path) -> list[Path]:
+    """Siemens VB DiffusionVectors.txt file."""
+    from .siemens_tools import LegacySiemensTool
+
+    target = _siemens_tool(tool, LegacySiemensTool)
+    target.write(filename, target.construct_header(filename), vectors)
+    return [filename]
+
+
+def _gradient_table(
+    tool, vectors: np.ndarray | Protocol
+) -> tuple[np.ndarray, np.ndarray]:
+    """b_values and unit directions of all vectors, zero vectors stay zero."""
+    if isinstance(vectors, Protocol):
+        b_values = vectors.b_values
+    else:
+        b_values = tool.vector_b_values()
+    vectors = np.asarray(vectors, dtype=np.float64).reshape(-1, 3)
+    if len(b_values) != len(vectors):
+        raise ValueError(
+            f"Got {len(vectors)} vectors but the tool has {len(b_values)} b_values, "
+            "the vectors do not belong to the tool."
+        )
+    norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+    directions = np.divide(vectors, norms, out=np.zeros_like(vectors), where=norms > 0)
+    return b_values, directions
+
+
+def write_fsl(tool, vectors: np.ndarray, filename: Path) -> list[Path]:
+    """FSL .bval and .bvec files. filename may end with either or neither suffix."""
+    stem = (
+        filename.with_suffix("") if filename.suffix in (".bval", ".bvec") else filename
+    )
+    b_values, directions = _gradient_table(tool, vectors)
+    bval_file = stem.with_name(stem.name + ".bval")
+    bvec_file = stem.with_name(stem.name + ".bvec")
+    np.savetxt(bval_file, b_values[np.newaxis], fmt="%g")
+    np.savetxt(bvec_file, directions.T, fmt="%.6f")
+    return [bval_file, bvec_file]
+
+
+def write_mrtrix(tool, vectors: np.ndarray, filename: Path) -> list[Path]:
+    """MRtrix gradient table with one "x y z b" row per volume."""
+    b_values, directions = _gradient_table(tool, vectors)
+    np.savetxt(
+        filename,
+        np.column_stack((directions, b_values)),
+        fmt=("%.6f", "%.6f", "%.6f", "%g"),
+    )
+    return [filename]
@@ -0,0 +1,44 @@
+import sys
+import types
+
+import numpy as np
+import pytest
+
+
+@pytest.fixture(autouse=True)
+def daemon_socket(tmp_path, monkeypatch):
+    """Keep cli.run away from a generation daemon running on this machine."""
+    monkeypatch.setenv("FDT_DAEMON_SOCKET", str(tmp_path / "no-daemon.sock"))
+
+
+@pytest.fixture
+def qspace_stub(monkeypatch):
+    """
+    Replace qspace.sampling.multishell with a fast stand-in recording its calls.
+
+    optimize returns random unit vectors, the keyword arguments of every call are
+    stored in the calls attribute of the returned module.
+    """
+    multishell = types.ModuleType("qspace.sampling.multishell")
+    multishell.calls = list()
+
+    def compute_weights(nb_shells, points_per_shell, shell_groups, alphas):
+        return np.ones((nb_shells, nb_shells)) * np.ravel(alphas)[-1]
+
+    def optimize(nb_shells, points_per_shell, weights, max_iter=100, **kwargs):
+        multishell.calls.append(
+            {"points_per_shell": list(points_per_shell), "max_iter": max_iter, **kwargs}
+        )
+        points = np.random.standard_normal((sum(points_per_shell), 3))
+        return points / np.linalg.norm(points, axis=1, keepdims=True)
+
+    multishell.compute_weights = compute_weights
+    multishell.optimize = optimize
+    sampling = types.ModuleType("qspace.sampling")
+    sampling.multishell = multishell
+    qspace = types.ModuleType("qspace")
+    qspace.sampling = sampling
+    monkeypatch.setitem(sys.modules, "qspace", qspace)
+    monkeypatch.setitem(sys.modules, "qspace.sampling", sampling)
+    monkeypatch.setitem(sys.modules, "qspace.sampling.multishell", multishell)
+    return multishell
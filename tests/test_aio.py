@@ -0,0 +1,106 @@
+import asyncio
+import multiprocessing
+import time
+
+import numpy as np
+import pytest
+
+from freediffusiontoolkit import aio
+from freediffusiontoolkit.siemens_tools import BasicSiemensTool, read_vector_file
+
+
+def slow_basis(tool_class, b_values, n_dims, options):
+    time.sleep(options.get("sleep", 0.5))
+    return np.eye(3)[:n_dims]
+
+
+def failing(value):
+    raise ValueError(value)
+
+
+def test_library_basis_without_worker(tmp_path):
+    async def main():
+        tool = BasicSiemensTool([0, 1000], 30)
+        vectors = await tool.aget_diffusion_vectors()
+        await tool.asave(tmp_path / "scheme.dvs")
+        return vectors
+
+    vectors = asyncio.run(main())
+    assert vectors.shape == (60, 3)
+    np.testing.assert_allclose(
+        read_vector_file(tmp_path / "scheme.dvs")[0], vectors, atol=1e-6
+    )
+
+
+def test_identical_requests_are_coalesced(monkeypatch):
+    monkeypatch.setattr(aio, "_compute_basis", slow_basis)
+    calls = list()
+    run_in_process = aio.run_in_process
+
+    async def counting(*args):
+        calls.append(args)
+        return await run_in_process(*args)
+
+    monkeypatch.setattr(aio, "run_in_process", counting)
+
+    async def main():
+        tools = [
+            BasicSiemensTool([1000], 3, use_library=False, max_iter=idx // 3)
+            for idx in range(6)
+        ]
+        # n_dims 3 uses the hardcoded Siemens basis, force the qspace path
+        for tool in tools:
+            tool.n_dims = 2
+        return await asyncio.gather(*(tool.aget_diffusion_vectors() for tool in tools))
+
+    results = asyncio.run(main())
+    assert len(calls) == 2
+    assert all(result.shape == (2, 3) for result in results)
+
+
+def test_worker_gets_the_basis_key(monkeypatch):
+    keys = list()
+
+    async def in_loop(func, tool_class, b_values, n_dims, options):
+        keys.append(tool_class(b_values, n_dims, **options).basis_key())
+        return np.zeros((7, 3))
+
+    monkeypatch.setattr(aio, "run_in_process", in_loop)
+
+    async def main():
+        tool = BasicSiemensTool([0, 1000], 6, max_iter=10)
+        tool.points_per_shell = [1, 6]
+        await tool.aget_diffusion_vectors()
+        return tool
+
+    tool = asyncio.run(main())
+    assert keys == [("qspace", (1, 6), (False, True), (), 10)]
+    assert tool.vectors.shape == (7, 3)
+
+
+def test_timeout_stops_worker(monkeypatch):
+    monkeypatch.setattr(aio, "_compute_basis", slow_basis)
+
+    async def main():
+        tool = BasicSiemensTool([1000], 2, use_library=False, sleep=60)
+        start = time.perf_counter()
+        with pytest.raises(TimeoutError):
+            await tool.aget_diffusion_vectors(timeout=0.5)
+        # give the cancelled task time to terminate its process
+        for _ in range(50):
+            if not multiprocessing.active_children():
+                break
+            await asyncio.sleep(0.1)
+        return time.perf_counter() - start
+
+    assert asyncio.run(main()) < 10
+    assert not multiprocessing.active_children()
+    assert not aio._inflight
+
+
+def test_worker_errors_are_raised():
+    async def main():
+        await aio.run_in_process(failing, "broken")
+
+    with pytest.raises(ValueError, match="broken"):
+        asyncio.run(main())
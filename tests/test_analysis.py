@@ -0,0 +1,136 @@
+import csv
+import json
+
+import numpy as np
+import pytest
+
+from freediffusiontoolkit.analysis import (
+    analyze_folder,
+    fit_adc,
+    snr_statistics,
+    write_results,
+)
+from freediffusiontoolkit.cli import main
+
+nib = pytest.importorskip("nibabel")
+
+B_VALUES = np.array([0, 300, 600, 1000])
+ADC = 1.5e-3
+
+
+def phantom(seed: int = 0):
+    rng = np.random.default_rng(seed)
+    data = rng.normal(0, 5, (8, 8, 4, B_VALUES.size))
+    mask = np.zeros((8, 8, 4), dtype=np.uint8)
+    mask[2:6, 2:6, :] = 1
+    mask[0, :, :] = 2
+    data[mask == 1] = (
+        1000
+        * np.exp(-B_VALUES * ADC)
+        * rng.uniform(0.9, 1.1, ((mask == 1).sum(), B_VALUES.size))
+    )
+    return data, mask
+
+
+def test_snr_statistics():
+    data, mask = phantom()
+    stat = snr_statistics(data, mask, B_VALUES)
+
+    for idx in range(B_VALUES.size):
+        signal = data[..., idx][mask == 1]
+        noise = data[..., idx][mask == 2]
+        noise = noise[noise > 0]
+        assert np.isclose(stat.snr_per_b[idx], signal.mean() / noise.std(ddof=1))
+
+    noise = data[..., -1][mask == 2]
+    assert np.isclose(
+        stat.snr_total, data[mask == 1].mean() / noise[noise > 0].std(ddof=1)
+    )
+
+
+def test_fit_adc_matches_pooled_polyfit():
+    data, mask = phantom()
+    stat = snr_statistics(data, mask, B_VALUES)
+    fit_adc([stat], fit_start_b_value=300)
+
+    signal = data[mask == 1][:, 1:]
+    b = np.broadcast_to(B_VALUES[1:], signal.shape)
+    slope, _ = np.polyfit(b.ravel(), np.log(signal).ravel(), 1)
+    assert np.isclose(stat.adc, -slope)
+    assert np.isclose(stat.adc, ADC, rtol=0.1)
+
+
+def test_fit_adc_single_b_value():
+    data, mask = phantom()
+    stat = snr_statistics(data, mask, B_VALUES)
+    fit_adc([stat], fit_start_b_value=1000)
+    assert np.isnan(stat.adc)
+
+
+@pytest.fixture
+def folder(tmp_path):
+    for idx, n_b_values in enumerate((4, 3)):
+        data, mask = phantom(idx)
+        name = f"scan{idx}"
+        nib.save(
+            nib.Nifti1Image(data[..., :n_b_values].astype(np.float32), np.eye(4)),
+            tmp_path / f"{name}.nii.gz",
+        )
+        # legacy 4D mask
+        mask4d = np.repeat(mask[..., np.newaxis], n_b_values, axis=3)
+        nib.save(nib.Nifti1Image(mask4d, np.eye(4)), tmp_path / f"{name}_mask.nii")
+        np.savetxt(tmp_path / f"{name}.bval", B_VALUES[:n_b_values], fmt="%d")
+    nib.save(nib.Nifti1Image(data, np.eye(4)), tmp_path / "nomask.nii.gz")
+    return tmp_path
+
+
+def test_analyze_folder(folder):
+    statistics = analyze_folder(folder, fit_start_b_value=300, max_workers=2)
+    assert [stat.name for stat in statistics] == ["nomask", "scan0", "scan1"]
+    assert statistics[0].error
+    assert np.isclose(statistics[1].adc, ADC, rtol=0.1)
+
+    filename = write_results(statistics, folder / "results.csv")
+    with filename.open() as file:
+        rows = list(csv.DictReader(file))
+    assert list(rows[0]) == [
+        "Filename",
+        "Total_SNR",
+        "SNR_b_0",
+        "SNR_b_300",
+        "SNR_b_600",
+        "SNR_b_1000",
+        "ADC",
+        "Error",
+    ]
+    assert rows[2]["SNR_b_1000"] == "nan"
+
+    filename = write_results(statistics, folder / "results.json")
+    assert json.loads(filename.read_text())[2]["SNR_b_1000"] is None
+
+
+def test_cmd_snr(folder, capsys):
+    main(["freediffusiontoolkit", "snr", str(folder), "--workers", "1"])
+    assert (folder / "snr_results.csv").is_file()
+    assert "scan0" in capsys.readouterr().out
+
+
+def test_cmd_snr_boxplots(folder):
+    boxplots = folder / "boxplots.csv"
+    main(
+        [
+            "freediffusiontoolkit",
+            "snr",
+            str(folder),
+            "--workers",
+            "1",
+            "--boxplots",
+            str(boxplots),
+            "--accuracy",
+            "0",
+        ]
+    )
+    with boxplots.open() as file:
+        rows = list(csv.DictReader(file))
+    assert [row["Filename"] for row in rows] == ["scan0"] * 4 + ["scan1"] * 3
+    assert all(float(row["error_bound"]) == 0 for row in rows)
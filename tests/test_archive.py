@@ -0,0 +1,118 @@
+import numpy as np
+import pytest
+
+from freediffusiontoolkit.archive import (
+    SchemeIndex,
+    canonical_directions,
+    fingerprint,
+)
+from freediffusiontoolkit.cli import main
+from freediffusiontoolkit.siemens_tools import BasicSiemensTool, LegacySiemensTool
+
+
+def rotation(degrees: float) -> np.ndarray:
+    angle = np.radians(degrees)
+    return np.array(
+        [
+            [np.cos(angle), -np.sin(angle), 0],
+            [np.sin(angle), np.cos(angle), 0],
+            [0, 0, 1],
+        ]
+    )
+
+
+def test_fingerprint_invariances():
+    vectors = BasicSiemensTool([0, 500, 1000], 30).get_diffusion_vectors()
+    rng = np.random.default_rng(0)
+    flipped = vectors * rng.choice([-1, 1], size=(len(vectors), 1))
+    shuffled = flipped[rng.permutation(len(vectors))]
+    assert fingerprint(shuffled * 0.5) == fingerprint(vectors)
+    assert fingerprint(vectors[1:]) != fingerprint(vectors)
+    # relative shell lengths are part of the scheme
+    other = BasicSiemensTool([0, 300, 1000], 30).get_diffusion_vectors()
+    assert fingerprint(other) != fingerprint(vectors)
+    np.testing.assert_allclose(
+        canonical_directions(shuffled), canonical_directions(vectors)
+    )
+    assert canonical_directions(vectors).shape == (30, 3)
+
+    # directions in the y-z plane whose x component is noise of either sign
+    plane = np.array([[1e-12, 0.6, 0.8], [0.0, 1.0, 0.0], [3e-5, -0.8, 0.6]])
+    mirrored = np.array([[1e-12, -0.6, -0.8], [0.0, 1.0, 0.0], [3e-5, 0.8, -0.6]])
+    assert fingerprint(mirrored) == fingerprint(plane)
+    np.testing.assert_array_equal(
+        canonical_directions(mirrored, 4), canonical_directions(plane, 4)
+    )
+
+
+@pytest.fixture
+def archive(tmp_path):
+    vectors = BasicSiemensTool([0, 1000], 30).get_diffusion_vectors()
+    (tmp_path / "a").mkdir()
+    (tmp_path / "a" / "b").mkdir()
+    BasicSiemensTool([0, 1000], 30).save(tmp_path / "a" / "scheme.dvs")
+    BasicSiemensTool([0, 2000], 30).save(tmp_path / "a" / "b" / "copy.dvs")
+    LegacySiemensTool([0, 1000], 30).save(tmp_path / "DiffusionVectors.txt")
+    BasicSiemensTool([1000], 64).save(tmp_path / "other.dvs")
+    (tmp_path / "notes.txt").write_text("not a vector file")
+    rotated = BasicSiemensTool([1000], 30)
+    rotated.basis_vectors = rotated.basis_vectors @ rotation(0.5).T
+    rotated.save(tmp_path / "rotated.dvs")
+    return tmp_path, vectors
+
+
+def test_scan_and_search(archive):
+    root, vectors = archive
+    index = SchemeIndex()
+    report = index.scan(root)
+    assert len(report.added) == 6
+    assert len(report.failed) == 1
+
+    exact = index.find(vectors)
+    assert [path.split("/")[-1] for path in exact] == [
+        "DiffusionVectors.txt",
+        "copy.dvs",
+        "scheme.dvs",
+    ]
+    assert len(index.duplicates()) == 1
+
+    near = index.near(vectors, tolerance=1.0)
+    assert len(near) == 4
+    assert near[-1][0].endswith("rotated.dvs")
+    assert 0.4 < near[-1][1] < 0.6
+    assert len(index.near(vectors, tolerance=0.1)) == 3
+
+
+def test_incremental_scan(archive, tmp_path_factory):
+    root, vectors = archive
+    index_file = tmp_path_factory.mktemp("index") / "index.npz"
+    index = SchemeIndex()
+    index.scan(root, max_workers=1)
+    index.save(index_file)
+
+    loaded = SchemeIndex.load(index_file)
+    assert loaded.find(vectors) == index.find(vectors)
+    BasicSiemensTool([1000], 12).save(root / "a" / "scheme.dvs")
+    (root / "other.dvs").unlink()
+    report = loaded.scan(root)
+    assert report.unchanged == 4
+    assert len(report.updated) == 1
+    assert len(report.removed) == 1
+    assert len(loaded.find(vectors)) == 2
+
+
+def test_index_command(archive, capsys):
+    root, _ = archive
+    main(
+        [
+            "freediffusiontoolkit",
+            "index",
+            str(root),
+            "--find",
+            str(root / "a" / "scheme.dvs"),
+        ]
+    )
+    output = capsys.readouterr().out
+    assert "6 added" in output
+    assert output.count("identical") == 3
+    assert (root / ".fdt_index.npz").is_file()
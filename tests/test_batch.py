@@ -0,0 +1,104 @@
+import json
+
+import pytest
+
+from freediffusiontoolkit.batch import BatchJob, load_manifest, run_batch
+from freediffusiontoolkit.cli import run
+
+
+@pytest.fixture
+def jobs(tmp_path):
+    return [
+        BatchJob([0, 500, 1000], 6, tmp_path / "b1000_6.dvs"),
+        BatchJob([0, 1000, 2000], 6, tmp_path / "b2000_6.dvs"),
+        BatchJob([0, 1000], 3, tmp_path / "vb" / "DiffusionVectors.txt", "SiemensVB11"),
+    ]
+
+
+def test_run_batch(jobs):
+    report = run_batch(jobs, max_workers=2)
+    assert not report.failed
+    assert report.n_bases == 2
+    for job in jobs:
+        assert job.filename.is_file()
+    assert "3 of 3" in report.summary()
+
+
+def test_run_batch_failure(tmp_path):
+    report = run_batch([BatchJob([0, 1000], 6, tmp_path, "Siemens")], max_workers=1)
+    assert len(report.failed) == 1
+    assert "FAILED" in report.summary()
+
+
+@pytest.mark.parametrize("suffix", [".json", ".toml", ".csv"])
+def test_load_manifest(tmp_path, suffix):
+    manifest = tmp_path / f"manifest{suffix}"
+    if suffix == ".json":
+        manifest.write_text(
+            json.dumps(
+                {
+                    "jobs": [
+                        {
+                            "b_values": [0, 1000],
+                            "n_dims": 6,
+                            "filename": "a.dvs",
+                            "description": "test",
+                        }
+                    ]
+                }
+            )
+        )
+    elif suffix == ".toml":
+        manifest.write_text(
+            "[[jobs]]\n"
+            "b_values = [0, 1000]\n"
+            "n_dims = 6\n"
+            'filename = "a.dvs"\n'
+            'description = "test"\n'
+        )
+    else:
+        manifest.write_text(
+            "b_values,n_dims,vendor,filename,description\n"
+            "0 1000,6,Siemens,a.dvs,test\n"
+        )
+    (job,) = load_manifest(manifest)
+    assert job.b_values == [0.0, 1000.0]
+    assert job.n_dims == 6
+    assert job.filename == tmp_path / "a.dvs"
+    assert job.options == {"description": "test"}
+
+
+def test_load_manifest_options(tmp_path):
+    manifest = tmp_path / "manifest.csv"
+    manifest.write_text(
+        "b_values,n_dims,filename,max_iter,scale_by_value,use_library,points_per_shell\n"
+        "0 1000,30,a.dvs,50,2000,False,\n"
+        "0 1000 2000,,b.dvs,,,,1 6 12\n"
+    )
+    single, multi = load_manifest(manifest)
+    assert single.options == {
+        "max_iter": 50,
+        "scale_by_value": 2000.0,
+        "use_library": False,
+    }
+    assert multi.n_dims is None
+    assert multi.options == {"points_per_shell": [1, 6, 12]}
+    assert not single.create_tool().use_library
+
+    manifest.write_text("b_values,filename,use_library\n0 1000,a.dvs,maybe\n")
+    with pytest.raises(ValueError, match="use_library"):
+        load_manifest(manifest)
+    manifest.write_text("b_values,filename\n0 1000,a.dvs\n")
+    with pytest.raises(ValueError, match="n_dims"):
+        load_manifest(manifest)
+
+
+def test_cmd_batch(tmp_path, capsys):
+    manifest = tmp_path / "manifest.csv"
+    manifest.write_text(
+        "b_values,n_dims,filename\n" "0 1000,3,a.dvs\n" "0 500 1000,4,b.dvs\n"
+    )
+    run(["run", "--batch", str(manifest), "--workers=1"])
+    assert (tmp_path / "a.dvs").is_file()
+    assert (tmp_path / "b.dvs").is_file()
+    assert "2 of 2" in capsys.readouterr().out
@@ -0,0 +1,43 @@
+import importlib.util
+from pathlib import Path
+
+import pytest
+
+RUNNER = Path(__file__).parents[1] / "benchmarks" / "run_benchmarks.py"
+
+
+@pytest.fixture(scope="module")
+def runner():
+    spec = importlib.util.spec_from_file_location("run_benchmarks", RUNNER)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+def test_compare(runner):
+    baseline = {"a": 1.0, "b": 1.0}
+    assert runner.compare({"a": 1.4, "b": 1.6, "c": 9.0}, baseline, 1.5) == [("b", 1.6)]
+
+
+def test_run_and_compare_baseline(runner, tmp_path):
+    baseline = tmp_path / "baseline.json"
+    args = ["--quick", "--filter", "vectors/3x1", "--baseline", str(baseline)]
+    assert runner.main(args + ["--save-baseline"]) == 0
+    assert baseline.is_file()
+    assert runner.main(args + ["--threshold", "1000"]) == 0
+
+
+def test_filter_and_missing_baseline(runner, tmp_path, monkeypatch):
+    built = list()
+    make_tool = runner.make_tool
+
+    def counting(n_dims, n_b_values):
+        built.append((n_dims, n_b_values))
+        return make_tool(n_dims, n_b_values)
+
+    monkeypatch.setattr(runner, "make_tool", counting)
+    args = ["--quick", "--filter", "vectors/3x1", "--baseline", str(tmp_path / "no")]
+    assert runner.main(args) == 2
+    # only the selected benchmarks are set up
+    assert built == [(3, 1), (3, 100)]
+    assert runner.main(args + ["--no-compare"]) == 0
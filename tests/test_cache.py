@@ -0,0 +1,97 @@
+import numpy as np
+import pytest
+
+from freediffusiontoolkit import FreeDiffusionTool
+from freediffusiontoolkit.cache import BasisCache
+
+
+@pytest.fixture
+def cache(tmp_path):
+    return BasisCache(tmp_path / "cache", enabled=True)
+
+
+def test_cache_key_stable():
+    weights = np.ones((1, 1))
+    key = BasisCache.make_key([30], 1, weights, 1000, version="1")
+    assert key == BasisCache.make_key([30], 1, weights, 1000, version="1")
+    assert key != BasisCache.make_key([30], 1, weights, 500, version="1")
+    assert key != BasisCache.make_key([30], 1, weights, 1000, version="2")
+    assert key != BasisCache.make_key([31], 1, weights, 1000, version="1")
+
+
+def test_cache_memory_and_disk(cache):
+    points = np.random.rand(10, 3)
+    cache.put("key", points)
+    assert np.array_equal(cache.get("key"), points)
+
+    cache.clear(disk=False)
+    assert (cache.directory / "key.npz").is_file()
+    assert np.array_equal(cache.get("key"), points)
+
+    cache.clear()
+    assert cache.get("key") is None
+
+
+def test_cache_disabled(tmp_path):
+    cache = BasisCache(tmp_path, enabled=False)
+    cache.put("key", np.ones((3, 3)))
+    assert cache.get("key") is None
+    assert not list(tmp_path.glob("*.npz"))
+
+
+def test_cache_eviction(tmp_path):
+    cache = BasisCache(tmp_path, max_entries=1, max_bytes=4000)
+    for idx in range(10):
+        cache.put(f"key{idx}", np.random.rand(64, 3))
+    assert sum(path.stat().st_size for path in tmp_path.glob("*.npz")) <= 4000
+    assert len(cache._memory) == 1
+    assert cache.get("key9") is not None
+
+
+def test_get_basis_vectors_cached(cache, qspace_stub):
+    first = FreeDiffusionTool(
+        [0, 1000], 30, basis_cache=cache, use_library=False
+    ).get_basis_vectors()
+    # b_values do not change the single shell basis, the second tool hits the cache
+    second = FreeDiffusionTool(
+        [0, 500], 30, basis_cache=cache, use_library=False
+    ).get_basis_vectors()
+    assert len(qspace_stub.calls) == 1
+    assert qspace_stub.calls[0] == {"points_per_shell": [30], "max_iter": 1000}
+    assert np.array_equal(first, second)
+    assert len(list(cache.directory.glob("*.npz"))) == 1
+
+    # a different max_iter is a different key
+    FreeDiffusionTool(
+        [0, 1000], 30, basis_cache=cache, use_library=False, max_iter=50
+    ).get_basis_vectors()
+    assert qspace_stub.calls[-1]["max_iter"] == 50
+    assert len(list(cache.directory.glob("*.npz"))) == 2
+
+    FreeDiffusionTool(
+        [0, 1000], 30, basis_cache=None, use_library=False
+    ).get_basis_vectors()
+    assert len(qspace_stub.calls) == 3
+
+
+def test_init_points_warm_start(cache, qspace_stub):
+    init_points = np.eye(3)
+    tool = FreeDiffusionTool(
+        [0, 1000], 5, basis_cache=None, use_library=False, init_points=init_points
+    )
+    tool.get_basis_vectors()
+    warm_start = qspace_stub.calls[0]["init_points"]
+    # the previous solution is padded with random unit vectors
+    assert warm_start.shape == (5, 3)
+    assert np.array_equal(warm_start[:3], init_points)
+    np.testing.assert_allclose(np.linalg.norm(warm_start, axis=1), 1)
+
+    # warm starts share the cache entry of the cold start
+    cold = FreeDiffusionTool(
+        [0, 1000], 5, basis_cache=cache, use_library=False
+    ).get_basis_vectors()
+    warm = FreeDiffusionTool(
+        [0, 1000], 5, basis_cache=cache, use_library=False, init_points=init_points
+    ).get_basis_vectors()
+    assert np.array_equal(cold, warm)
+    assert len(qspace_stub.calls) == 2
@@ -0,0 +1,140 @@
+import socket
+import stat
+import tempfile
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+import numpy as np
+import pytest
+
+from freediffusiontoolkit.cli import run
+from freediffusiontoolkit.daemon import (
+    DaemonClient,
+    DaemonError,
+    GenerationServer,
+    is_running,
+)
+from freediffusiontoolkit.siemens_tools import read_vector_file
+
+pytestmark = pytest.mark.skipif(
+    not hasattr(socket, "AF_UNIX"), reason="Unix sockets are not available."
+)
+
+
+@pytest.fixture
+def server(monkeypatch):
+    # socket paths are limited to about 100 characters, tmp_path may be longer
+    directory = Path(tempfile.mkdtemp(prefix="fdt"))
+    path = directory / "daemon.sock"
+    monkeypatch.setenv("FDT_DAEMON_SOCKET", str(path))
+    server = GenerationServer(path)
+    thread = threading.Thread(target=server.serve_forever)
+    thread.start()
+    yield server
+    server.shutdown()
+    thread.join()
+    server.server_close()
+    directory.rmdir()
+
+
+def test_run_uses_daemon(server, tmp_path):
+    filename = tmp_path / "scheme.dvs"
+    run(
+        [
+            "run",
+            "0,1000",
+            "30",
+            "Siemens",
+            str(filename),
+            f"--export={tmp_path / 'scheme.b'}",
+        ]
+    )
+    vectors, header = read_vector_file(filename)
+    assert header["directions"] == 60
+    assert (tmp_path / "scheme.b").is_file()
+    assert DaemonClient().request("stats") == {"requests": 2, "bases": 1}
+
+    run(["run", "0,1000", "30", "Siemens", str(tmp_path / "local.dvs"), "--no-daemon"])
+    np.testing.assert_allclose(read_vector_file(tmp_path / "local.dvs")[0], vectors)
+    assert DaemonClient().request("stats")["requests"] == 3
+
+
+def test_concurrent_requests_share_basis(server, tmp_path):
+    client = DaemonClient()
+    with ThreadPoolExecutor(max_workers=8) as executor:
+        files = list(
+            executor.map(
+                lambda idx: client.create(
+                    [0, 500, 1000], 6, "Siemens", tmp_path / f"{idx}.dvs"
+                ),
+                range(16),
+            )
+        )
+    assert all(file[0].is_file() for file in files)
+    assert len(server.bases) == 1
+
+
+def test_bases_are_bounded(server, tmp_path):
+    server.max_bases = 2
+    client = DaemonClient()
+    for n_dims in (30, 31, 30, 32):
+        client.create([1000], n_dims, "Siemens", tmp_path / f"{n_dims}.dvs")
+    assert [key[1][-1] for key in server.bases] == [30, 32]
+
+
+def test_failed_basis_releases_lock(server):
+    class Failing:
+        def basis_key(self):
+            return ("failing",)
+
+        def get_basis_vectors(self):
+            raise ValueError("failing")
+
+    with pytest.raises(ValueError):
+        server.basis_vectors(Failing())
+    assert not server.bases and not server._basis_locks
+
+
+def test_socket_permissions(server):
+    assert stat.S_IMODE(server.path.stat().st_mode) == 0o600
+
+
+def test_run_falls_back_on_daemon_error(server, tmp_path, monkeypatch):
+    def broken(request):
+        raise RuntimeError("broken")
+
+    monkeypatch.setattr(server, "create", broken)
+    run(["run", "0,1000", "6", "Siemens", str(tmp_path / "scheme.dvs")])
+    assert (tmp_path / "scheme.dvs").is_file()
+
+
+def test_validate_and_errors(server, tmp_path):
+    client = DaemonClient()
+    client.create([1000], 6, "Siemens", tmp_path / "scheme.dvs")
+    result = client.validate(tmp_path / "scheme.dvs")
+    assert result["n_vectors"] == 6
+    assert result["header"]["directions"] == 6
+
+    (tmp_path / "broken.dvs").write_text("[directions=2]\nVector[0] = (1, 0)\n")
+    with pytest.raises(DaemonError, match="ValueError"):
+        client.validate(tmp_path / "broken.dvs")
+    with pytest.raises(DaemonError, match="Unknown command"):
+        client.request("unknown")
+    assert client.request("ping")
+
+
+def test_stale_socket(tmp_path, monkeypatch):
+    directory = Path(tempfile.mkdtemp(prefix="fdt"))
+    path = directory / "daemon.sock"
+    path.touch()
+    monkeypatch.setenv("FDT_DAEMON_SOCKET", str(path))
+    assert not is_running(path)
+    # falls back to local creation
+    run(["run", "0,1000", "6", "Siemens", str(tmp_path / "scheme.dvs")])
+    assert (tmp_path / "scheme.dvs").is_file()
+
+    server = GenerationServer(path)
+    server.server_close()
+    assert not path.exists()
+    directory.rmdir()
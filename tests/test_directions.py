@@ -0,0 +1,86 @@
+import numpy as np
+import pytest
+
+from freediffusiontoolkit import FreeDiffusionTool
+from freediffusiontoolkit.directions import (
+    MAX_LIBRARY_DIRECTIONS,
+    electrostatic_energy,
+    library_directions,
+    minimize_energy,
+    optimize_directions,
+    unique_directions,
+)
+
+
+@pytest.mark.parametrize("n_dims", [1, 2, 6, 30, 64, MAX_LIBRARY_DIRECTIONS])
+def test_library_directions(n_dims):
+    points = library_directions(n_dims)
+    assert points.shape == (n_dims, 3)
+    assert np.allclose(np.linalg.norm(points, axis=1), 1)
+
+
+def test_library_directions_miss():
+    assert library_directions(0) is None
+    assert library_directions(MAX_LIBRARY_DIRECTIONS + 1) is None
+
+
+def test_library_energy_lower_than_random():
+    random_points = np.random.default_rng(0).standard_normal((30, 3))
+    random_points /= np.linalg.norm(random_points, axis=1, keepdims=True)
+    assert electrostatic_energy(library_directions(30)) < electrostatic_energy(
+        random_points
+    )
+
+
+def test_optimize_directions():
+    points = optimize_directions(12, seed=0)
+    assert points.shape == (12, 3)
+    assert electrostatic_energy(points) <= 1.01 * electrostatic_energy(
+        library_directions(12)
+    )
+
+
+def test_tool_uses_library():
+    tool = FreeDiffusionTool([0, 1000], 64)
+    assert np.array_equal(tool.get_basis_vectors(), library_directions(64))
+    assert tool.basis_key()[0] == "library"
+
+    # an explicitly set basis gets its own key until the basis is reset
+    tool.basis_vectors = library_directions(64)[::-1]
+    assert tool.basis_key()[0] == "explicit"
+    tool.n_dims = 64
+    assert tool.basis_key()[0] == "library"
+
+
+def test_minimize_energy_fixed():
+    fixed = library_directions(20)
+    result = minimize_energy(4, fixed=fixed, seed=0)
+    assert result.points.shape == (24, 3)
+    assert np.array_equal(result.points[:20], fixed)
+    assert result.new_points.shape == (4, 3)
+    assert result.iterations > 0
+    assert result.energy < result.initial_energy
+    assert np.isclose(result.energy, electrostatic_energy(result.points))
+
+
+def test_unique_directions():
+    basis = library_directions(6)
+    vectors = np.concatenate((basis * 0, basis * 0.5, basis))
+    assert np.allclose(unique_directions(vectors), basis)
+
+
+@pytest.mark.parametrize("keep_fixed", [True, False])
+def test_extend_basis(keep_fixed):
+    tool = FreeDiffusionTool([0, 1000], 60)
+    basis = tool.basis_vectors
+    result = tool.extend_basis(4, keep_fixed=keep_fixed, seed=0)
+    assert tool.n_dims == 64
+    # the extended basis must not be shared with a tool optimizing 64 directions
+    assert tool.basis_key()[0] == "explicit"
+    assert tool.basis_key() != FreeDiffusionTool([0, 1000], 64).basis_key()
+    assert tool.basis_vectors.shape == (64, 3)
+    assert tool.get_diffusion_vectors().shape == (128, 3)
+    if keep_fixed:
+        assert np.allclose(tool.basis_vectors[:60], basis)
+    cold = minimize_energy(64, seed=0)
+    assert result.iterations < cold.iterations
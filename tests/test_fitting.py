@@ -0,0 +1,119 @@
+import numpy as np
+import pytest
+
+from freediffusiontoolkit.cli import main
+from freediffusiontoolkit.fitting import (
+    design_matrix,
+    fit_array,
+    fit_voxels,
+    gradient_table_from_vectors,
+    tensor_metrics,
+    vector_file_b_values,
+)
+from freediffusiontoolkit.siemens_tools import BasicSiemensTool
+
+EIGENVALUES = np.array([1.7e-3, 0.3e-3, 0.3e-3])
+MD = EIGENVALUES.mean()
+FA = np.sqrt(1.5 * ((EIGENVALUES - MD) ** 2).sum() / (EIGENVALUES**2).sum())
+
+
+def gradient_table(n_directions: int = 30, seed: int = 0):
+    rng = np.random.default_rng(seed)
+    directions = rng.normal(size=(n_directions, 3))
+    directions /= np.linalg.norm(directions, axis=1, keepdims=True)
+    b_values = np.concatenate(([0], np.full(n_directions, 1000.0)))
+    return b_values, np.concatenate((np.zeros((1, 3)), directions))
+
+
+def tensor_signal(b_values, directions, s0=1000.0):
+    projections = (directions**2 * EIGENVALUES).sum(1)
+    return s0 * np.exp(-b_values * projections)
+
+
+def test_gradient_table_from_vectors():
+    vectors = np.array([[0, 0, 0], [0.5, 0, 0], [0, 0, -1]])
+    b_values, directions = gradient_table_from_vectors(vectors, 1000)
+    np.testing.assert_allclose(b_values, [0, 500, 1000])
+    np.testing.assert_allclose(directions, [[0, 0, 0], [1, 0, 0], [0, 0, -1]])
+
+    b_values, _ = gradient_table_from_vectors(vectors, 1000, "quadratic")
+    np.testing.assert_allclose(b_values, [0, 250, 1000])
+    with pytest.raises(ValueError):
+        gradient_table_from_vectors(vectors, 1000, "cubic")
+
+
+@pytest.mark.parametrize("weighted", [False, True])
+def test_fit_voxels_recovers_tensor(weighted):
+    b_values, directions = gradient_table()
+    design = design_matrix(b_values, directions)
+    signals = np.stack([tensor_signal(b_values, directions, s0) for s0 in (500, 2000)])
+
+    coefficients = fit_voxels(signals, design, weighted=weighted)
+    np.testing.assert_allclose(np.exp(coefficients[:, 0]), [500, 2000])
+    md, fa = tensor_metrics(coefficients)
+    np.testing.assert_allclose(md, MD)
+    np.testing.assert_allclose(fa, FA)
+
+
+def test_fit_array_maps_and_mask():
+    b_values, directions = gradient_table()
+    data = np.broadcast_to(
+        tensor_signal(b_values, directions), (4, 3, 2, b_values.size)
+    )
+    data = np.asfortranarray(data)
+    mask = np.zeros((4, 3, 2), dtype=bool)
+    mask[1:3, :, 1] = True
+
+    maps = fit_array(data, b_values, directions, mask=mask, chunk_size=5)
+    assert set(maps) == {"S0", "ADC", "MD", "FA"}
+    assert maps["FA"].shape == (4, 3, 2)
+    np.testing.assert_allclose(maps["MD"][mask], MD, rtol=1e-5)
+    np.testing.assert_allclose(maps["FA"][mask], FA, rtol=1e-5)
+    np.testing.assert_allclose(maps["S0"][mask], 1000, rtol=1e-5)
+    assert (maps["FA"][~mask] == 0).all()
+
+    adc_only = fit_array(data, b_values, max_workers=1)
+    assert set(adc_only) == {"S0", "ADC"}
+    assert (adc_only["ADC"] > 0).all()
+
+    with pytest.raises(ValueError):
+        fit_array(data[..., :-1], b_values)
+
+
+def test_vector_file_b_values(tmp_path, qspace_stub):
+    tool = BasicSiemensTool([0, 1000, 2000], None, points_per_shell=[1, 6, 12])
+    tool.scale_by_value = 4000
+    tool.save(tmp_path / "scheme.dvs")
+    header = BasicSiemensTool().load(tmp_path / "scheme.dvs")
+    assert header["points_per_shell"] == [1, 6, 12]
+    np.testing.assert_array_equal(
+        vector_file_b_values(header, 19), tool.vector_b_values()
+    )
+    with pytest.raises(ValueError, match="b_max"):
+        vector_file_b_values(header, 20)
+    with pytest.raises(ValueError, match="b_max"):
+        vector_file_b_values({"b_values": [0, 1000]}, 2)
+
+
+@pytest.mark.parametrize("scale_by_value", [None, 2000])
+def test_fit_image_with_vector_file(tmp_path, scale_by_value):
+    nib = pytest.importorskip("nibabel")
+    tool = BasicSiemensTool([500, 1000], 30, scale_by_value=scale_by_value)
+    vector_file = tmp_path / "scheme.dvs"
+    tool.save(vector_file)
+    b_values = tool.vector_b_values()
+    directions = gradient_table_from_vectors(tool.get_diffusion_vectors(), 1)[1]
+    data = np.broadcast_to(
+        tensor_signal(b_values, directions), (3, 3, 2, b_values.size)
+    ).astype(np.float32)
+    image_file = tmp_path / "dwi.nii.gz"
+    nib.save(nib.Nifti1Image(data, np.eye(4)), image_file)
+
+    main(
+        ["freediffusiontoolkit", "fit", str(image_file), "--vectors", str(vector_file)]
+    )
+
+    md = np.asanyarray(nib.load(tmp_path / "dwi_MD.nii.gz").dataobj)
+    fa = np.asanyarray(nib.load(tmp_path / "dwi_FA.nii.gz").dataobj)
+    np.testing.assert_allclose(md, MD, rtol=1e-3)
+    np.testing.assert_allclose(fa, FA, rtol=1e-3)
@@ -47,3 +47,94 @@ def test_get_vector_4dims():
         vectors[diff_tool.n_dims * 2:, :],
         diff_tool.b_values[-2] / diff_tool.b_values[-1],
     )
+
+
+def test_get_vectors_matches_per_b_value_scaling():
+    diff_tool = FreeDiffusionTool([0, 250, 500, 1000], 3)
+    diff_tool.basis_vectors = np.eye(3)
+    vectors = diff_tool.get_diffusion_vectors()
+    expected = np.concatenate([np.eye(3) * b / 1000 for b in diff_tool.b_values])
+    assert np.array_equal(vectors, expected)
+
+
+def test_get_vectors_out_buffer():
+    diff_tool = FreeDiffusionTool([0, 500, 1000], 3, scale_by_value=500)
+    diff_tool.basis_vectors = np.eye(3)
+    out = np.zeros((9, 3), dtype=np.float32)
+    vectors = diff_tool.get_diffusion_vectors(out=out)
+    assert vectors is out
+    assert np.array_equal(out[-3:], np.eye(3) * 2)
+
+    with pytest.raises(ValueError):
+        diff_tool.get_diffusion_vectors(out=np.zeros((8, 3)))
+
+
+def test_get_vectors_dtype():
+    diff_tool = FreeDiffusionTool([0, 1000], 3)
+    diff_tool.basis_vectors = np.eye(3)
+    assert diff_tool.get_diffusion_vectors(dtype=np.float32).dtype == np.float32
+
+
+def test_basis_vectors_reset_on_n_dims():
+    diff_tool = FreeDiffusionTool([0, 1000], 3)
+    diff_tool.basis_vectors = np.eye(3)
+    diff_tool.n_dims = 4
+    assert diff_tool._basis_vectors is None
+
+
+def test_multi_shell_vectors():
+    diff_tool = FreeDiffusionTool([0, 500, 1000], None, points_per_shell=[1, 2, 3])
+    assert diff_tool.n_directions == 6
+    basis = np.zeros((6, 3))
+    basis[1:] = np.eye(3)[[0, 1, 0, 1, 2]]
+    diff_tool.basis_vectors = basis
+    vectors = diff_tool.get_diffusion_vectors()
+    assert vectors.shape == (6, 3)
+    assert np.array_equal(vectors[0], [0, 0, 0])
+    assert np.array_equal(vectors[1:3], np.eye(3)[:2] * 0.5)
+    assert np.array_equal(vectors[3:], np.eye(3))
+
+
+def test_multi_shell_points_per_shell_mismatch():
+    diff_tool = FreeDiffusionTool([0, 1000], None, points_per_shell=[1, 2, 3])
+    with pytest.raises(ValueError):
+        diff_tool.get_basis_vectors()
+
+
+def test_multi_shell_optimization(qspace_stub):
+    diff_tool = FreeDiffusionTool(
+        [0, 1000, 2000], None, points_per_shell=[1, 10, 20], basis_cache=None
+    )
+    basis = diff_tool.get_basis_vectors()
+    assert basis.shape == (31, 3)
+    assert np.array_equal(basis[0], [0, 0, 0])
+    assert np.allclose(np.linalg.norm(basis[1:], axis=1), 1)
+    # only the shells with b_value > 0 are optimized
+    assert qspace_stub.calls[0]["points_per_shell"] == [10, 20]
+
+    warm_tool = FreeDiffusionTool(
+        [0, 1000, 2000],
+        None,
+        points_per_shell=[1, 10, 22],
+        basis_cache=None,
+        init_points=basis,
+        max_iter=50,
+    )
+    assert warm_tool.get_basis_vectors().shape == (33, 3)
+    call = qspace_stub.calls[1]
+    assert call["max_iter"] == 50
+    # the zero row of the b_value 0 shell is dropped, two new points are added
+    assert call["init_points"].shape == (32, 3)
+    assert np.array_equal(call["init_points"][:30], basis[1:])
+    np.testing.assert_allclose(np.linalg.norm(call["init_points"], axis=1), 1)
+
+
+def test_multi_shell_b_values_change(qspace_stub):
+    diff_tool = FreeDiffusionTool(
+        [0, 1000], None, points_per_shell=[1, 6], basis_cache=None
+    )
+    assert np.array_equal(diff_tool.vectors[0], [0, 0, 0])
+    diff_tool.b_values = [500, 1000]
+    norms = np.linalg.norm(diff_tool.vectors, axis=1)
+    np.testing.assert_allclose(norms, [0.5] + [1] * 6)
+    assert qspace_stub.calls[-1]["points_per_shell"] == [1, 6]
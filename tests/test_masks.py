@@ -0,0 +1,63 @@
+import numpy as np
+import pytest
+
+from freediffusiontoolkit.masks import (
+    broadcast_mask,
+    create_masks,
+    load_mask,
+    roi_label_map,
+)
+
+nib = pytest.importorskip("nibabel")
+
+
+def meshgrid_label_map(shape, radius, inner_radius, outer_radius):
+    """Direct translation of createMasks.m for a square x-z plane."""
+    nx, ny, nz = shape
+    mask = np.zeros(shape)
+    center_x = round(nx / 2 + 1e-9)
+    center_z = round(nz / 2 + 1e-9)
+    X, Z = np.meshgrid(np.arange(1, nx + 1), np.arange(1, nz + 1))
+    distance = (X - center_x) ** 2 + (Z - center_z) ** 2
+    circle = distance <= radius**2
+    ring = (distance <= outer_radius**2) & (distance >= inner_radius**2)
+    mask[:, 1, :] = circle * 1 + ring * 2
+    return mask
+
+
+@pytest.mark.parametrize("shape", [(32, 4, 32), (33, 3, 33)])
+def test_roi_label_map(shape):
+    labels = roi_label_map(shape, 5, 10, 12)
+    assert labels.dtype == np.uint8
+    assert np.array_equal(labels, meshgrid_label_map(shape, 5, 10, 12))
+    assert not labels[:, 0].any()
+
+
+def test_broadcast_mask():
+    mask = roi_label_map((16, 3, 16), 3, 5, 6)
+    mask4d = broadcast_mask(mask, 10)
+    assert mask4d.shape == (16, 3, 16, 10)
+    assert np.shares_memory(mask4d, mask)
+    assert np.array_equal(mask4d[..., 7], mask)
+
+
+def test_create_and_load_masks(tmp_path):
+    nib.save(
+        nib.Nifti1Image(np.zeros((16, 3, 16, 5), dtype=np.float32), np.eye(4)),
+        tmp_path / "scan.nii.gz",
+    )
+    (mask_file,) = create_masks(tmp_path, tmp_path / "results", 3, 5, 6)
+    assert mask_file.name == "scan_mask.nii"
+    mask = nib.load(mask_file)
+    assert mask.shape == (16, 3, 16)
+    assert mask.get_data_dtype() == np.uint8
+    assert np.array_equal(load_mask(mask_file), roi_label_map((16, 3, 16), 3, 5, 6))
+
+
+def test_load_legacy_mask(tmp_path):
+    mask = roi_label_map((16, 3, 16), 3, 5, 6)
+    nib.save(
+        nib.Nifti1Image(np.repeat(mask[..., np.newaxis], 4, axis=3), np.eye(4)),
+        tmp_path / "legacy_mask.nii",
+    )
+    assert np.array_equal(load_mask(tmp_path / "legacy_mask.nii"), mask)
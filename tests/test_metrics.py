@@ -0,0 +1,68 @@
+import numpy as np
+import pytest
+
+from freediffusiontoolkit.directions import electrostatic_energy, library_directions
+from freediffusiontoolkit.free_diffusion_tools import FreeDiffusionTool
+from freediffusiontoolkit.metrics import (
+    condition_number,
+    energy,
+    minimum_angle,
+    scheme_metrics,
+    simulate_noise,
+    simulate_scheme,
+)
+
+
+@pytest.mark.parametrize("antipodal", [True, False])
+def test_energy_matches_unchunked(antipodal):
+    directions = library_directions(30)
+    np.testing.assert_allclose(
+        energy(directions, antipodal, chunk_size=7),
+        electrostatic_energy(directions, antipodal),
+    )
+
+
+def test_minimum_angle():
+    axes = np.eye(3)
+    assert minimum_angle(axes) == pytest.approx(90)
+    opposite = np.array([[1.0, 0, 0], [-1.0, 0, 0], [0, 1.0, 0]])
+    assert minimum_angle(opposite, chunk_size=1) == pytest.approx(0)
+    assert minimum_angle(opposite, antipodal=False) == pytest.approx(90)
+    assert np.isnan(minimum_angle(axes[:1]))
+
+
+def test_scheme_metrics_multi_shell():
+    tool = FreeDiffusionTool([500, 1000], 30)
+    metrics = scheme_metrics(tool.get_diffusion_vectors(), 1000)
+    assert metrics.n_directions == 30
+    assert metrics.energy == pytest.approx(energy(library_directions(30)))
+    assert 0 < metrics.minimum_angle < 90
+    assert np.isfinite(metrics.condition_number)
+
+
+def test_condition_number():
+    b_values = np.r_[0, np.full(6, 1000)]
+    directions = np.r_[np.zeros((1, 3)), library_directions(6)]
+    assert np.isfinite(condition_number(b_values, directions))
+    # three directions cannot determine six tensor elements
+    assert condition_number(b_values[:4], np.r_[np.zeros((1, 3)), np.eye(3)]) == np.inf
+    coplanar = np.r_[np.zeros((1, 3)), np.eye(3), np.eye(3)]
+    coplanar[4:, 2] = 0
+    assert condition_number(b_values, coplanar) > 1e12
+
+
+def test_simulate_noise():
+    vectors = FreeDiffusionTool([1000], 30).get_diffusion_vectors()
+    low = simulate_scheme(vectors, 1000, b0_volumes=3, snr=10, n_samples=5000, seed=0)
+    high = simulate_scheme(vectors, 1000, b0_volumes=3, snr=200, n_samples=5000, seed=0)
+    assert high.fa_std < low.fa_std
+    assert abs(high.fa_bias) < abs(low.fa_bias)
+    assert abs(high.md_bias) < 0.01 * high.md
+    assert high == simulate_scheme(
+        vectors, 1000, b0_volumes=3, snr=200, n_samples=5000, seed=0
+    )
+
+    b_values = np.r_[0, np.full(6, 1000)]
+    directions = np.r_[np.zeros((1, 3)), library_directions(6)]
+    result = simulate_noise(b_values, directions, n_samples=100, weighted=True, seed=1)
+    assert np.isfinite(result.fa_std)
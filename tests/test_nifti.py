@@ -0,0 +1,86 @@
+import os
+
+import numpy as np
+import pytest
+
+from freediffusiontoolkit.nifti import NiftiCache, load_data, slab_views, volume_views
+
+nib = pytest.importorskip("nibabel")
+
+
+def write_image(filename, shape=(6, 5, 4, 3)):
+    data = np.arange(np.prod(shape), dtype=np.float32).reshape(shape)
+    nib.save(nib.Nifti1Image(data, np.eye(4)), filename)
+    return data
+
+
+def test_uncompressed_once(tmp_path):
+    cache = NiftiCache(tmp_path / "cache", enabled=True)
+    source = tmp_path / "image.nii.gz"
+    data = write_image(source)
+
+    path = cache.uncompressed(source)
+    assert path.parent == tmp_path / "cache"
+    assert path.suffix == ".nii"
+    mtime = path.stat().st_mtime_ns
+    assert cache.uncompressed(source) == path
+    assert path.stat().st_mtime_ns >= mtime
+
+    loaded = load_data(source, cache)
+    assert isinstance(loaded, np.memmap)
+    assert not loaded.flags.writeable
+    np.testing.assert_array_equal(loaded, data)
+
+
+def test_changed_source(tmp_path):
+    cache = NiftiCache(tmp_path / "cache", enabled=True)
+    source = tmp_path / "image.nii.gz"
+    write_image(source)
+    first = cache.uncompressed(source)
+    data = write_image(source, (3, 3, 3, 2))
+    os.utime(source, ns=(0, 0))
+    second = cache.uncompressed(source)
+    assert second != first
+    np.testing.assert_array_equal(load_data(source, cache), data)
+
+
+def test_uncompressed_passthrough(tmp_path):
+    source = tmp_path / "image.nii"
+    write_image(source)
+    assert NiftiCache(tmp_path / "cache", enabled=True).uncompressed(source) == source
+    compressed = tmp_path / "image.nii.gz"
+    write_image(compressed)
+    disabled = NiftiCache(tmp_path / "cache", enabled=False)
+    assert disabled.uncompressed(compressed) == compressed
+
+
+def test_eviction(tmp_path):
+    sources = [tmp_path / f"image_{idx}.nii.gz" for idx in range(4)]
+    for source in sources:
+        write_image(source)
+    cache = NiftiCache(tmp_path / "cache", enabled=True)
+    size = cache.uncompressed(sources[0]).stat().st_size
+    cache.max_bytes = 2 * size
+
+    paths = cache.prefetch(sources, max_workers=2)
+    assert all(path.parent == tmp_path / "cache" for path in paths)
+    remaining = list((tmp_path / "cache").glob("*.nii"))
+    assert sum(path.stat().st_size for path in remaining) <= 2 * size
+    cache.clear()
+    assert not list((tmp_path / "cache").glob("*.nii"))
+
+
+def test_views_share_memory():
+    data = np.arange(4 * 3 * 5 * 4, dtype=np.float64).reshape(4, 3, 5, 4)
+    views = volume_views(data, np.array([0, 1000, 0, 1000]))
+    assert sorted(views) == [0.0, 1000.0]
+    assert len(views[1000.0]) == 2
+    assert all(np.shares_memory(view, data) for view in views[0.0])
+    np.testing.assert_array_equal(views[1000.0][1], data[..., 3])
+
+    slabs = list(slab_views(data, 2))
+    assert [(start, stop) for start, stop, _ in slabs] == [(0, 2), (2, 4), (4, 5)]
+    assert all(np.shares_memory(view, data) for _, _, view in slabs)
+
+    with pytest.raises(ValueError):
+        volume_views(data, np.array([0, 1000]))
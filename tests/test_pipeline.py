@@ -0,0 +1,95 @@
+import json
+
+import numpy as np
+import pytest
+
+from freediffusiontoolkit.cli import main
+from freediffusiontoolkit.pipeline import (
+    MANIFEST_NAME,
+    PipelineParameters,
+    run_pipeline,
+)
+
+nib = pytest.importorskip("nibabel")
+
+B_VALUES = np.array([0, 0, 500, 500, 1000, 1000])
+ADC = 1.5e-3
+
+
+def add_scan(folder, name: str, seed: int = 0):
+    rng = np.random.default_rng(seed)
+    data = rng.normal(0, 5, (12, 3, 12, B_VALUES.size))
+    data[3:9, :, 3:9] += 1000 * np.exp(-B_VALUES * ADC)
+    nib.save(
+        nib.Nifti1Image(data.astype(np.float32), np.eye(4)), folder / f"{name}.nii.gz"
+    )
+    np.savetxt(folder / f"{name}.bval", B_VALUES[np.newaxis], fmt="%d")
+
+
+@pytest.fixture
+def folder(tmp_path):
+    for idx in range(2):
+        add_scan(tmp_path, f"scan{idx}", idx)
+    return tmp_path
+
+
+PARAMS = PipelineParameters(
+    radius=2, inner_radius=4, outer_radius=5, fit_start_b_value=500
+)
+
+
+def test_pipeline_skips_up_to_date_stages(folder, tmp_path_factory):
+    results = tmp_path_factory.mktemp("results")
+    report = run_pipeline(folder, results, PARAMS, max_workers=2)
+    assert report.executed == {
+        "scan0": ["mask", "geometric_mean", "snr"],
+        "scan1": ["mask", "geometric_mean", "snr"],
+    }
+    assert not report.errors
+    assert np.isclose(report.statistics[0].adc, ADC, rtol=0.1)
+    assert (results / MANIFEST_NAME).is_file()
+    assert report.results_file == results / "snr_results.csv"
+
+    # nothing changed
+    report = run_pipeline(folder, results, PARAMS, max_workers=1)
+    assert report.executed == {"scan0": [], "scan1": []}
+    assert np.isclose(report.statistics[0].adc, ADC, rtol=0.1)
+
+    # one new scan only costs its own stages
+    add_scan(folder, "scan2", 2)
+    report = run_pipeline(folder, results, PARAMS, max_workers=1)
+    assert report.executed["scan2"] == ["mask", "geometric_mean", "snr"]
+    assert report.executed["scan0"] == report.executed["scan1"] == []
+
+    # changed radii only rebuild masks and SNR
+    changed = PipelineParameters(3, 4, 5, 500)
+    report = run_pipeline(folder, results, changed, max_workers=1)
+    assert report.executed["scan0"] == ["mask", "snr"]
+
+    # a deleted output is rebuilt, the identical content does not trigger SNR
+    (results / "scan1_geometric_mean_combined.nii").unlink()
+    report = run_pipeline(folder, results, changed, max_workers=1)
+    assert report.executed["scan1"] == ["geometric_mean"]
+    assert report.executed["scan0"] == []
+
+    report = run_pipeline(folder, results, changed, max_workers=1, force=True)
+    assert all(len(stages) == 3 for stages in report.executed.values())
+
+
+def test_pipeline_missing_bval(folder):
+    (folder / "scan1.bval").unlink()
+    report = run_pipeline(folder, params=PARAMS, max_workers=1)
+    assert list(report.errors) == ["scan1"]
+    assert report.statistics[0].error is None
+    manifest = json.loads((folder / MANIFEST_NAME).read_text())
+    assert manifest["files"]["scan1"] == {}
+
+
+def test_cmd_pipeline(folder, capsys):
+    args = ["freediffusiontoolkit", "pipeline", str(folder), "--radius", "2"]
+    args += ["--inner-radius", "4", "--outer-radius", "5", "--workers", "1"]
+    main(args)
+    main(args)
+    output = capsys.readouterr().out
+    assert output.count("up to date") == 2
+    assert (folder / "snr_results.csv").is_file()
@@ -0,0 +1,92 @@
+import json
+import os
+import subprocess
+import sys
+from pathlib import Path
+
+import numpy as np
+import pytest
+
+from freediffusiontoolkit import profiling
+from freediffusiontoolkit.siemens_tools import BasicSiemensTool
+
+
+@pytest.fixture
+def profiler():
+    profiling.disable()
+    active = profiling.enable()
+    yield active
+    profiling.disable()
+
+
+def test_disabled():
+    profiling.disable()
+    with profiling.span("nothing"):
+        profiling.count("nothing")
+    assert profiling.profiler() is None
+
+
+def test_spans_and_counters(profiler, tmp_path):
+    filename = tmp_path / "vectors.dvs"
+    # non-ASCII characters take several bytes in the file
+    tool = BasicSiemensTool([0, 1000], 6, basis_cache=None, description="Δ 10 µs")
+    tool.save(filename)
+    BasicSiemensTool().load(filename)
+
+    summary = profiler.summary()
+    names = ("get_basis_vectors", "get_diffusion_vectors", "serialize", "write")
+    for name in names + ("vectors_to_string", "load"):
+        assert summary["spans"][name]["calls"] == 1
+    spans = summary["spans"]
+    assert spans["vectors_to_string"]["total_s"] <= spans["serialize"]["total_s"]
+    assert summary["counters"]["bytes_written"] == filename.stat().st_size
+    assert summary["counters"]["vectors_parsed"] == 12
+    assert summary["max_rss_bytes"] is None or summary["max_rss_bytes"] > 0
+
+
+def test_write_formats(profiler, tmp_path):
+    with profiling.span("outer", n=3):
+        with profiling.span("inner"):
+            np.ones(1000).sum()
+    profiling.count("items", 3)
+
+    summary = json.loads(profiler.write(tmp_path / "profile.json").read_text())
+    assert summary["spans"]["outer"]["calls"] == 1
+    assert summary["counters"] == {"items": 3}
+
+    trace = json.loads(profiler.write(tmp_path / "profile.trace.json").read_text())
+    spans = {
+        event["name"]: event for event in trace["traceEvents"] if event["ph"] == "X"
+    }
+    assert spans["outer"]["args"] == {"n": 3}
+    assert spans["outer"]["ts"] <= spans["inner"]["ts"]
+    assert spans["inner"]["dur"] <= spans["outer"]["dur"]
+    with pytest.raises(ValueError):
+        profiler.write(tmp_path / "profile.txt", trace_format="csv")
+
+
+def test_profile_from_environment(tmp_path):
+    python_path = os.pathsep.join(
+        filter(None, [str(Path(__file__).parents[1]), os.environ.get("PYTHONPATH")])
+    )
+    subprocess.run(
+        [
+            sys.executable,
+            "-c",
+            "from freediffusiontoolkit.cli import run; "
+            "run(['', '0,1000', '6', 'siemens', 'vectors.dvs', '--no-daemon'])",
+        ],
+        cwd=tmp_path,
+        env={
+            **os.environ,
+            "FDT_CACHE_DISABLE": "1",
+            "FDT_PROFILE": str(tmp_path / "profile_{pid}.trace.json"),
+            "PYTHONPATH": python_path,
+        },
+        check=True,
+    )
+    (trace_file,) = tmp_path.glob("profile_*.trace.json")
+    names = {
+        event["name"] for event in json.loads(trace_file.read_text())["traceEvents"]
+    }
+    assert {"cli.run", "write", "max_rss"} <= names
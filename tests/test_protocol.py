@@ -0,0 +1,96 @@
+import pickle
+
+import numpy as np
+import pytest
+
+from freediffusiontoolkit.protocol import Protocol
+from freediffusiontoolkit.siemens_tools import BasicSiemensTool, read_vector_file
+from freediffusiontoolkit.writers import export
+
+
+@pytest.fixture
+def tool():
+    return BasicSiemensTool([0, 500, 1000], 6, basis_cache=None)
+
+
+def test_protocol_layout(tool):
+    protocol = tool.protocol()
+    assert len(protocol) == 18
+    assert protocol.data.shape == (18, 4)
+    assert protocol.data.flags.c_contiguous
+    assert not protocol.data.flags.writeable
+    np.testing.assert_array_equal(protocol.vectors, tool.get_diffusion_vectors())
+    np.testing.assert_array_equal(protocol.b_values, tool.vector_b_values())
+    assert protocol.shell_b_values == [0, 500, 1000]
+    assert protocol.points_per_shell == [6, 6, 6]
+
+    b_value, shell = protocol.shells[2]
+    assert b_value == 1000
+    assert np.shares_memory(shell, protocol.data)
+    assert np.shares_memory(protocol.shell(500), protocol.data)
+    with pytest.raises(KeyError):
+        protocol.shell(2000)
+    with pytest.raises(AttributeError):
+        protocol.key = "changed"
+    with pytest.raises(ValueError):
+        protocol.vectors[0, 0] = 1
+
+
+def test_protocol_hash(tool):
+    protocol = tool.protocol()
+    assert tool.protocol() is protocol
+    same = Protocol(protocol.vectors.copy(), protocol.b_values.copy())
+    assert same == protocol and hash(same) == hash(protocol)
+    assert len({protocol, same}) == 1
+
+    restored = pickle.loads(pickle.dumps(protocol))
+    assert restored == protocol and restored.key == protocol.key
+    assert not restored.data.flags.writeable
+
+    negative_zero = Protocol(np.array([[-0.0, 0.0, 1.0]]), [1000])
+    assert negative_zero == Protocol(np.array([[0.0, 0.0, 1.0]]), [1000])
+    with pytest.raises(ValueError):
+        Protocol(np.zeros((2, 3)), [0, 0, 1000])
+
+
+def test_tool_invalidation(tool):
+    protocol = tool.protocol()
+    tool.b_values = [0, 1000]
+    assert len(tool.vectors) == 12
+    assert tool.protocol() != protocol
+
+    tool.scale_by_value = 2000
+    np.testing.assert_allclose(np.linalg.norm(tool.vectors[-1]), 0.5)
+    tool.n_dims = 3
+    assert len(tool.vectors) == 6
+
+
+def test_from_protocol_and_writers(tool, tmp_path):
+    protocol = tool.protocol()
+    restored = BasicSiemensTool.from_protocol(protocol)
+    assert restored.b_values == [0, 500, 1000] and restored.n_dims == 6
+    assert restored.protocol() is protocol
+
+    files = export(protocol, [tmp_path / "vectors.dvs", tmp_path / "vectors.bval"])
+    vectors, header = read_vector_file(files[0])
+    np.testing.assert_allclose(vectors, protocol.vectors, atol=1e-6)
+    assert header["n_dims"] == 6
+    np.testing.assert_array_equal(np.loadtxt(files[1]), protocol.b_values)
+
+    multi_shell = Protocol(np.eye(3), [0, 1000, 1000])
+    tool = BasicSiemensTool.from_protocol(multi_shell)
+    assert tool.points_per_shell == [1, 2]
+    tool.save(tmp_path / "multi.dvs")
+    np.testing.assert_allclose(read_vector_file(tmp_path / "multi.dvs")[0], np.eye(3))
+
+
+def test_multi_shell_protocol_invalidation(qspace_stub):
+    tool = BasicSiemensTool([0, 1000], 7, points_per_shell=[1, 6], basis_cache=None)
+    protocol = tool.protocol()
+    np.testing.assert_array_equal(protocol.vectors[0], 0)
+
+    tool.b_values = [500, 1000]
+    rebuilt = tool.protocol()
+    assert rebuilt != protocol
+    assert rebuilt.shell_b_values == [500, 1000]
+    np.testing.assert_allclose(np.linalg.norm(rebuilt.vectors, axis=1), [0.5] + [1] * 6)
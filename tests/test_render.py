@@ -0,0 +1,52 @@
+import numpy as np
+import pytest
+
+from freediffusiontoolkit.free_diffusion_tools import FreeDiffusionTool
+from freediffusiontoolkit.vector_ploter import (
+    render_batch,
+    render_vectors,
+    split_shells,
+)
+
+pytest.importorskip("matplotlib")
+
+
+def test_render_vectors_png_and_svg(tmp_path):
+    vectors = FreeDiffusionTool([1000], 30).get_diffusion_vectors()
+    png = render_vectors(vectors, tmp_path / "scheme.png", show_inverted=True)
+    svg = render_vectors(vectors, tmp_path / "scheme.svg", title="30 directions")
+    assert png.read_bytes().startswith(b"\x89PNG")
+    assert b"<svg" in svg.read_bytes()
+
+
+def test_render_large_scheme_as_points(tmp_path):
+    rng = np.random.default_rng(0)
+    vectors = rng.normal(size=(5000, 3))
+    vectors /= np.linalg.norm(vectors, axis=1, keepdims=True)
+    png = render_vectors(vectors, tmp_path / "large.png", show_inverted=True)
+    assert png.stat().st_size > 0
+
+
+def test_split_shells():
+    vectors = FreeDiffusionTool([0, 500, 1000], 6).get_diffusion_vectors()
+    shells = split_shells(vectors)
+    assert list(shells) == [0.5, 1.0]
+    assert all(shell.shape == (6, 3) for shell in shells.values())
+
+
+def test_render_batch(tmp_path):
+    schemes = {
+        "six": FreeDiffusionTool([1000], 6).get_diffusion_vectors(),
+        "multi": FreeDiffusionTool([500, 1000], 12).get_diffusion_vectors(),
+    }
+    files = render_batch(schemes, tmp_path, max_workers=2)
+    assert [file.name for file in files] == ["six.png", "multi.png"]
+
+    files = render_batch(
+        {"multi": schemes["multi"]}, tmp_path, file_format="svg", by_shell=True
+    )
+    assert [file.name for file in files] == [
+        "multi_shell_0.5.svg",
+        "multi_shell_1.svg",
+    ]
+    assert all(file.is_file() for file in files)
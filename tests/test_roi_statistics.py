@@ -0,0 +1,128 @@
+import numpy as np
+import pytest
+
+from freediffusiontoolkit.analysis import snr_statistics
+from freediffusiontoolkit.masks import NOISE_LABEL, SIGNAL_LABEL
+from freediffusiontoolkit.roi_statistics import (
+    Moments,
+    QuantileSketch,
+    RoiStatistics,
+    roi_statistics,
+    write_boxplot_statistics,
+)
+
+
+@pytest.fixture
+def image():
+    rng = np.random.default_rng(3)
+    shape = (12, 10, 9)
+    mask = np.zeros(shape, dtype=np.uint8)
+    mask[2:9, 2:8, :] = SIGNAL_LABEL
+    mask[10:, :, :] = NOISE_LABEL
+    data = np.empty(shape + (3,))
+    for idx, level in enumerate((1000, 600, 300)):
+        data[..., idx] = rng.lognormal(np.log(level), 0.3, shape)
+    data[mask == NOISE_LABEL] = rng.rayleigh(20, (int((mask == NOISE_LABEL).sum()), 3))
+    data[3, 3, 3, 1] = -1
+    data[4, 4, 4, 2] = np.nan
+    return data, mask, np.array([0, 500, 1000, 0])
+
+
+def test_moments_merge():
+    rng = np.random.default_rng(0)
+    values = rng.normal(1e6, 1.0, (1000, 2))
+    valid = rng.random((1000, 2)) > 0.1
+    first, second = Moments(2), Moments(2)
+    first.update(values[:300], valid[:300])
+    second.update(values[300:], valid[300:])
+    first.merge(second)
+    for column in range(2):
+        selected = values[valid[:, column], column]
+        assert first.count[column] == selected.size
+        np.testing.assert_allclose(first.mean[column], selected.mean())
+        np.testing.assert_allclose(first.std[column], selected.std(ddof=1), rtol=1e-9)
+        assert first.min[column] == selected.min()
+    assert np.isnan(Moments(1).std[0])
+
+
+@pytest.mark.parametrize("accuracy", [0.001, 0.01, 0.05])
+def test_sketch_accuracy(accuracy):
+    values = np.random.default_rng(1).lognormal(5, 2, 20000)
+    sketch = QuantileSketch(accuracy)
+    for chunk in np.array_split(values, 7):
+        sketch.update(chunk)
+    for q in (0, 0.01, 0.25, 0.5, 0.75, 0.99, 1):
+        exact = np.quantile(values, q, method="hazen")
+        assert abs(sketch.quantile(q) - exact) <= accuracy * exact * (1 + 1e-9)
+    # memory depends on the value range only
+    assert sketch._counts.size < 20 / accuracy
+
+
+def test_sketch_merge_and_exact():
+    values = np.random.default_rng(2).lognormal(0, 1, 5000)
+    merged = QuantileSketch(0.01)
+    merged.update(values[:1000])
+    other = QuantileSketch(0.01)
+    other.update(values[1000:])
+    merged.merge(other)
+    single = QuantileSketch(0.01)
+    single.update(values)
+    assert merged.quantile(0.3) == single.quantile(0.3)
+
+    exact = QuantileSketch(0)
+    exact.update(values[:2000])
+    exact.merge(QuantileSketch(0))
+    exact_other = QuantileSketch(0)
+    exact_other.update(np.append(values[2000:], [0, -1, np.inf]))
+    exact.merge(exact_other)
+    assert exact.count == values.size
+    assert exact.quantile(0.75) == np.quantile(values, 0.75, method="hazen")
+    assert exact.lowest_at_least(1.0) == values[values >= 1.0].min()
+    assert exact.highest_at_most(1.0) == values[values <= 1.0].max()
+    with pytest.raises(ValueError):
+        exact.merge(other)
+    assert np.isnan(QuantileSketch().quantile(0.5))
+
+
+def test_roi_statistics(image):
+    data, mask, b_values = image
+    reference = snr_statistics(data, mask, b_values)
+    exact = roi_statistics(data, mask, b_values, relative_accuracy=0)
+    np.testing.assert_allclose(exact.snr_per_b, reference.snr_per_b)
+    np.testing.assert_allclose(exact.snr_total, reference.snr_total)
+    np.testing.assert_array_equal(exact.signal.count, reference.counts)
+
+    # boxplot statistics of processNiftiFiles.m
+    box = exact.boxplots()[1]
+    signal = data[..., 1][mask == SIGNAL_LABEL]
+    log_signal = np.log(signal[signal > 0])
+    q1, median, q3 = np.quantile(log_signal, [0.25, 0.5, 0.75], method="hazen")
+    np.testing.assert_allclose([box.q1, box.median, box.q3], [q1, median, q3])
+    low = log_signal[log_signal >= q1 - 1.5 * (q3 - q1)].min()
+    high = log_signal[log_signal <= q3 + 1.5 * (q3 - q1)].max()
+    np.testing.assert_allclose([box.whisker_low, box.whisker_high], [low, high])
+    assert box.error_bound == 0
+
+    # several slabs and workers give the same result as one pass
+    approximate = roi_statistics(
+        data, mask, b_values, 0.01, max_slab_bytes=1, max_workers=3
+    )
+    np.testing.assert_allclose(approximate.snr_per_b, exact.snr_per_b)
+    for approx_box, exact_box in zip(approximate.boxplots(), exact.boxplots()):
+        assert approx_box.error_bound == pytest.approx(-np.log(0.99))
+        for field in ("q1", "median", "q3"):
+            assert abs(
+                getattr(approx_box, field) - getattr(exact_box, field)
+            ) <= approx_box.error_bound * (1 + 1e-9)
+
+    with pytest.raises(ValueError):
+        exact.merge(RoiStatistics([0, 1000]))
+
+
+def test_write_boxplot_statistics(image, tmp_path):
+    data, mask, b_values = image
+    stat = roi_statistics(data, mask, b_values)
+    table = write_boxplot_statistics({"image": stat}, tmp_path / "boxplots.csv")
+    lines = table.read_text().splitlines()
+    assert lines[0].startswith("Filename,b_value,count")
+    assert len(lines) == 4
@@ -3,6 +3,7 @@ import numpy as np
 import random
 from pathlib import Path
 from freediffusiontoolkit import BasicSiemensTool, LegacySiemensTool
+from freediffusiontoolkit.siemens_tools import parse_vector_file, read_vector_file
 
 
 @pytest.fixture
@@ -82,3 +83,67 @@ def test_legacy_save(
 ):
     free_diffusion_tool_siemens_legacy.save(vector_filename_siemens_legacy)
     assert vector_filename_siemens_legacy.is_file()
+
+
+@pytest.mark.parametrize("newline", ["\n", "\r\n"])
+def test_vectors_to_string_matches_rows(newline):
+    vectors = np.random.uniform(-2, 2, (200, 3))
+    vectors[0] = [-0.0, 0.0, -1e-9]
+    vectors[1] = [1e6, -1e6, 0.5e-6]
+    expected = "".join(
+        BasicSiemensTool.vector_to_string(idx, row) + newline
+        for idx, row in enumerate(vectors)
+    )
+    assert BasicSiemensTool().vectors_to_string(vectors, newline) == expected
+
+
+def test_legacy_write_newline(
+    free_diffusion_tool_siemens_legacy, vector_filename_siemens_legacy
+):
+    free_diffusion_tool_siemens_legacy.save(vector_filename_siemens_legacy)
+    content = vector_filename_siemens_legacy.read_bytes()
+    n_vectors = len(free_diffusion_tool_siemens_legacy.vectors)
+    assert content.count(b"Vector[") == n_vectors
+    assert content.endswith(b")\r\n")
+
+
+def test_basic_load_roundtrip(
+    vector_file_siemens_basic, free_diffusion_tool_siemens_basic
+):
+    header = free_diffusion_tool_siemens_basic.load(vector_file_siemens_basic)
+    n_directions = len(free_diffusion_tool_siemens_basic.b_values) * (
+        free_diffusion_tool_siemens_basic.n_dims
+    )
+    assert free_diffusion_tool_siemens_basic.vectors.shape == (n_directions, 3)
+    assert header["directions"] == n_directions
+    assert header["CoordinateSystem"] == "xyz"
+    assert header["Normalisation"] == "none"
+    assert header["n_dims"] == free_diffusion_tool_siemens_basic.n_dims
+    assert np.allclose(header["b_values"], free_diffusion_tool_siemens_basic.b_values)
+
+
+def test_legacy_load_roundtrip(
+    free_diffusion_tool_siemens_legacy, vector_filename_siemens_legacy
+):
+    free_diffusion_tool_siemens_legacy.save(vector_filename_siemens_legacy)
+    vectors, header = read_vector_file(vector_filename_siemens_legacy)
+    assert header["directions"] == len(vectors)
+    assert np.allclose(vectors, free_diffusion_tool_siemens_legacy.vectors, atol=1e-6)
+
+
+def test_parse_vector_file_errors():
+    text = "[directions=2]\nVector[0] = ( 1.0, 0.0, 0.0)\nVector[1] = ( 1.0, 0.0)\n"
+    with pytest.raises(ValueError, match=":3:"):
+        parse_vector_file(text)
+
+    text = (
+        "[directions=3]\nVector[0] = ( 1.0, 0.0, 0.0)\nVector[1] = ( 0.0, 1.0, 0.0)\n"
+    )
+    with pytest.raises(ValueError, match=":1:"):
+        parse_vector_file(text)
+
+    text = (
+        "[directions=2]\nVector[0] = ( 1.0, 0.0, 0.0)\nVector[2] = ( 0.0, 1.0, 0.0)\n"
+    )
+    with pytest.raises(ValueError, match=":3:"):
+        parse_vector_file(text)
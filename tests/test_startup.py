@@ -0,0 +1,53 @@
+import json
+import os
+import subprocess
+import sys
+from pathlib import Path
+
+import pytest
+
+# Only the imported modules are checked here, the startup time is measured by the
+# cli benchmarks in benchmarks/run_benchmarks.py.
+HEAVY_MODULES = ("qspace", "scipy", "matplotlib")
+
+SCRIPT = """
+import json, sys
+from freediffusiontoolkit.cli import run
+run({args!r})
+print(json.dumps(sorted(sys.modules)))
+"""
+
+
+def imported_modules(args: list, cwd) -> list:
+    python_path = os.pathsep.join(
+        filter(None, [str(Path(__file__).parents[1]), os.environ.get("PYTHONPATH")])
+    )
+    result = subprocess.run(
+        [sys.executable, "-c", SCRIPT.format(args=args)],
+        capture_output=True,
+        text=True,
+        cwd=cwd,
+        env={**os.environ, "FDT_CACHE_DISABLE": "1", "PYTHONPATH": python_path},
+        check=True,
+    )
+    return json.loads(result.stdout.strip().splitlines()[-1])
+
+
+def imported(modules: list, name: str) -> bool:
+    return any(module == name or module.startswith(name + ".") for module in modules)
+
+
+def test_help_startup(tmp_path):
+    modules = imported_modules(["create_vector_file", "-h"], tmp_path)
+    for name in HEAVY_MODULES + ("numpy",):
+        assert not imported(modules, name)
+
+
+@pytest.mark.parametrize("n_dims", ["3", "4", "6", "30"])
+def test_hardcoded_basis_startup(tmp_path, n_dims):
+    modules = imported_modules(
+        ["create_vector_file", "0,1000", n_dims, "Siemens", "a.dvs"], tmp_path
+    )
+    assert (tmp_path / "a.dvs").is_file()
+    for name in HEAVY_MODULES:
+        assert not imported(modules, name)
@@ -0,0 +1,72 @@
+import numpy as np
+import pytest
+
+from freediffusiontoolkit.trace import (
+    compute_geometric_mean,
+    compute_geometric_mean_folder,
+    geometric_mean_trace,
+)
+
+nib = pytest.importorskip("nibabel")
+
+B_VALUES = np.array([0, 0, 500, 500, 500, 1000, 1000, 1000])
+
+
+def naive_geometric_mean(data, b_values):
+    unique_b_values = np.unique(b_values)
+    result = np.full(data.shape[:3] + (unique_b_values.size,), np.nan)
+    for x, y, z in np.ndindex(data.shape[:3]):
+        for idx, b_value in enumerate(unique_b_values):
+            values = data[x, y, z, b_values == b_value]
+            values = values[values > 0]
+            if values.size:
+                result[x, y, z, idx] = np.prod(values) ** (1 / values.size)
+    return result
+
+
+@pytest.fixture
+def data():
+    data = np.random.default_rng(0).uniform(-10, 1000, (6, 5, 7, B_VALUES.size))
+    data[0, 0, 0, :] = 0
+    data[1, 0, 0, 2:5] = -1
+    return data.astype(np.float32)
+
+
+@pytest.fixture
+def nifti_file(tmp_path, data):
+    filename = tmp_path / "scan_2av.nii.gz"
+    nib.save(nib.Nifti1Image(data, np.eye(4)), filename)
+    np.savetxt(tmp_path / "scan_2av.bval", B_VALUES[np.newaxis], fmt="%d")
+    return filename
+
+
+def test_geometric_mean_trace(data):
+    trace, unique_b_values = geometric_mean_trace(data, B_VALUES)
+    assert np.array_equal(unique_b_values, [0, 500, 1000])
+    expected = naive_geometric_mean(data.astype(np.float64), B_VALUES)
+    assert np.allclose(trace, expected, equal_nan=True, rtol=1e-5)
+    assert np.isnan(trace[0, 0, 0]).all()
+    assert np.isnan(trace[1, 0, 0, 1])
+
+
+def test_geometric_mean_many_directions():
+    # the product of 200 values of 1e3 overflows float64
+    data = np.full((1, 1, 1, 200), 1e3)
+    trace, _ = geometric_mean_trace(data, np.full(200, 1000))
+    assert np.isclose(trace[0, 0, 0, 0], 1e3)
+
+
+def test_compute_geometric_mean(nifti_file, data):
+    output_file = compute_geometric_mean(nifti_file, max_slab_bytes=1)
+    assert output_file.name == "scan_2av_geometric_mean_combined.nii"
+    result = nib.load(output_file).get_fdata()
+    assert result.shape == (6, 5, 7, 3)
+    expected, _ = geometric_mean_trace(data, B_VALUES)
+    assert np.allclose(result, expected, equal_nan=True)
+
+
+def test_compute_geometric_mean_folder(nifti_file, tmp_path):
+    (tmp_path / "no_bval.nii.gz").write_bytes(nifti_file.read_bytes())
+    with pytest.warns(UserWarning):
+        results = compute_geometric_mean_folder(tmp_path, tmp_path / "results")
+    assert [path.name for path in results] == ["scan_2av_geometric_mean_combined.nii"]
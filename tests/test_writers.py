@@ -0,0 +1,102 @@
+from pathlib import Path
+
+import numpy as np
+import pytest
+
+from freediffusiontoolkit import writers
+from freediffusiontoolkit.cli import run, vendor_handler
+from freediffusiontoolkit.siemens_tools import BasicSiemensTool, read_vector_file
+
+
+def test_export_computes_vectors_once(tmp_path, monkeypatch):
+    tool = BasicSiemensTool([0, 500, 1000], 6)
+    calls = list()
+    get_diffusion_vectors = tool.get_diffusion_vectors
+    monkeypatch.setattr(
+        tool,
+        "get_diffusion_vectors",
+        lambda *args, **kwargs: calls.append(1) or get_diffusion_vectors(),
+    )
+    files = writers.export(
+        tool,
+        [
+            tmp_path / "scheme.dvs",
+            f"siemens_vb:{tmp_path / 'DiffusionVectors.txt'}",
+            str(tmp_path / "scheme.bval"),
+            ("mrtrix", tmp_path / "scheme.b"),
+        ],
+    )
+    assert len(calls) == 1
+    assert [file.name for file in files] == [
+        "scheme.dvs",
+        "DiffusionVectors.txt",
+        "scheme.bval",
+        "scheme.bvec",
+        "scheme.b",
+    ]
+
+    vectors, header = read_vector_file(tmp_path / "scheme.dvs")
+    np.testing.assert_allclose(vectors, get_diffusion_vectors(), atol=1e-6)
+    assert header["directions"] == 18
+    legacy, _ = read_vector_file(tmp_path / "DiffusionVectors.txt")
+    np.testing.assert_allclose(legacy, vectors)
+
+    b_values = np.loadtxt(tmp_path / "scheme.bval")
+    bvecs = np.loadtxt(tmp_path / "scheme.bvec")
+    np.testing.assert_array_equal(b_values, np.repeat([0, 500, 1000], 6))
+    assert bvecs.shape == (3, 18)
+    np.testing.assert_allclose(np.linalg.norm(bvecs[:, 6:], axis=0), 1, atol=1e-5)
+    assert not bvecs[:, :6].any()
+
+    table = np.loadtxt(tmp_path / "scheme.b")
+    np.testing.assert_allclose(table, np.column_stack((bvecs.T, b_values)))
+
+
+def test_gradient_table_checks_length(tmp_path):
+    tool = BasicSiemensTool([0, 1000], 6)
+    with pytest.raises(ValueError, match="7 vectors"):
+        writers.write_fsl(tool, np.ones((7, 3)), tmp_path / "scheme")
+
+
+def test_registry(tmp_path, monkeypatch):
+    monkeypatch.setattr(writers, "_writers", dict(writers._writers))
+    assert {"siemens", "siemens_vb", "fsl", "mrtrix"} <= set(
+        writers.available_writers()
+    )
+    with pytest.raises(ValueError):
+        writers.get_writer("unknown")
+    with pytest.raises(ValueError):
+        writers.format_for("scheme.xyz")
+
+    def write_npy(tool, vectors, filename):
+        np.save(filename, vectors)
+        return [filename]
+
+    writers.register_writer("NPY", write_npy)
+    assert writers.parse_output("npy:out.npy") == ("npy", Path("out.npy"))
+    files = writers.export(BasicSiemensTool([1000], 6), [("npy", tmp_path / "v.npy")])
+    assert np.load(files[0]).shape == (6, 3)
+
+    writers.register_writer("fsl_alias", "freediffusiontoolkit.writers:write_fsl")
+    assert writers.get_writer("fsl_alias") is writers.write_fsl
+
+
+def test_run_with_exports(tmp_path):
+    run(
+        [
+            "run",
+            "0,1000",
+            "6",
+            "Siemens",
+            str(tmp_path / "scheme.dvs"),
+            f"--export=fsl:{tmp_path / 'scheme'}",
+        ]
+    )
+    assert (tmp_path / "scheme.dvs").is_file()
+    assert (tmp_path / "scheme.bval").is_file()
+    assert (tmp_path / "scheme.bvec").is_file()
+
+
+def test_vendor_handler_rejects_unknown_vendor():
+    with pytest.raises(ValueError):
+        vendor_handler("Philips", [0, 1000], 6)